@@ -115,6 +115,91 @@ except ValueError:
     raise EnvironmentError(f"{name} ('{tg_backups_chat_id_env}') {not_int_error}")
 
 
+# region Local database tuning
+
+# Telemetry write-behind buffer: rows per group commit, and maximum time (ms) a buffered row may wait
+telemetry_flush_rows_env = os.getenv("TELEMETRY_FLUSH_ROWS", "200")
+try:
+    telemetry_flush_rows: int = int(telemetry_flush_rows_env)
+except ValueError:
+    raise EnvironmentError(f"TELEMETRY_FLUSH_ROWS ('{telemetry_flush_rows_env}') {not_int_error}")
+
+telemetry_flush_ms_env = os.getenv("TELEMETRY_FLUSH_MS", "2000")
+try:
+    telemetry_flush_ms: int = int(telemetry_flush_ms_env)
+except ValueError:
+    raise EnvironmentError(f"TELEMETRY_FLUSH_MS ('{telemetry_flush_ms_env}') {not_int_error}")
+
+# Telemetry retention (days): raw and packed meter ticks, and per-minute rollups (per-hour rollups are kept)
+telemetry_retention_days_env = os.getenv("TELEMETRY_RETENTION_DAYS", "120")
+try:
+    telemetry_retention_days: int = int(telemetry_retention_days_env)
+except ValueError:
+    raise EnvironmentError(f"TELEMETRY_RETENTION_DAYS ('{telemetry_retention_days_env}') {not_int_error}")
+
+minute_rollup_retention_days_env = os.getenv("MINUTE_ROLLUP_RETENTION_DAYS", "730")
+try:
+    minute_rollup_retention_days: int = int(minute_rollup_retention_days_env)
+except ValueError:
+    raise EnvironmentError(f"MINUTE_ROLLUP_RETENTION_DAYS ('{minute_rollup_retention_days_env}') {not_int_error}")
+
+# endregion
+
+
+# region TagoIO outbound tuning
+
+# TagoIO dashboard outbound queue: interval (ms) between flushes, the latest value of each variable is sent
+dashboard_flush_ms_env = os.getenv("DASHBOARD_FLUSH_MS", "2000")
+try:
+    dashboard_flush_ms: int = int(dashboard_flush_ms_env)
+except ValueError:
+    raise EnvironmentError(f"DASHBOARD_FLUSH_MS ('{dashboard_flush_ms_env}') {not_int_error}")
+
+# TagoIO API rate limits, in requests per minute, for each Account-Token and each Device-Token
+# ? https://help.tago.io/portal/en/kb/articles/rate-limits
+tago_account_requests_per_minute_env = os.getenv("TAGO_ACCOUNT_REQUESTS_PER_MINUTE", "120")
+try:
+    tago_account_requests_per_minute: int = int(tago_account_requests_per_minute_env)
+except ValueError:
+    raise EnvironmentError(
+        f"TAGO_ACCOUNT_REQUESTS_PER_MINUTE ('{tago_account_requests_per_minute_env}') {not_int_error}"
+    )
+
+tago_device_requests_per_minute_env = os.getenv("TAGO_DEVICE_REQUESTS_PER_MINUTE", "120")
+try:
+    tago_device_requests_per_minute: int = int(tago_device_requests_per_minute_env)
+except ValueError:
+    raise EnvironmentError(f"TAGO_DEVICE_REQUESTS_PER_MINUTE ('{tago_device_requests_per_minute_env}') {not_int_error}")
+
+# TagoIO outbox: exponential backoff (ms) of the failed writes, half to all of base * 2^attempts, capped at max
+outbox_base_delay_ms_env = os.getenv("OUTBOX_BASE_DELAY_MS", "1000")
+try:
+    outbox_base_delay_ms: int = int(outbox_base_delay_ms_env)
+except ValueError:
+    raise EnvironmentError(f"OUTBOX_BASE_DELAY_MS ('{outbox_base_delay_ms_env}') {not_int_error}")
+
+outbox_max_delay_ms_env = os.getenv("OUTBOX_MAX_DELAY_MS", "300000")
+try:
+    outbox_max_delay_ms: int = int(outbox_max_delay_ms_env)
+except ValueError:
+    raise EnvironmentError(f"OUTBOX_MAX_DELAY_MS ('{outbox_max_delay_ms_env}') {not_int_error}")
+
+# TagoIO circuit breaker by pool: consecutive failures that open it, and seconds before a trial call (half-open)
+circuit_failure_threshold_env = os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")
+try:
+    circuit_failure_threshold: int = int(circuit_failure_threshold_env)
+except ValueError:
+    raise EnvironmentError(f"CIRCUIT_FAILURE_THRESHOLD ('{circuit_failure_threshold_env}') {not_int_error}")
+
+circuit_open_seconds_env = os.getenv("CIRCUIT_OPEN_SECONDS", "60")
+try:
+    circuit_open_seconds: int = int(circuit_open_seconds_env)
+except ValueError:
+    raise EnvironmentError(f"CIRCUIT_OPEN_SECONDS ('{circuit_open_seconds_env}') {not_int_error}")
+
+# endregion
+
+
 # Tokens for TagoIO Analysis workers:
 change_availability_token_env: Optional[str] = os.getenv("TAGO_CHANGE_AVAILABILITY_TOKEN")
 if change_availability_token_env is None:
@@ -1,30 +1,53 @@
+import asyncio
+import json
 from datetime import datetime, timedelta
+from time import time
 from typing import Optional
 
 from loguru import logger
+from pydantic import ValidationError
 
 from charge_points import get_pool_known_charge_points, register_charge_point, unregister_charge_point
+from database.async_database import async_database
 from database.query_database import (
-    ensure_station_profile_exists,
-    get_all_connector_statuses,
-    insert_charging_session_telemetry,
+    checkpoint_active_sessions_batch,
+    compact_session_telemetry,
+    delete_stale_active_sessions,
+    get_all_active_sessions,
+    get_all_station_profiles,
     insert_database_charging_session_history,
-    update_station_noc_if_needed,
-    upsert_connector_status,
+    iter_all_connector_statuses,
+    upsert_connector_statuses_batch,
+    upsert_station_profile,
 )
+from database.telemetry_buffer import telemetry_buffer
 from enumerations import ChargePointStatus, ChargingSessionStep
 from schemas.ocpp_csms import ChargePointData, ChargePointUpdate, ChargingSessionUpdate
-from tagoio.data_parsing import (
-    update_charge_point_status,
-    update_management_dashboard_charging_session,
-    update_public_dashboard_values,
-)
+from tagoio.data_parsing import restore_charge_point_status
+from tagoio.outbound_queue import queue_charge_point_status, queue_charging_session_dashboards
 
 # Data of the known charge points
-charge_points: dict[tuple, ChargePointData] = dict()
+charge_points: dict[tuple, ChargePointData] = {}
 
 # Active charging sessions, stored with a tuple key (pool_code, station_name, connector_id) for template rendering
-active_sessions: dict[tuple, ChargingSessionUpdate] = dict()
+active_sessions: dict[tuple, ChargingSessionUpdate] = {}
+
+# Keys of the active sessions changed (or finished) since the last checkpoint, only the latest state is stored
+dirty_sessions: set[tuple] = set()
+
+# Completed sessions whose history insert failed (e.g. a busy database), by transaction_id, retried by the
+# checkpoint loop. They are also kept in active_sessions, so the active_session checkpoint keeps them across restarts.
+pending_history_sessions: dict[int, ChargingSessionUpdate] = {}
+
+# Fields of ChargingSessionUpdate stored as columns of the active_session table, instead of in the payload
+session_key_fields: set[str] = {"pool_code", "station_name", "connector_id"}
+
+# Connector statuses as last stored in SQLite, and the keys whose status changed since then (checkpointed periodically)
+persisted_statuses: dict[tuple, str] = {}
+dirty_statuses: set[tuple] = set()
+
+# Number of connectors (NOC) by station_name, as stored in the station_config table
+station_nocs: dict[str, int] = {}
 
 
 def get_search_key(pool_code: int, station_name: str, connector_id: int = 1) -> tuple:
@@ -46,13 +69,15 @@ def get_active_session(pool_code: int, station_name: str, connector_id: int = 1)
 
 def load_statuses_from_db():
     """Used on startup to rehydrate the charge_points dictionary."""
-    rows = get_all_connector_statuses()
+    rows = iter_all_connector_statuses()
     for pool_code, station_name, connector_id, status in rows:
         search_key = get_search_key(pool_code, station_name, connector_id)
         # Register in the general known endpoints map
         register_charge_point(pool_code, station_name, connector_id)
 
-        # Populate in-memory dict
+        # Populate in-memory dicts, and the statuses known by the dashboards
+        persisted_statuses[search_key] = status
+        restore_charge_point_status(pool_code, station_name, connector_id, status)
         charge_points[search_key] = ChargePointData(
             pool_code=pool_code,
             station_name=station_name,
@@ -62,6 +87,59 @@ def load_statuses_from_db():
         )
 
 
+def load_active_sessions_from_db(max_age_hours: int = 24):
+    """Used on startup, after load_statuses_from_db, to rehydrate the active_sessions dictionary."""
+    delete_stale_active_sessions(max_age_hours)
+    for pool_code, station_name, connector_id, payload in get_all_active_sessions():
+        search_key = get_search_key(pool_code, station_name, connector_id)
+        try:
+            session_fields = {**json.loads(payload), "pool_code": pool_code, "station_name": station_name}
+            active_sessions[search_key] = ChargingSessionUpdate(**session_fields, connector_id=connector_id)
+        except (ValueError, ValidationError) as e:  # E.g. stored before a schema change
+            logger.warning(f"Skipping stored active session of {pool_code}/{station_name} [{connector_id}]: {e}")
+            dirty_sessions.add(search_key)  # Deleted on the next checkpoint
+            continue
+
+        session = active_sessions[search_key]
+        if session.time_band:  # Completed, but its history insert failed before the restart
+            pending_history_sessions[session.transaction_id] = session
+
+    if active_sessions:
+        logger.info(f"Rehydrated {len(active_sessions)} active charging sessions from SQLite.")
+
+
+def load_station_profiles_from_db():
+    """Used on startup to fill the station profile cache, answering NOC lookups in memory."""
+    for station_name, pool_code, noc in get_all_station_profiles():
+        station_nocs[station_name] = noc
+
+
+def get_station_noc(station_name: str) -> Optional[int]:
+    """Returns the number of connectors (NOC) of the station, if it is known"""
+    return station_nocs.get(station_name, None)
+
+
+async def ensure_station_profile(pool_code: int, station_name: str, connector_id: int):
+    """
+    Registers the station profile, inferring the NOC from the connector_id.
+    SQLite is only touched when the station is new or its NOC grows.
+    """
+    noc = max(1, connector_id)  # Connector 0 is the station itself
+    known_noc = station_nocs.get(station_name)
+    if known_noc is not None and noc <= known_noc:
+        return
+
+    result_ok: bool = await async_database.run_write(upsert_station_profile, pool_code, station_name, noc)
+    if not result_ok:
+        return
+
+    station_nocs[station_name] = max(noc, station_nocs.get(station_name, 0))
+    if known_noc is None:
+        logger.info(f"Registered new station {pool_code}/{station_name} with NOC {noc}.")
+    else:
+        logger.info(f"Updated station {pool_code}/{station_name} NOC from {known_noc} to {noc}.")
+
+
 async def manage_charge_point_update(update: ChargePointUpdate) -> ChargePointData:
     """Updates the dashboards with the charge point data, if conditions are met"""
 
@@ -84,8 +162,7 @@ async def manage_charge_point_update(update: ChargePointUpdate) -> ChargePointDa
     register_charge_point(*search_params)
 
     # Dynamically infer and update the noc based on the payload
-    ensure_station_profile_exists(update.pool_code, update.station_name)
-    update_station_noc_if_needed(update.pool_code, update.station_name, update.connector_id)
+    await ensure_station_profile(update.pool_code, update.station_name, update.connector_id)
 
     omitted_updates = 0  # When new_quarantine, the error status is sent
     if search_key in charge_points:
@@ -108,12 +185,12 @@ async def manage_charge_point_update(update: ChargePointUpdate) -> ChargePointDa
     )
     charge_points[search_key] = charge_point_data
 
-    # Save the status to local SQLite
-    upsert_connector_status(update.pool_code, update.station_name, update.connector_id, update.charge_point_status)
+    # Flag the status to be saved to local SQLite, only if it changed
+    mark_connector_status(search_key, update.charge_point_status)
 
-    # Update the TagoIO device for the charging pool that has the charge point
+    # Update the TagoIO device for the charging pool that has the charge point (queued, latest status wins)
     if not is_quarantined or new_quarantine:
-        await update_charge_point_status(update)
+        queue_charge_point_status(update)
 
     return charge_points[search_key]
 
@@ -165,18 +242,23 @@ async def manage_charging_session_update(update: ChargingSessionUpdate) -> None:
     search_key = get_search_key(update.pool_code, update.station_name, update.connector_id)
 
     # * Store high-frequency telemetry for the audit trail (XLSX export)
-    # Captures every meter tick during INPROGRESS, and the final tick at COMPLETED (INSERT OR IGNORE avoid duplicates).
+    # Captures every meter tick during INPROGRESS, and the final tick at COMPLETED (duplicated ticks are dropped).
+    # The ticks are group committed by the write-behind buffer, flushed right away once the session is completed,
+    # and then packed into a single blob per transaction (charging_session_telemetry_packed).
     if update.step in [ChargingSessionStep.INPROGRESS, ChargingSessionStep.COMPLETED]:
-        insert_charging_session_telemetry(update)
+        telemetry_buffer.add(update)
+        if update.step == ChargingSessionStep.COMPLETED:
+            await telemetry_buffer.flush()
+            telemetry_buffer.forget_transaction(update.transaction_id)
+            await async_database.run_write(compact_session_telemetry, update.transaction_id)
 
     if update.time_band:  # The session has ended, we can store it in the history and remove it from the active sessions
-        active_sessions.pop(search_key, None)
-
-        transaction_id = insert_database_charging_session_history(update)
-        if transaction_id is None:  # Likely a duplicate transaction_id insert attempt, skip setting the dashboards...
+        transaction_id = await store_completed_session(search_key, update)
+        if transaction_id is None:  # A duplicate, or a failed insert kept for a retry, skip setting the dashboards...
             return
     else:  # The session is active. We update it in memory for the HTMX dashboard.
         active_sessions[search_key] = update
+        dirty_sessions.add(search_key)
 
         # * If we receive metering data, the station is definitively engaged in a session.
         # Force the status to CHARGING if it's currently showing as available or preparing.
@@ -190,13 +272,48 @@ async def manage_charging_session_update(update: ChargingSessionUpdate) -> None:
             logger.info(f"{prefix} {update.pool_code}/{update.station_name} [{update.connector_id}]")
             cp_data.charge_point_status = ChargePointStatus.CHARGING
 
-            # Persist inferred status to SQLite so it survives hot-reloads
-            cp_status: str = ChargePointStatus.CHARGING.value
-            upsert_connector_status(update.pool_code, update.station_name, update.connector_id, cp_status)
+            # Persist inferred status to SQLite (on the next checkpoint) so it survives hot-reloads
+            mark_connector_status(search_key, ChargePointStatus.CHARGING.value)
+
+    # Update the TagoIO dashboard/s, through the coalescing outbound queue
+    await queue_charging_session_dashboards(update)
+
+
+async def store_completed_session(search_key: tuple, update: ChargingSessionUpdate) -> Optional[int]:
+    """
+    Stores a completed session in the history, and removes it from the active sessions. Returns None for a
+    duplicate, and also when the insert failed: then the session is kept, in pending_history_sessions and
+    in active_sessions (checkpointed), to be retried by retry_pending_history_sessions instead of being lost.
+    """
+    try:
+        transaction_id = await async_database.run_write(insert_database_charging_session_history, update)
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Keeping completed session {update.transaction_id} to retry its history insert: {e}")
+        pending_history_sessions[update.transaction_id] = update
+        active_sessions[search_key] = update
+        dirty_sessions.add(search_key)
+        return None
+
+    pending_history_sessions.pop(update.transaction_id, None)
+    active_session = active_sessions.get(search_key)
+    if active_session is not None and active_session.transaction_id == update.transaction_id:
+        del active_sessions[search_key]  # Not a newer session of the connector, started meanwhile
+        dirty_sessions.add(search_key)
+    return transaction_id
+
+
+async def retry_pending_history_sessions() -> int:
+    """Retries the history insert of the kept completed sessions, updating their dashboards once stored."""
+    stored_count: int = 0
+    for update in list(pending_history_sessions.values()):
+        search_key = get_search_key(update.pool_code, update.station_name, update.connector_id)
+        if await store_completed_session(search_key, update) is not None:
+            stored_count += 1
+            await queue_charging_session_dashboards(update)
 
-    # Update the TagoIO dashboard/s
-    await update_management_dashboard_charging_session(update)
-    await update_public_dashboard_values(update)
+    if stored_count:
+        logger.info(f"Stored {stored_count} completed sessions in the history, after a failed insert.")
+    return stored_count
 
 
 def remove_station_from_memory(pool_code: int, station_name: str):
@@ -211,3 +328,110 @@ def remove_station_from_memory(pool_code: int, station_name: str):
 
     for key in keys_to_delete:
         del charge_points[key]
+        persisted_statuses.pop(key, None)
+        dirty_statuses.discard(key)
+
+    # Forget its ongoing sessions, also in SQLite (on the next checkpoint)
+    for key in [key for key in active_sessions if key[0] == pool_code and key[1] == station_name]:
+        del active_sessions[key]
+        dirty_sessions.add(key)
+
+    station_nocs.pop(station_name, None)
+
+
+def mark_connector_status(search_key: tuple, status: str):
+    """Flags the connector status to be checkpointed, only if it differs from the one stored in SQLite."""
+    if persisted_statuses.get(search_key) == status:
+        dirty_statuses.discard(search_key)  # The connector flapped back to the stored status
+    else:
+        dirty_statuses.add(search_key)
+
+
+async def checkpoint_connector_statuses() -> int:
+    """Stores the changed connector statuses in a single transaction. Returns the number of stored rows."""
+    if not dirty_statuses:
+        return 0
+
+    rows: list[tuple[int, str, int, str]] = []
+    for search_key in dirty_statuses:
+        cp_data = charge_points.get(search_key)
+        if cp_data is not None:  # The station may have been removed meanwhile
+            rows.append((*search_key, cp_data.charge_point_status.value))
+    dirty_statuses.clear()
+
+    # The statuses being written count as stored during the write, so that a connector going back to its
+    # previously stored status meanwhile is flagged again, instead of being discarded by mark_connector_status
+    previous_statuses: dict[tuple, Optional[str]] = {}
+    for pool_code, station_name, connector_id, status in rows:
+        search_key = get_search_key(pool_code, station_name, connector_id)
+        previous_statuses[search_key] = persisted_statuses.get(search_key)
+        persisted_statuses[search_key] = status
+
+    result_ok: bool = await async_database.run_write(upsert_connector_statuses_batch, rows)
+    if not result_ok:  # Restore the stored statuses, and retry them on the next checkpoint
+        for search_key, previous_status in previous_statuses.items():
+            if search_key not in charge_points:  # The station was removed meanwhile
+                continue
+            if previous_status is None:
+                persisted_statuses.pop(search_key, None)
+            else:
+                persisted_statuses[search_key] = previous_status
+            mark_connector_status(search_key, charge_points[search_key].charge_point_status.value)
+        return 0
+
+    if rows:
+        logger.debug(f"Checkpointed {len(rows)} connector statuses to SQLite.")
+    return len(rows)
+
+
+def get_active_session_row(update: ChargingSessionUpdate) -> tuple[int, str, int, int, int, str]:
+    """Provides the compact active_session row of a session: the key, and the non-default fields as JSON."""
+    payload = update.model_dump_json(exclude=session_key_fields, exclude_defaults=True)
+    return (update.pool_code, update.station_name, update.connector_id, update.transaction_id, int(time()), payload)
+
+
+async def checkpoint_active_sessions() -> int:
+    """
+    Stores the latest state of the changed active sessions, and removes the finished ones, in a single
+    transaction. The meter ticks between checkpoints are coalesced. Returns the number of stored changes.
+    """
+    if not dirty_sessions:
+        return 0
+
+    search_keys = list(dirty_sessions)
+    dirty_sessions.clear()
+    upsert_rows, deleted_keys = [], []
+    for search_key in search_keys:
+        update = active_sessions.get(search_key)
+        if update is None:
+            deleted_keys.append(search_key)
+        else:
+            upsert_rows.append(get_active_session_row(update))
+
+    result_ok: bool = await async_database.run_write(checkpoint_active_sessions_batch, upsert_rows, deleted_keys)
+    if not result_ok:  # Retry them on the next checkpoint
+        dirty_sessions.update(search_keys)
+        return 0
+
+    logger.debug(f"Checkpointed {len(upsert_rows)} active sessions ({len(deleted_keys)} removed) to SQLite.")
+    return len(search_keys)
+
+
+async def run_status_checkpoint_loop(interval_seconds: int = 30):
+    """Retries the failed history inserts, and checkpoints the changed statuses and active sessions, periodically."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await retry_pending_history_sessions()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Error retrying the pending session history inserts: {e}")
+
+        try:
+            await checkpoint_connector_statuses()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Error checkpointing connector statuses: {e}")
+
+        try:
+            await checkpoint_active_sessions()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Error checkpointing active sessions: {e}")
@@ -0,0 +1,103 @@
+"""
+Async facade over the synchronous query_database functions, so that a slow
+fsync or a lock wait never stalls the event loop (SSE streams, analysis
+workers, HTMX polls). A single writer thread owns the write connection and
+executes the queued write commands in order, while a small pool of reader
+threads serves SELECT queries concurrently (WAL journal mode).
+"""
+
+import asyncio
+import queue
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Optional
+
+from loguru import logger
+
+
+def set_future_result(future: asyncio.Future, result: Any):
+    """Resolves the future of a write command, unless the awaiting caller gave up."""
+    if not future.done():
+        future.set_result(result)
+
+
+def set_future_exception(future: asyncio.Future, exception: BaseException):
+    """Fails the future of a write command, unless the awaiting caller gave up."""
+    if not future.done():
+        future.set_exception(exception)
+
+
+class AsyncDatabase:
+    def __init__(self, reader_count: int = 4):
+        self.reader_count = reader_count
+        self.write_queue: queue.Queue = queue.Queue()
+        self.writer_thread: Optional[threading.Thread] = None
+        self.reader_pool: Optional[ThreadPoolExecutor] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the writer thread and the reader pool, if not already running."""
+        with self._start_lock:
+            if self.writer_thread is not None and self.writer_thread.is_alive():
+                return
+
+            self.writer_thread = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+            self.writer_thread.start()
+            self.reader_pool = ThreadPoolExecutor(max_workers=self.reader_count, thread_name_prefix="sqlite-reader")
+            logger.info(f"SQLite writer thread and {self.reader_count} reader threads started.")
+
+    def _writer_loop(self):
+        """Executes the queued write commands one by one, until the None sentinel is received."""
+        while True:
+            command = self.write_queue.get()
+            if command is None:
+                break
+
+            func, args, kwargs, future, loop = command
+            try:
+                callback, outcome = set_future_result, func(*args, **kwargs)
+            except Exception as e:  # noqa: BLE001
+                callback, outcome = set_future_exception, e
+
+            try:
+                loop.call_soon_threadsafe(callback, future, outcome)
+            except RuntimeError:  # The event loop of the caller is already closed
+                logger.warning(f"Discarding the result of {func.__name__}, its event loop is closed.")
+
+    async def run_write(self, func: Callable, *args, **kwargs) -> Any:
+        """Queues a write function (from query_database) for the writer thread and awaits its result."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.write_queue.put((func, args, kwargs, future, loop))
+        return await future
+
+    async def run_read(self, func: Callable, *args, **kwargs) -> Any:
+        """Runs a read function (from query_database) in the reader pool and awaits its result."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.reader_pool, partial(func, *args, **kwargs))
+
+    def get_write_queue_size(self) -> int:
+        """Provides the number of write commands waiting for the writer thread."""
+        return self.write_queue.qsize()
+
+    def stop(self):
+        """Lets the writer thread finish the queued commands, and shuts down the reader pool."""
+        with self._start_lock:
+            if self.writer_thread is not None:
+                self.write_queue.put(None)
+                self.writer_thread.join()
+                self.writer_thread = None
+
+            if self.reader_pool is not None:
+                self.reader_pool.shutdown(wait=True)
+                self.reader_pool = None
+
+        logger.info("SQLite writer thread and reader pool stopped.")
+
+
+# Global singleton instance, to be imported by the async callers
+async_database = AsyncDatabase()
@@ -0,0 +1,115 @@
+"""
+Long-lived SQLite connections for the query layer. Each thread keeps its own
+connection per database file, so the connect/close overhead and the PRAGMA
+setup are paid once, and the sqlite3 statement cache is actually reused.
+The connections live in thread-local storage, and are closed when their
+thread exits (e.g. an idle worker thread of a pool).
+"""
+
+import sqlite3
+import threading
+import weakref
+
+from loguru import logger
+
+from database import database_file
+
+# Connection-level PRAGMAs, applied once when a thread opens its connection
+connection_pragmas: dict[str, str] = {
+    "synchronous": "NORMAL",  # Durable enough under WAL, avoids an fsync per commit
+    "cache_size": "-16000",  # Negative value means KiB: ~16 MB page cache per connection
+    "mmap_size": "67108864",  # 64 MB of memory-mapped I/O for reads
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+    "busy_timeout": "5000",  # Wait for the write lock instead of failing instantly
+}
+
+# Number of prepared statements kept by each connection (sqlite3 default is 128)
+statement_cache_size: int = 256
+
+# ? Every open connection by (thread identifier, database file), to close them all at shutdown
+open_connections: dict[tuple[int, str], sqlite3.Connection] = {}
+open_connections_lock = threading.Lock()
+
+# Connections of the calling thread, released with its thread-local storage when the thread exits
+thread_state = threading.local()
+
+
+class ThreadConnections:
+    """Connections of a thread by database file, closed by a finalizer once the thread exits."""
+
+    def __init__(self):
+        self.connections: dict[str, sqlite3.Connection] = {}
+        weakref.finalize(self, close_thread_connections, threading.get_ident(), self.connections)
+
+
+def close_thread_connections(thread_ident: int, connections: dict[str, sqlite3.Connection]):
+    """Closes the connections of an exited thread (or of the calling one), unless already closed."""
+    for db_file, conn in list(connections.items()):
+        with open_connections_lock:
+            if open_connections.get((thread_ident, db_file)) is not conn:
+                continue  # Closed by close_all_connections
+            del open_connections[(thread_ident, db_file)]
+
+        try:
+            conn.close()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Exception closing SQLite connection: {e}")
+    connections.clear()
+
+
+def open_connection(db_file: str = database_file) -> sqlite3.Connection:
+    """Opens a new connection and applies the connection-level PRAGMAs."""
+    # ! check_same_thread=False allows close_all_connections, and the finalizer of an exited thread, to close it
+    conn = sqlite3.connect(db_file, cached_statements=statement_cache_size, check_same_thread=False)
+    for pragma_name, pragma_value in connection_pragmas.items():
+        conn.execute(f"PRAGMA {pragma_name} = {pragma_value};")
+
+    return conn
+
+
+def get_connection(db_file: str = database_file) -> sqlite3.Connection:
+    """
+    Returns the connection of the calling thread for the given database file,
+    opening it on first use. Usable as a context manager like sqlite3.connect:
+    the transaction is committed on success or rolled back on exception, but
+    the connection stays open until the thread exits.
+    """
+    thread_connections = getattr(thread_state, "connections", None)
+    if thread_connections is None:
+        thread_connections = thread_state.connections = ThreadConnections()
+
+    search_key = (threading.get_ident(), db_file)
+    conn = thread_connections.connections.get(db_file)
+    with open_connections_lock:
+        if conn is None or open_connections.get(search_key) is not conn:  # New, or closed by close_all_connections
+            conn = open_connection(db_file)
+            thread_connections.connections[db_file] = conn
+            open_connections[search_key] = conn
+            logger.debug(f"Opened SQLite connection to {db_file} ({len(open_connections)} open)")
+
+    return conn
+
+
+def close_connection(db_file: str = database_file):
+    """Closes the connection of the calling thread, if any."""
+    thread_connections = getattr(thread_state, "connections", None)
+    if thread_connections is None or db_file not in thread_connections.connections:
+        return
+
+    close_thread_connections(threading.get_ident(), {db_file: thread_connections.connections.pop(db_file)})
+
+
+def close_all_connections():
+    """Closes every connection opened by any thread (used at shutdown)."""
+    with open_connections_lock:
+        connections = list(open_connections.values())
+        open_connections.clear()
+
+    for conn in connections:
+        try:
+            conn.close()
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Exception closing SQLite connection: {e}")
+
+    logger.info(f"Closed {len(connections)} SQLite connections.")
@@ -1,57 +1,133 @@
+import os
 import sqlite3
+import threading
+from contextlib import closing
 from datetime import datetime
-from loguru import logger
-from typing import Optional
+from time import perf_counter
+from typing import Any, Optional
 from zipfile import ZipFile
 
+from loguru import logger
+
 from config import service_name
-from database import database_file, backup_file
-from database.database_check import insert_modified_column
+from database import backup_file, database_file
+from database.database_check import check_change_counter_table
 from database.query_database import get_modified_rows_count
 
 service_prefix: str = service_name.lower().replace(" ", "_") + "_"
 
+backup_lock = threading.Lock()
+# Size, duration and compression ratio of the last database backup
+last_backup_stats: dict[str, Any] = {}
+
+
+class BackupRestartsExceeded(Exception):
+    """Raised from the backup progress callback, to stop a stepped backup that keeps restarting."""
+
+
+class BackupProgress:
+    """
+    Progress callback of the online backup: counts its steps, and its restarts (the remaining pages
+    stop decreasing when a write by another connection restarts the copy). Raises BackupRestartsExceeded
+    after max_restarts.
+    """
+
+    def __init__(self, max_restarts: int = 3):
+        self.max_restarts = max_restarts
+        self.steps: int = 0
+        self.restarts: int = 0
+        self.last_remaining: Optional[int] = None
+
+    def __call__(self, status: int, remaining: int, total: int):
+        self.steps += 1
+        if self.last_remaining is not None and remaining >= self.last_remaining:
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                raise BackupRestartsExceeded()
+        self.last_remaining = remaining
+
 
 def zip_database_file(
     db_file: str = database_file,
     dest_file: str = backup_file,
     zip_params: dict = {"mode": "w", "compression": 8, "compresslevel": 8},
+    backup_pages: int = 2048,
+    backup_sleep: float = 0.005,
+    chunk_size: int = 1024 * 1024,
+    max_backup_restarts: int = 3,
 ) -> Optional[str]:
-    "Zips the database file and returns the path of the compressed file."
+    """
+    Zips a consistent snapshot of the database file and returns the path of the compressed file.
+    The snapshot is taken with the SQLite online backup API, backup_pages at a time, sleeping
+    backup_sleep seconds between steps so the writers are not blocked. A write by another connection
+    restarts a stepped backup: after max_backup_restarts, it is copied in a single step instead, so
+    that it always ends. It is then streamed in chunks into the zip entry and removed.
+    Must be called from a worker thread, not the event loop.
+    """
     dt_now: str = datetime.now().strftime("%Y-%m-%d_%H.%M.%S")
     db_folder, db_file_name = dest_file.split("/")
     backup_file_name: str = db_folder + "/" + service_prefix + db_file_name
     backup_file_name = backup_file_name.split(".")[0] + "_" + dt_now
     archive_file_name: str = backup_file_name.split("/")[1]
 
-    try:
-        # Using SQLite online backup API to backup the database
-        # ? Reference: https://docs.python.org/3/library/sqlite3.html
-        with sqlite3.connect(db_file) as original:
-            with sqlite3.connect(dest_file) as backup:
-                original.backup(backup)
+    backup_progress = BackupProgress(max_backup_restarts)
+
+    with backup_lock:  # The scheduled and the user triggered backups share dest_file
+        try:
+            # Using SQLite online backup API to backup the database
+            # ? Reference: https://docs.python.org/3/library/sqlite3.html
+            start_time = perf_counter()
+            with closing(sqlite3.connect(db_file)) as original, closing(sqlite3.connect(dest_file)) as backup:
+                try:
+                    original.backup(backup, pages=backup_pages, progress=backup_progress, sleep=backup_sleep)
+                except BackupRestartsExceeded:
+                    restarts = backup_progress.restarts
+                    logger.warning(f"Database backup restarted {restarts} times, copying it in a single step.")
+                    original.backup(backup, pages=-1)
+            snapshot_seconds = perf_counter() - start_time
+
+            logger.info(f"Compressing database file {backup_file_name}.zip ...")
+            with ZipFile(backup_file_name + ".zip", **zip_params) as zip_file:
+                with open(dest_file, "rb") as snapshot, zip_file.open(archive_file_name + ".sqlite3", "w") as entry:
+                    while chunk := snapshot.read(chunk_size):
+                        entry.write(chunk)
+            compress_seconds = perf_counter() - start_time - snapshot_seconds
 
-        logger.info(f"Compressing database file {backup_file_name}.zip ...")
-        with ZipFile(backup_file_name + ".zip", **zip_params) as zip_file:
-            zip_file.write(db_file, archive_file_name + ".sqlite3")
+            database_size = os.path.getsize(dest_file)
+            archive_size = os.path.getsize(backup_file_name + ".zip")
+            last_backup_stats.clear()  # Updated in place, as it is imported by the routes
+            last_backup_stats.update(
+                {
+                    "file": backup_file_name + ".zip",
+                    "database_bytes": database_size,
+                    "archive_bytes": archive_size,
+                    "compression_ratio": round(database_size / archive_size, 2) if archive_size else 0.0,
+                    "backup_steps": backup_progress.steps,
+                    "backup_restarts": backup_progress.restarts,
+                    "snapshot_seconds": round(snapshot_seconds, 3),
+                    "compress_seconds": round(compress_seconds, 3),
+                }
+            )
+            logger.info(f"Database backup stats: {last_backup_stats}")
             return backup_file_name + ".zip"
-    except Exception as e:
-        logger.error(f"Exception during zip_database_file: {e}")
-        return None
+        except Exception as e:
+            logger.error(f"Exception during zip_database_file: {e}")
+            return None
+        finally:
+            if os.path.exists(dest_file):
+                os.remove(dest_file)
 
 
-def get_all_modified_rows_count(table_names: list, db_file: str = database_file) -> int:
-    "Returns the count of modified rows in the specified table(s)."
-    modified_rows_count: int = 0
+def get_all_modified_rows_count(table_names: list, db_file: str = database_file) -> dict[str, int]:
+    "Returns the count of changed rows since the last backup, by table name (O(1) per table)."
+    modified_rows_count: dict[str, int] = {}
     for table_name in table_names:
         actual_modified_count = get_modified_rows_count(table_name, db_file)
         if actual_modified_count is None:
-            modified_rows_count += 1
-            # Handle the missing modified column in a previous version of the database:
-            result_ok = insert_modified_column(table_name, db_file)
-            if not result_ok:
-                logger.error(f"Error inserting modified column in {table_name}.")
+            modified_rows_count[table_name] = 1
+            # Handle the missing change counter in a previous version of the database:
+            check_change_counter_table(db_file, [table_name])
         else:
-            modified_rows_count += actual_modified_count
+            modified_rows_count[table_name] = actual_modified_count
 
     return modified_rows_count
@@ -1,8 +1,15 @@
 import sqlite3
+from functools import partial
+from time import sleep
+from typing import Optional
 
 from loguru import logger
 
-from database import database_file
+from database import database_file, table_names_to_modified_check
+from database.schema_migrations import Migration, get_schema_version, run_migrations
+from database.session_dates import get_session_epochs
+from database.telemetry_packing import get_tick_row
+from database.telemetry_rollups import rollup_tables
 
 # ruff: noqa: BLE001
 
@@ -61,33 +68,75 @@ def alter_table_add_column(table_name: str, column_name: str, db_file: str = dat
         return False
 
 
-def clear_modified_column(table_name: str, db_file: str = database_file) -> bool:
-    """Clears the modified flag in the specified table (after a backup)."""
-    query = f"UPDATE {table_name} SET is_modified = 0;"
+def clear_change_counter(
+    table_name: str, backed_up_changes: Optional[int] = None, db_file: str = database_file
+) -> bool:
+    """
+    Clears the change counter of the specified table (after a backup), with a single-row update.
+    If backed_up_changes is given, only those are subtracted, keeping the changes made during the backup.
+    """
+    if backed_up_changes is None:
+        query, params = "UPDATE change_counter SET change_count = 0 WHERE table_name = ?;", (table_name,)
+    else:
+        query = "UPDATE change_counter SET change_count = MAX(0, change_count - ?) WHERE table_name = ?;"
+        params = (backed_up_changes, table_name)
+
     try:
         with sqlite3.connect(db_file) as conn:
-            conn.execute(query)
+            conn.execute(query, params)
             conn.commit()
             return True
     except Exception as e:
-        logger.error(f"Exception during clear_modified_column in {table_name}: {e}")
+        logger.error(f"Exception during clear_change_counter in {table_name}: {e}")
         return False
 
 
-def check_local_database(db_file: str = database_file):
-    """Checks if all the used tables exist in the database or creates new ones."""
-    check_pragma_statements(db_file)
-    check_tagoio_device_table(db_file)
-    check_station_config_table(db_file)
-    check_charging_session_history_table(db_file)
-    check_charging_session_telemetry_table(db_file)
-    # check_table_has_column("charging_session_history", "transaction_id", db_file)
-    check_session_history_table_index(db_file)
-    check_connector_status_table(db_file)
+def create_change_counters(conn: sqlite3.Connection, table_names: list[str] = table_names_to_modified_check):
+    """
+    Creates the change_counter table and the triggers that count the inserted, updated and deleted rows
+    of each tracked table, if missing. A new counter starts with the is_modified rows of its table.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS change_counter(
+        table_name TEXT PRIMARY KEY,
+        change_count INTEGER NOT NULL DEFAULT 0
+    );
+    """
+    trigger_query = """
+    CREATE TRIGGER IF NOT EXISTS trg_{table_name}_{event}_count AFTER {event} ON {table_name}
+    BEGIN
+        UPDATE change_counter SET change_count = change_count + 1 WHERE table_name = '{table_name}';
+    END;
+    """
+    seed_query = """
+    INSERT OR IGNORE INTO change_counter (table_name, change_count)
+    SELECT ?, COUNT(*) FROM {table_name} WHERE is_modified = 1;
+    """
+    fallback_seed_query = "INSERT OR IGNORE INTO change_counter (table_name, change_count) VALUES (?, 1);"
+    conn.execute(create_table_query)
+    for table_name in table_names:
+        try:
+            seeded = conn.execute(seed_query.format(table_name=table_name), (table_name,)).rowcount > 0
+        except sqlite3.OperationalError:  # No is_modified column, in a previous version of the database
+            seeded = conn.execute(fallback_seed_query, (table_name,)).rowcount > 0
+        if seeded:
+            logger.info(f"Database Migration: Created the change counter of {table_name}.")
+        for event in ["INSERT", "UPDATE", "DELETE"]:
+            conn.execute(trigger_query.format(table_name=table_name, event=event))
+
+
+def check_change_counter_table(db_file: str = database_file, table_names: list[str] = table_names_to_modified_check):
+    """Checks if the change counters of the tracked tables exist, or creates them (see create_change_counters)."""
+    try:
+        with sqlite3.connect(db_file) as conn:
+            create_change_counters(conn, table_names)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Exception during check_change_counter_table: {e}")
 
 
-def check_tagoio_device_table(db_file: str = database_file):
-    """Checks if the table exists in the database or creates a new one."""
+def create_tagoio_device_table(conn: sqlite3.Connection):
+    """Creates the TagoIO device table, if missing."""
     create_table_query = """
     CREATE TABLE IF NOT EXISTS tagoio_device(
         pool_code INTEGER NOT NULL PRIMARY KEY,
@@ -96,15 +145,11 @@ def check_tagoio_device_table(db_file: str = database_file):
         is_modified INTEGER NOT NULL DEFAULT 1
         );
     """
-    try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(create_table_query)
-    except Exception as e:
-        logger.error(f"Exception during check_tagoio_device_table: {e}")
+    conn.execute(create_table_query)
 
 
-def check_station_config_table(db_file: str = database_file):
-    """Checks if the station configuration table exists or creates a new one."""
+def create_station_config_table(conn: sqlite3.Connection):
+    """Creates the station configuration table, if missing."""
     create_table_query = """
     CREATE TABLE IF NOT EXISTS station_config(
         station_name TEXT NOT NULL PRIMARY KEY,
@@ -113,17 +158,13 @@ def check_station_config_table(db_file: str = database_file):
         is_modified INTEGER NOT NULL DEFAULT 1
     );
     """
-    try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(create_table_query)
-    except Exception as e:
-        logger.error(f"Exception during check_station_config_table: {e}")
+    conn.execute(create_table_query)
 
 
-def check_charging_session_history_table(db_file: str = database_file):
+def create_charging_session_history_table(conn: sqlite3.Connection):
     """
-    Ensures the charging_session_history table exists and automatically
-    migrates the schema to add any missing columns.
+    Ensures the charging_session_history table exists and migrates the schema
+    to add any missing columns (databases created before the versioned migrations).
     """
 
     # 1. Base creation query
@@ -161,28 +202,114 @@ def check_charging_session_history_table(db_file: str = database_file):
         "energy_peak": "INTEGER NOT NULL DEFAULT 0",
     }
 
-    try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(create_table_query)  # Create the table if it does not exist at all
+    conn.execute(create_table_query)  # Create the table if it does not exist at all
 
-            # Retrieve the current list of columns in the table
-            cursor = conn.execute("PRAGMA table_info(charging_session_history)")
-            existing_columns = [row[1] for row in cursor.fetchall()]
+    # Retrieve the current list of columns in the table
+    cursor = conn.execute("PRAGMA table_info(charging_session_history)")
+    existing_columns = [row[1] for row in cursor.fetchall()]
 
-            # Iterate through our required new columns and append them if missing
-            for col_name, col_definition in columns_to_ensure.items():
-                if col_name not in existing_columns:
-                    alter_query = f"ALTER TABLE charging_session_history ADD COLUMN {col_name} {col_definition};"
-                    conn.execute(alter_query)
-                    logger.info(f"Database Migration: Added missing column '{col_name}' to charging_session_history.")
+    # Iterate through our required new columns and append them if missing
+    for col_name, col_definition in columns_to_ensure.items():
+        if col_name not in existing_columns:
+            alter_query = f"ALTER TABLE charging_session_history ADD COLUMN {col_name} {col_definition};"
+            conn.execute(alter_query)
+            logger.info(f"Database Migration: Added missing column '{col_name}' to charging_session_history.")
 
-            conn.commit()
-    except Exception as e:
-        logger.error(f"Exception during check_charging_session_history_table: {e}")
+
+# ? Session day as YYYY-MM-DD, from the DD/MM/YYYY start_date of a charging_session_history row
+stats_day_expression: str = (
+    "substr(start_date, 7, 4) || '-' || substr(start_date, 4, 2) || '-' || substr(start_date, 1, 2)"
+)
 
 
-def check_charging_session_telemetry_table(db_file: str = database_file):
-    """Checks if the table exists in the database or creates a new one."""
+def create_daily_pool_stats_table(conn: sqlite3.Connection):
+    """
+    Creates the daily_pool_stats table, if missing, filled from the existing
+    charging_session_history rows. Afterwards, it is updated by insert_database_charging_session_history.
+    """
+    create_table_query = """
+    CREATE TABLE daily_pool_stats(
+        pool_code INTEGER NOT NULL,
+        station_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        energy_total INTEGER NOT NULL DEFAULT 0,
+        energy_off_peak INTEGER NOT NULL DEFAULT 0,
+        energy_flat INTEGER NOT NULL DEFAULT 0,
+        energy_peak INTEGER NOT NULL DEFAULT 0,
+        cost REAL NOT NULL DEFAULT 0.0,
+        PRIMARY KEY (pool_code, station_name, day)
+    ) WITHOUT ROWID;
+    """
+    backfill_query = f"""
+    INSERT INTO daily_pool_stats
+    (pool_code, station_name, day, session_count, energy_total, energy_off_peak, energy_flat, energy_peak, cost)
+    SELECT pool_code, station_name, {stats_day_expression}, COUNT(*), SUM(last_meter_value - start_meter_value),
+        SUM(energy_off_peak), SUM(energy_flat), SUM(energy_peak), SUM(cost)
+    FROM charging_session_history
+    GROUP BY pool_code, station_name, {stats_day_expression};
+    """
+    check_table_query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_pool_stats';"
+    if conn.execute(check_table_query).fetchone() is not None:
+        return
+
+    conn.execute(create_table_query)
+    backfilled_days = conn.execute(backfill_query).rowcount
+    logger.info(f"Database Migration: Created daily_pool_stats with {backfilled_days} station days.")
+
+
+def create_session_search_table(conn: sqlite3.Connection):
+    """
+    Creates the charging_session_search FTS5 table (trigram tokenizer, so any fragment of 3 or more
+    characters matches) over the searchable history columns, and its sync triggers, if missing.
+    A new table is filled from the existing charging_session_history rows.
+    """
+    create_table_query = """
+    CREATE VIRTUAL TABLE charging_session_search USING fts5(
+        transaction_id, station_name, card_alias,
+        content = 'charging_session_history', content_rowid = 'rowid', tokenize = 'trigram'
+    );
+    """
+    # ? External content table: the triggers mirror each change of the history table in the index
+    trigger_queries = [
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_charging_session_search_insert AFTER INSERT ON charging_session_history
+        BEGIN
+            INSERT INTO charging_session_search (rowid, transaction_id, station_name, card_alias)
+            VALUES (new.rowid, new.transaction_id, new.station_name, new.card_alias);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_charging_session_search_delete AFTER DELETE ON charging_session_history
+        BEGIN
+            INSERT INTO charging_session_search (charging_session_search, rowid, transaction_id, station_name, card_alias)
+            VALUES ('delete', old.rowid, old.transaction_id, old.station_name, old.card_alias);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_charging_session_search_update
+        AFTER UPDATE OF transaction_id, station_name, card_alias ON charging_session_history
+        BEGIN
+            INSERT INTO charging_session_search (charging_session_search, rowid, transaction_id, station_name, card_alias)
+            VALUES ('delete', old.rowid, old.transaction_id, old.station_name, old.card_alias);
+            INSERT INTO charging_session_search (rowid, transaction_id, station_name, card_alias)
+            VALUES (new.rowid, new.transaction_id, new.station_name, new.card_alias);
+        END;
+        """,
+    ]
+    rebuild_query = "INSERT INTO charging_session_search (charging_session_search) VALUES ('rebuild');"
+    check_table_query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'charging_session_search';"
+    if conn.execute(check_table_query).fetchone() is None:
+        conn.execute(create_table_query)
+        conn.execute(rebuild_query)
+        logger.info("Database Migration: Created the charging_session_search full-text index.")
+
+    for trigger_query in trigger_queries:
+        conn.execute(trigger_query)
+
+
+def create_charging_session_telemetry_table(conn: sqlite3.Connection):
+    """Creates the charging session telemetry table, if missing."""
     create_table_query = """
     CREATE TABLE IF NOT EXISTS charging_session_telemetry(
         transaction_id INTEGER NOT NULL,
@@ -197,16 +324,184 @@ def check_charging_session_telemetry_table(db_file: str = database_file):
         PRIMARY KEY (transaction_id, timestamp)
     );
     """
+    conn.execute(create_table_query)
+
+
+def create_charging_session_telemetry_tick_table(conn: sqlite3.Connection):
+    """
+    Creates the compact telemetry table of the ongoing sessions, if missing: clustered by
+    (transaction_id, epoch_ms), without a rowid, and with an integer tariff band code.
+    It replaces charging_session_telemetry, dropped here if empty, or by move_legacy_telemetry.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS charging_session_telemetry_tick(
+        transaction_id INTEGER NOT NULL,
+        epoch_ms INTEGER NOT NULL,
+        meter_value INTEGER NOT NULL,
+        power INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        band_code INTEGER NOT NULL,
+        energy_off_peak INTEGER NOT NULL DEFAULT 0,
+        energy_flat INTEGER NOT NULL DEFAULT 0,
+        energy_peak INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (transaction_id, epoch_ms)
+    ) WITHOUT ROWID;
+    """
+    # delete_database_cs_telemetry retention DELETE, by epoch
+    create_index_query = (
+        "CREATE INDEX IF NOT EXISTS idx_cs_telemetry_tick_epoch ON charging_session_telemetry_tick (epoch_ms);"
+    )
+    conn.execute(create_table_query)
+    conn.execute(create_index_query)
+    if conn.execute("SELECT 1 FROM charging_session_telemetry LIMIT 1;").fetchone() is None:
+        conn.execute("DROP TABLE charging_session_telemetry;")
+
+
+def move_legacy_telemetry(db_file: str = database_file, batch_size: int = 5000, pause_seconds: float = 0.05) -> int:
+    """
+    Online migration of the rows left in the legacy charging_session_telemetry table to
+    charging_session_telemetry_tick, in bounded rowid-range chunks, each in its own short
+    transaction, so the writers are not blocked. The empty legacy table is dropped at the end.
+    The reads merge the legacy rows meanwhile. Returns the number of moved rows.
+    """
+    check_table_query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'charging_session_telemetry';"
+    range_query = "SELECT MIN(rowid), MAX(rowid) FROM charging_session_telemetry;"
+    select_query = """
+        SELECT transaction_id, timestamp, meter_value, power, cost, current_tariff_band,
+            energy_off_peak, energy_flat, energy_peak
+        FROM charging_session_telemetry WHERE rowid >= ? AND rowid < ?;
+    """
+    insert_query = """
+        INSERT OR IGNORE INTO charging_session_telemetry_tick
+        (transaction_id, epoch_ms, meter_value, power, cost, band_code, energy_off_peak, energy_flat, energy_peak)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    delete_query = "DELETE FROM charging_session_telemetry WHERE rowid >= ? AND rowid < ?;"
+
+    moved_count: int = 0
     try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(create_table_query)
+        conn = sqlite3.connect(db_file, timeout=30)
+        try:
+            if conn.execute(check_table_query).fetchone() is None:
+                return 0
+
+            min_rowid, max_rowid = conn.execute(range_query).fetchone()
+            if min_rowid is not None:
+                logger.info(f"Database Migration: Moving up to {max_rowid - min_rowid + 1} legacy telemetry rows...")
+                for chunk_start in range(min_rowid, max_rowid + 1, batch_size):
+                    with conn:  # One short transaction per chunk
+                        rows = conn.execute(select_query, (chunk_start, chunk_start + batch_size)).fetchall()
+                        conn.executemany(insert_query, [get_tick_row(row) for row in rows])
+                        conn.execute(delete_query, (chunk_start, chunk_start + batch_size))
+                    moved_count += len(rows)
+                    sleep(pause_seconds)  # Yield the write lock to the other writers
+
+            with conn:
+                if conn.execute("SELECT 1 FROM charging_session_telemetry LIMIT 1;").fetchone() is None:
+                    conn.execute("DROP TABLE charging_session_telemetry;")
+            logger.info(f"Database Migration: Moved {moved_count} rows to charging_session_telemetry_tick.")
+            return moved_count
+        finally:
+            conn.close()
     except Exception as e:
-        logger.error(f"Exception during check_charging_session_telemetry_table: {e}")
+        logger.error(f"Exception during move_legacy_telemetry: {e}")
+        return moved_count
+
+
+def add_session_epoch_columns(conn: sqlite3.Connection):
+    """
+    Adds the start_ts and end_ts epoch columns (see session_dates) to charging_session_history.
+    New sessions fill them on insert, and the existing ones are filled online by backfill_session_epochs
+    (NULL meanwhile). Their indexes are built by the background query index steps.
+    """
+    cursor = conn.execute("PRAGMA table_info(charging_session_history)")
+    existing_columns = [row[1] for row in cursor.fetchall()]
+    for col_name in ["start_ts", "end_ts"]:
+        if col_name not in existing_columns:
+            conn.execute(f"ALTER TABLE charging_session_history ADD COLUMN {col_name} INTEGER;")
+
+
+def backfill_session_epochs(db_file: str = database_file, batch_size: int = 1000, pause_seconds: float = 0.05) -> int:
+    """
+    Online fill of the start_ts and end_ts columns of the charging_session_history rows inserted
+    before add_session_epoch_columns, in rowid-ordered chunks, each in its own short transaction.
+    Rows with unparseable dates are left NULL. Returns the number of filled rows.
+    """
+    select_query = """
+        SELECT rowid, start_date, time_band FROM charging_session_history
+        WHERE start_ts IS NULL AND rowid > ? ORDER BY rowid LIMIT ?;
+    """
+    update_query = "UPDATE charging_session_history SET start_ts = ?, end_ts = ? WHERE rowid = ?;"
+
+    filled_count, last_rowid = 0, 0
+    try:
+        conn = sqlite3.connect(db_file, timeout=30)
+        try:
+            while True:
+                with conn:  # One short transaction per chunk
+                    rows = conn.execute(select_query, (last_rowid, batch_size)).fetchall()
+                    values = [
+                        (*get_session_epochs(start_date, time_band), rowid) for rowid, start_date, time_band in rows
+                    ]
+                    conn.executemany(update_query, [row for row in values if row[0] is not None])
+                filled_count += sum(1 for row in values if row[0] is not None)
+                if len(rows) < batch_size:
+                    break
+
+                last_rowid = rows[-1][0]
+                sleep(pause_seconds)  # Yield the write lock to the other writers
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"Exception during backfill_session_epochs: {e}")
+        return filled_count
+
+    if filled_count:
+        logger.info(f"Database Migration: Filled the start and end epochs of {filled_count} history rows.")
+    return filled_count
+
+
+def create_charging_session_telemetry_packed_table(conn: sqlite3.Connection):
+    """Creates the packed telemetry table (one row per compacted session), if missing."""
+    # ? One row per completed charging session, payload built by database.telemetry_packing
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS charging_session_telemetry_packed(
+        transaction_id INTEGER PRIMARY KEY,
+        start_epoch_ms INTEGER NOT NULL,
+        tick_count INTEGER NOT NULL,
+        payload BLOB NOT NULL
+    );
+    """
+    conn.execute(create_table_query)
+
+
+def create_charging_session_telemetry_rollup_tables(conn: sqlite3.Connection):
+    """Creates the per-minute and per-hour rollup tables, if missing."""
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS {table_name}(
+        transaction_id INTEGER NOT NULL,
+        bucket_start_ms INTEGER NOT NULL,
+        sample_count INTEGER NOT NULL,
+        power_min INTEGER NOT NULL,
+        power_max INTEGER NOT NULL,
+        power_sum INTEGER NOT NULL,
+        energy_off_peak INTEGER NOT NULL DEFAULT 0,
+        energy_flat INTEGER NOT NULL DEFAULT 0,
+        energy_peak INTEGER NOT NULL DEFAULT 0,
+        cost_off_peak REAL NOT NULL DEFAULT 0,
+        cost_flat REAL NOT NULL DEFAULT 0,
+        cost_peak REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (transaction_id, bucket_start_ms)
+    ) WITHOUT ROWID;
+    """
+    for table_name in rollup_tables:
+        conn.execute(create_table_query.format(table_name=table_name))
 
 
 def check_pragma_statements(db_file: str = database_file):
-    """Executes pragma statements to enable foreign keys and WAL journal mode."""
+    """Executes pragma statements to enable foreign keys, WAL journal mode and incremental vacuum."""
     try:
+        check_incremental_auto_vacuum(db_file)  # Before WAL, which already writes the header of a new database
         with sqlite3.connect(db_file) as conn:
             conn.execute("PRAGMA journal_mode = WAL;")
             conn.execute("PRAGMA foreign_keys = ON;")
@@ -215,40 +510,71 @@ def check_pragma_statements(db_file: str = database_file):
         logger.error(f"Exception during SQLite pragma statements: {e}")
 
 
-def empty_session_history_table_add_index(
-    db_file: str = database_file, index_name: str = "idx_charging_session_history"
-):
-    """Empties the charging_session_history table and adds a new index."""
-    delete_query = "DELETE FROM charging_session_history;"
-    create_index_query = f"""
-        CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON charging_session_history
-        (pool_code, station_name, connector_id, start_meter_value, last_meter_value);
+def check_incremental_auto_vacuum(db_file: str = database_file):
+    """
+    Sets auto_vacuum = INCREMENTAL, so the pages freed by the telemetry retention can be returned
+    to the file system with incremental_vacuum steps. It takes effect right away on a new database,
+    an existing one needs the full VACUUM of vacuum_to_incremental_auto_vacuum (run in background).
     """
     try:
         with sqlite3.connect(db_file) as conn:
-            conn.execute(delete_query)
-            conn.execute(create_index_query)
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
     except Exception as e:
-        logger.error(f"Exception during empty_session_history_table_add_index: {e}")
+        logger.error(f"Exception during check_incremental_auto_vacuum: {e}")
 
 
-def check_session_history_table_index(db_file: str = database_file, index_name: str = "idx_charging_session_history"):
-    """Checks if the index exists in the database table or creates a new one."""
-    check_index_query = f"""
-        SELECT * FROM sqlite_master WHERE type= 'index'
-        and tbl_name = 'charging_session_history' and name = '{index_name}';
+def vacuum_to_incremental_auto_vacuum(db_file: str = database_file) -> bool:
     """
+    Runs the one-time full VACUUM that switches an existing database to auto_vacuum = INCREMENTAL.
+    It rewrites the whole file, so it is left to the background migrations instead of the startup.
+    Returns True if the database uses incremental auto_vacuum after the call.
+    """
+    incremental_mode: int = 2  # ? 0: NONE, 1: FULL, 2: INCREMENTAL
     try:
-        with sqlite3.connect(db_file) as conn:
-            index_exists: bool = conn.execute(check_index_query).fetchone() is not None
-            if not index_exists:
-                empty_session_history_table_add_index(db_file, index_name)
+        conn = sqlite3.connect(db_file, isolation_level=None)  # VACUUM can not run inside a transaction
+        try:
+            if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == incremental_mode:
+                return True
+
+            logger.warning(f"Running a one-time VACUUM to enable incremental auto_vacuum on {db_file} ...")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+            conn.execute("VACUUM;")
+            logger.info(f"Database Migration: Enabled incremental auto_vacuum on {db_file}.")
+            return conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == incremental_mode
+        finally:
+            conn.close()
     except Exception as e:
-        logger.error(f"Exception during check_session_history_index: {e}")
+        logger.error(f"Exception during vacuum_to_incremental_auto_vacuum: {e}")
+        return False
+
+
+def create_session_history_unique_index(conn: sqlite3.Connection, index_name: str = "idx_charging_session_history"):
+    """
+    Creates the unique index that rejects duplicated charging_session_history inserts, if missing.
+    The duplicated rows of a database created before the index are deleted first, keeping the first one.
+    """
+    check_index_query = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?;"
+    delete_duplicates_query = """
+        DELETE FROM charging_session_history WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM charging_session_history
+            GROUP BY pool_code, station_name, connector_id, start_meter_value, last_meter_value
+        );
+    """
+    create_index_query = f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON charging_session_history
+        (pool_code, station_name, connector_id, start_meter_value, last_meter_value);
+    """
+    if conn.execute(check_index_query, (index_name,)).fetchone() is not None:
+        return
 
+    deleted_count = conn.execute(delete_duplicates_query).rowcount
+    if deleted_count:
+        logger.warning(f"Database Migration: Deleted {deleted_count} duplicated charging_session_history rows.")
+    conn.execute(create_index_query)
 
-def check_connector_status_table(db_file: str = database_file):
-    """Checks if the connector status table exists or creates a new one."""
+
+def create_connector_status_table(conn: sqlite3.Connection):
+    """Creates the connector status table, if missing."""
     create_table_query = """
     CREATE TABLE IF NOT EXISTS connector_status(
         pool_code INTEGER NOT NULL,
@@ -259,8 +585,150 @@ def check_connector_status_table(db_file: str = database_file):
         PRIMARY KEY (pool_code, station_name, connector_id)
     );
     """
-    try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(create_table_query)
-    except Exception as e:
-        logger.error(f"Exception during check_connector_status_table: {e}")
+    conn.execute(create_table_query)
+
+
+def create_active_session_table(conn: sqlite3.Connection):
+    """
+    Creates the active session checkpoint table, if missing.
+    One compact row per busy connector: the ChargingSessionUpdate fields other than
+    the key and the defaults are stored as JSON, and updated_at is in epoch seconds.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS active_session(
+        pool_code INTEGER NOT NULL,
+        station_name TEXT NOT NULL,
+        connector_id INTEGER NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        PRIMARY KEY (pool_code, station_name, connector_id)
+    ) WITHOUT ROWID;
+    """
+    conn.execute(create_table_query)
+
+
+def create_tagoio_outbox_table(conn: sqlite3.Connection):
+    """
+    Creates the TagoIO outbox table, if missing: the pending variable inserts of each pool, as JSON,
+    sent in id order by the outbox drainer. Timestamps are in epoch seconds.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS tagoio_outbox(
+        id INTEGER PRIMARY KEY,
+        pool_code INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_ts REAL NOT NULL,
+        last_error TEXT,
+        payload TEXT NOT NULL
+    );
+    """
+    conn.execute(create_table_query)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tagoio_outbox_pool ON tagoio_outbox (pool_code, id);")
+
+
+# Indexes supporting the audit, export and retention queries, by index name
+query_indexes: dict[str, str] = {
+    # get_charging_sessions_from_pool_code and get_recent_sessions date ranges, by pool or global
+    "idx_cs_history_pool_start": "charging_session_history (pool_code, start_ts)",
+    "idx_cs_history_start": "charging_session_history (start_ts)",
+    # get_sessions_page keyset pagination on (created_at, transaction_id, rowid, implicit in every index): global,
+    # or filtered by pool_code (also used by get_charging_sessions_from_pool_code), station_name or card_alias
+    "idx_cs_history_created_tx": "charging_session_history (created_at, transaction_id)",
+    "idx_cs_history_pool_created_tx": "charging_session_history (pool_code, created_at, transaction_id)",
+    "idx_cs_history_station_created_tx": "charging_session_history (station_name, created_at, transaction_id)",
+    "idx_cs_history_card_created_tx": "charging_session_history (card_alias, created_at, transaction_id)",
+    # get_session_history and duplicate checks, by transaction_id
+    "idx_cs_history_transaction_id": "charging_session_history (transaction_id)",
+    # delete_database_cs_telemetry retention DELETE of the packed sessions, by start epoch
+    "idx_cs_telemetry_packed_start": "charging_session_telemetry_packed (start_epoch_ms)",
+    # delete_telemetry_rollups retention DELETE, by bucket start
+    "idx_cs_telemetry_minute_bucket": "charging_session_telemetry_minute (bucket_start_ms)",
+    "idx_cs_telemetry_hour_bucket": "charging_session_telemetry_hour (bucket_start_ms)",
+}
+
+
+# Indexes superseded by the ones in query_indexes
+obsolete_indexes: list[str] = ["idx_cs_history_created_at", "idx_cs_history_pool_created_at"]
+
+
+def drop_obsolete_indexes(conn: sqlite3.Connection, index_names: list[str] = obsolete_indexes):
+    """Drops the indexes superseded by the ones in query_indexes, if present."""
+    check_index_query = "SELECT name FROM sqlite_master WHERE type = 'index';"
+    existing_indexes = {row[0] for row in conn.execute(check_index_query).fetchall()}
+    for index_name in existing_indexes.intersection(index_names):
+        conn.execute(f"DROP INDEX IF EXISTS {index_name};")
+        logger.info(f"Database Migration: Dropped obsolete index '{index_name}'.")
+
+
+def create_query_index(conn: sqlite3.Connection, index_name: str):
+    """Creates one of the query_indexes if missing. Each index is its own step, so each build is a short transaction."""
+    index_target = query_indexes[index_name]
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_target};")
+    logger.info(f"Database Migration: Created index '{index_name}' on {index_target}.")
+
+
+def get_query_index_migrations(first_version: int) -> list[Migration]:
+    """One background step per query index, in the query_indexes order, starting at first_version."""
+    return [
+        Migration(version, f"query index {index_name}", partial(create_query_index, index_name=index_name), True)
+        for version, index_name in enumerate(query_indexes, start=first_version)
+    ]
+
+
+def create_base_tables(conn: sqlite3.Connection):
+    """Devices, stations, session history (with its unique index), raw telemetry and connector statuses."""
+    create_tagoio_device_table(conn)
+    create_station_config_table(conn)
+    create_charging_session_history_table(conn)
+    create_session_history_unique_index(conn)
+    create_charging_session_telemetry_table(conn)
+    create_connector_status_table(conn)
+
+
+# ! Append new steps with the next version, never edit an applied one. The steps of the first versions are
+# idempotent, as the databases created before the versioned migrations start at user_version 0 with part of them.
+schema_migrations: list[Migration] = [
+    Migration(1, "base tables", create_base_tables),
+    Migration(2, "packed telemetry", create_charging_session_telemetry_packed_table),
+    Migration(3, "telemetry rollups", create_charging_session_telemetry_rollup_tables),
+    Migration(4, "daily pool stats", create_daily_pool_stats_table),
+    Migration(5, "session full-text search", create_session_search_table),
+    Migration(6, "active session checkpoints", create_active_session_table),
+    Migration(7, "change counters", create_change_counters),
+    Migration(8, "drop obsolete indexes", drop_obsolete_indexes),
+    Migration(9, "compact telemetry ticks", create_charging_session_telemetry_tick_table),
+    Migration(10, "session epoch columns", add_session_epoch_columns),
+    Migration(11, "tagoio outbox", create_tagoio_outbox_table),
+    # ! Keep the background steps last, so that the foreground ones never wait for them (user_version is linear).
+    # A BEGIN IMMEDIATE transaction holds the write lock until its COMMIT: one index per step keeps each lock short.
+    *get_query_index_migrations(first_version=12),
+]
+
+
+def check_local_database(db_file: str = database_file, include_background: bool = True):
+    """
+    Brings the database schema up to date with the pending schema_migrations. With an up-to-date
+    schema, this is a single PRAGMA user_version read. At startup, the background steps are left
+    to run_background_migrations (include_background=False).
+    """
+    if get_schema_version(db_file) >= schema_migrations[-1].version:
+        return
+
+    check_pragma_statements(db_file)  # WAL and auto_vacuum persist in the database file
+    run_migrations(schema_migrations, db_file, include_background)
+
+
+def run_background_migrations(db_file: str = database_file) -> int:
+    """
+    Applies the pending migrations, including the heavy ones, then the online data moves that can
+    not run in a single transaction and the auto_vacuum switch. Returns the schema version after the run.
+    """
+    schema_version = run_migrations(schema_migrations, db_file, include_background=True)
+    if schema_version >= 9:  # The legacy telemetry rows are moved once the tick table exists
+        move_legacy_telemetry(db_file)
+    if schema_version >= 10:  # The sessions inserted before the epoch columns
+        backfill_session_epochs(db_file)
+    vacuum_to_incremental_auto_vacuum(db_file)  # Only rewrites the file the first time
+    return schema_version
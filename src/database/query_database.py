@@ -1,24 +1,79 @@
+import heapq
 import sqlite3
+from collections.abc import Callable, Iterable, Iterator
+from itertools import chain
+from time import sleep, time
 from typing import Optional
 
 from loguru import logger
 
 from database import database_file
+from database.connection_manager import get_connection, open_connection
+from database.database_check import stats_day_expression
+from database.session_dates import get_day_range_epochs, get_session_epochs
+from database.telemetry_packing import (
+    get_telemetry_row_from_tick,
+    get_tick_row,
+    iter_telemetry_blob,
+    pack_telemetry_rows,
+    timestamp_to_epoch_ms,
+    unpack_telemetry_blob,
+)
+from database.telemetry_rollups import get_rollup_buckets, get_rollup_upsert_query, rollup_tables
 from schemas.ocpp_csms import ChargingSessionUpdate
 
 # ruff: noqa: BLE001
 
 
+# Rows fetched per fetchmany call by the streaming (iter_*) variants of the large read queries
+stream_batch_size: int = 500
+
+
+def iter_cursor_rows(cursor: sqlite3.Cursor, batch_size: int = stream_batch_size) -> Iterator:
+    """Yields the rows of an executed cursor, fetched in batches of batch_size."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def stream_query_rows(
+    query: str,
+    params: tuple = (),
+    db_file: str = database_file,
+    batch_size: int = stream_batch_size,
+    as_dict: bool = False,
+) -> Iterator:
+    """
+    Yields the rows of a read query in fetchmany batches from a live cursor, as tuples or dicts.
+    The stream has its own connection, not the cached one of the thread: it can be consumed from
+    several threads (e.g. by a StreamingResponse) and it does not keep a read transaction open on the
+    shared connection. The connection is closed once the stream is exhausted or closed. Errors are
+    raised to the consumer after closing it, so a truncated stream is not taken for a complete one.
+    """
+    conn = open_connection(db_file)
+    try:
+        cursor = conn.cursor()
+        if as_dict:
+            cursor.row_factory = sqlite3.Row
+        for row in iter_cursor_rows(cursor.execute(query, params), batch_size):
+            yield dict(row) if as_dict else row
+    finally:
+        conn.close()
+
+
 def get_modified_rows_count(table_name: str, db_file: str = database_file) -> Optional[int]:
     """
-    Returns the count of modified rows in the specified table. Used to find out
-    if there are any modified rows in the database, to determine if a backup
-    needs to be taken. In case of error, returns None to be handled by caller.
+    Returns the count of changed rows in the specified table since the last backup, kept by the
+    change_counter triggers (a single-row read). Used to determine if a backup needs to be taken.
+    In case of error or missing counter, returns None to be handled by caller.
     """
-    query = f"SELECT COUNT(is_modified) FROM {table_name} WHERE is_modified = 1;"
+    query = "SELECT change_count FROM change_counter WHERE table_name = ?;"
     try:
-        with sqlite3.connect(db_file) as conn:
-            return conn.execute(query).fetchone()[0]
+        with get_connection(db_file) as conn:
+            row = conn.execute(query, (table_name,)).fetchone()
+            return row[0] if row is not None else None
     except Exception as e:
         logger.error(f"Exception during get_modified_rows_count: {e}")
         return None
@@ -28,7 +83,7 @@ def get_database_tagoio_devices_count(db_file: str = database_file) -> int:
     "Returns the number of tagoio_device rows in the database table."
     query = "SELECT COUNT(pool_code) FROM tagoio_device;"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query).fetchone()[0]
     except Exception as e:
         logger.error(f"Exception counting tagoio_device table rows: {e}")
@@ -39,7 +94,7 @@ def get_database_charging_session_history_count(db_file: str = database_file) ->
     "Returns the number of charging session rows in the history database table."
     query = "SELECT COUNT(ROWID) FROM charging_session_history;"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query).fetchone()[0]
     except Exception as e:
         logger.error(f"Exception counting charging_session_history table rows: {e}")
@@ -50,7 +105,7 @@ def get_all_database_tagoio_devices(db_file: str = database_file) -> list[tuple[
     "Returns all tagoio_device rows in the database table."
     query = "SELECT pool_code, device_id, device_token FROM tagoio_device"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query).fetchall()
     except Exception as e:
         logger.error(f"Exception during get_all_database_tagoio_devices: {e}")
@@ -61,7 +116,7 @@ def get_database_tagoio_device(pool_code: int, db_file: str = database_file):
     "Returns the tagoio_device for a given pool code."
     query = "SELECT device_id, device_token FROM tagoio_device WHERE pool_code = ?;"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query, (pool_code,)).fetchone()
     except Exception as e:
         logger.error(f"Exception during get_database_tagoio_device: {e}")
@@ -72,7 +127,7 @@ def get_database_pool_code_by_device_id(device_id: str, db_file: str = database_
     "Returns the pool code for a given device ID."
     query = "SELECT pool_code FROM tagoio_device WHERE device_id = ?;"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query, (device_id,)).fetchone()[0]
     except Exception as e:
         logger.error(f"Exception during get_database_pool_code_by_device_id: {e}")
@@ -90,7 +145,7 @@ def insert_database_tagoio_device(pool_code: int, device_id: str, device_token:
             is_modified = 1;
     """
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             conn.execute(query, (pool_code, device_id, device_token))
             conn.commit()
     except Exception as e:
@@ -100,20 +155,38 @@ def insert_database_tagoio_device(pool_code: int, device_id: str, device_token:
 def insert_database_charging_session_history(
     update: ChargingSessionUpdate, db_file: str = database_file
 ) -> Optional[int]:
-    """Inserts a new charging session into the history database table."""
+    """
+    Inserts a new charging session into the history database table. Returns None for a duplicated session,
+    while other errors (e.g. a busy database) are raised, so that the caller keeps the session to retry it.
+    """
     query = """
         INSERT INTO charging_session_history
         (
             pool_code, station_name, connector_id, transaction_id, 
             card_alias, start_date, time_band, start_meter_value, 
             last_meter_value, cost, rate_off_peak, rate_flat, rate_peak, 
-            energy_off_peak, energy_flat, energy_peak, is_modified
+            energy_off_peak, energy_flat, energy_peak, start_ts, end_ts, is_modified
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-        RETURNING transaction_id;
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        RETURNING transaction_id, rowid;
+    """
+    # ? Adds the inserted session to its daily_pool_stats row, in the same transaction
+    stats_query = f"""
+        INSERT INTO daily_pool_stats
+        (pool_code, station_name, day, session_count, energy_total, energy_off_peak, energy_flat, energy_peak, cost)
+        SELECT pool_code, station_name, {stats_day_expression}, 1, last_meter_value - start_meter_value,
+            energy_off_peak, energy_flat, energy_peak, cost
+        FROM charging_session_history WHERE rowid = ?
+        ON CONFLICT(pool_code, station_name, day) DO UPDATE SET
+            session_count = session_count + 1,
+            energy_total = energy_total + excluded.energy_total,
+            energy_off_peak = energy_off_peak + excluded.energy_off_peak,
+            energy_flat = energy_flat + excluded.energy_flat,
+            energy_peak = energy_peak + excluded.energy_peak,
+            cost = cost + excluded.cost;
     """
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             values = (
                 update.pool_code,
                 update.station_name,
@@ -131,8 +204,10 @@ def insert_database_charging_session_history(
                 update.energy_off_peak,
                 update.energy_flat,
                 update.energy_peak,
+                *get_session_epochs(update.start_date, update.time_band),
             )
-            transaction_id = conn.execute(query, values).fetchone()[0]
+            transaction_id, history_rowid = conn.execute(query, values).fetchone()
+            conn.execute(stats_query, (history_rowid,))
             conn.commit()
             return transaction_id
     except sqlite3.IntegrityError:
@@ -141,54 +216,277 @@ def insert_database_charging_session_history(
         return None
     except Exception as e:
         logger.error(f"Exception during insert_database_charging_session_history: {e}")
+        raise
+
+
+# ? Takes the values of get_tick_row, with the integer epoch_ms and band_code
+telemetry_insert_query: str = """
+    INSERT OR IGNORE INTO charging_session_telemetry_tick
+    (transaction_id, epoch_ms, meter_value, power, cost, band_code, energy_off_peak, energy_flat, energy_peak)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def get_telemetry_row(update: ChargingSessionUpdate) -> tuple:
+    """Provides the telemetry row values for a charging session update (stored with get_tick_row)."""
+    return (
+        update.transaction_id,
+        update.last_meter_ts,
+        update.last_meter_value,
+        update.power,
+        update.cost,
+        update.current_tariff_band,
+        update.energy_off_peak,
+        update.energy_flat,
+        update.energy_peak,
+    )
+
+
+def get_previous_telemetry_row(conn: sqlite3.Connection, transaction_id: int, timestamp: str) -> Optional[tuple]:
+    """Provides the last stored telemetry row of a transaction before the given timestamp, if any."""
+    query = f"""
+        SELECT {telemetry_columns} FROM charging_session_telemetry_tick
+        WHERE transaction_id = ? AND epoch_ms < ?
+        ORDER BY epoch_ms DESC LIMIT 1;
+    """
+    epoch_ms = timestamp_to_epoch_ms(timestamp)
+    previous_row = conn.execute(query, (transaction_id, epoch_ms)).fetchone()
+    if previous_row is not None:
+        return (transaction_id, *get_telemetry_row_from_tick(previous_row))
+
+    # Not moved yet to the tick table, or a late tick of an already compacted session (packed blob)
+    legacy_rows = [
+        row for row in get_legacy_telemetry_rows(conn, transaction_id) if timestamp_to_epoch_ms(row[0]) < epoch_ms
+    ]
+    if legacy_rows:
+        return (transaction_id, *legacy_rows[-1])
+
+    packed_row = conn.execute(packed_telemetry_select_query, (transaction_id,)).fetchone()
+    if packed_row is None:
         return None
 
+    packed_rows = [row for row in unpack_telemetry_blob(*packed_row) if timestamp_to_epoch_ms(row[0]) < epoch_ms]
+    return (transaction_id, *packed_rows[-1]) if packed_rows else None
+
+
+def insert_charging_session_telemetry_batch(
+    rows: list[tuple], db_file: str = database_file, previous_rows: Optional[dict[int, tuple]] = None
+) -> bool:
+    """
+    Stores several telemetry rows (see get_telemetry_row) in a single transaction,
+    updating the per-minute and per-hour rollups with the rows actually inserted.
+    previous_rows holds the last stored row of each transaction_id, as known by the caller (e.g. the
+    telemetry buffer): the database is only read for the transactions without one before the new rows.
+    """
+    try:
+        with get_connection(db_file) as conn:
+            first_timestamps: dict[int, str] = {}
+            for row in rows:
+                first_timestamp = first_timestamps.get(row[0])
+                if first_timestamp is None or timestamp_to_epoch_ms(row[1]) < timestamp_to_epoch_ms(first_timestamp):
+                    first_timestamps[row[0]] = row[1]
+
+            known_rows = previous_rows or {}
+            batch_previous_rows: dict[int, tuple] = {}
+            for transaction_id, timestamp in first_timestamps.items():
+                previous_row = known_rows.get(transaction_id)
+                if previous_row is None or timestamp_to_epoch_ms(previous_row[1]) >= timestamp_to_epoch_ms(timestamp):
+                    previous_row = get_previous_telemetry_row(conn, transaction_id, timestamp)
+                if previous_row is not None:
+                    batch_previous_rows[transaction_id] = previous_row
+
+            # ? Duplicated ticks are ignored by the INSERT, and must not be added to the rollups
+            inserted_rows, duplicated_rows = rows, []
+            changes_before = conn.total_changes
+            conn.executemany(telemetry_insert_query, [get_tick_row(row) for row in rows])
+            if conn.total_changes - changes_before != len(rows):  # Rare: find the duplicates row by row
+                conn.rollback()
+                inserted_rows = []
+                for row in rows:
+                    is_inserted = conn.execute(telemetry_insert_query, get_tick_row(row)).rowcount > 0
+                    (inserted_rows if is_inserted else duplicated_rows).append(row)
+
+            rollup_buckets = get_rollup_buckets(inserted_rows, batch_previous_rows, duplicated_rows)
+            for table_name, bucket_rows in rollup_buckets.items():
+                conn.executemany(get_rollup_upsert_query(table_name), bucket_rows)
 
-def insert_charging_session_telemetry(update: ChargingSessionUpdate, db_file: str = database_file):
-    """Stores high-frequency telemetry with cumulative energy breakdowns."""
-    query = """
-        INSERT OR IGNORE INTO charging_session_telemetry 
-        (transaction_id, timestamp, meter_value, power, cost, current_tariff_band, energy_off_peak, energy_flat, energy_peak)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-
-    try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(
-                query,
-                (
-                    update.transaction_id,
-                    update.last_meter_ts,
-                    update.last_meter_value,
-                    update.power,
-                    update.cost,
-                    update.current_tariff_band,
-                    update.energy_off_peak,
-                    update.energy_flat,
-                    update.energy_peak,
-                ),
-            )
             conn.commit()
+            return True
     except Exception as e:
-        logger.error(f"Error inserting telemetry for {update.transaction_id}: {e}")
+        logger.error(f"Error inserting a batch of {len(rows)} telemetry rows: {e}")
+        return False
+
+
+# ? Converted by get_telemetry_row_from_tick to (timestamp, ..., current_tariff_band, ...) rows
+telemetry_columns: str = "epoch_ms, meter_value, power, cost, band_code, energy_off_peak, energy_flat, energy_peak"
+
+telemetry_select_query: str = f"""
+    SELECT {telemetry_columns}
+    FROM charging_session_telemetry_tick
+    WHERE transaction_id = ?
+    ORDER BY epoch_ms ASC
+"""
+
+# Table of the ticks stored before charging_session_telemetry_tick, until move_legacy_telemetry empties it
+legacy_telemetry_select_query: str = """
+    SELECT timestamp, meter_value, power, cost, current_tariff_band, energy_off_peak, energy_flat, energy_peak
+    FROM charging_session_telemetry
+    WHERE transaction_id = ?
+    ORDER BY timestamp ASC
+"""
+
+packed_telemetry_select_query: str = """
+    SELECT start_epoch_ms, payload FROM charging_session_telemetry_packed WHERE transaction_id = ?
+"""
+
+
+def get_legacy_telemetry_rows(conn: sqlite3.Connection, transaction_id: int) -> list[tuple]:
+    """Provides the ticks of a transaction still in the legacy charging_session_telemetry table, if it exists."""
+    check_table_query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'charging_session_telemetry';"
+    if conn.execute(check_table_query).fetchone() is None:
+        return []
+
+    return [tuple(row) for row in conn.execute(legacy_telemetry_select_query, (transaction_id,)).fetchall()]
+
+
+def get_session_tick_rows(conn: sqlite3.Connection, transaction_id: int) -> list[tuple]:
+    """Provides the not compacted telemetry rows of a transaction, including the legacy ones, by timestamp."""
+    tick_rows = conn.execute(telemetry_select_query, (transaction_id,)).fetchall()
+    raw_rows = [get_telemetry_row_from_tick(tick_row) for tick_row in tick_rows]
+    legacy_rows = get_legacy_telemetry_rows(conn, transaction_id)
+    return merge_telemetry_rows(legacy_rows, raw_rows) if legacy_rows else raw_rows
+
+
+def merge_telemetry_rows(packed_rows: list[tuple], raw_rows: list[tuple]) -> list[tuple]:
+    """Merges the unpacked rows with the not yet compacted ones, ordered by timestamp (raw rows win)."""
+    if not packed_rows:
+        return list(raw_rows)
+    if not raw_rows:
+        return packed_rows
+
+    rows_by_epoch = {timestamp_to_epoch_ms(row[0]): row for row in packed_rows}
+    rows_by_epoch.update({timestamp_to_epoch_ms(row[0]): tuple(row) for row in raw_rows})
+    return [rows_by_epoch[epoch_ms] for epoch_ms in sorted(rows_by_epoch)]
 
 
 def get_telemetry_for_session(transaction_id: int, db_file: str = database_file) -> list[tuple]:
-    """Retrieves all telemetry data for a specific transaction."""
-    query = """
-        SELECT timestamp, meter_value, power, cost, current_tariff_band, energy_off_peak, energy_flat, energy_peak
-        FROM charging_session_telemetry 
-        WHERE transaction_id = ? 
-        ORDER BY timestamp ASC
+    """
+    Retrieves all telemetry data for a specific transaction, decoding the packed blob of a
+    completed session and merging any tick stored after the compaction.
     """
     try:
-        with sqlite3.connect(db_file) as conn:
-            return conn.execute(query, (transaction_id,)).fetchall()
+        with get_connection(db_file) as conn:
+            packed_row = conn.execute(packed_telemetry_select_query, (transaction_id,)).fetchone()
+            raw_rows = get_session_tick_rows(conn, transaction_id)
+
+        packed_rows = unpack_telemetry_blob(*packed_row) if packed_row else []
+        return merge_telemetry_rows(packed_rows, raw_rows)
     except Exception as e:
         logger.error(f"Error retrieving telemetry for {transaction_id}: {e}")
         return []
 
 
+def iter_merged_telemetry_rows(packed_rows: Iterable[tuple], raw_rows: Iterable[tuple]) -> Iterator[tuple]:
+    """Lazy merge_telemetry_rows, for two timestamp-ordered row streams (raw rows win on equal timestamps)."""
+    packed_rows, raw_rows = iter(packed_rows), iter(raw_rows)
+    first_packed_row, first_raw_row = next(packed_rows, None), next(raw_rows, None)
+    if first_packed_row is None or first_raw_row is None:  # Usually, only one of them has rows
+        if first_packed_row is not None:
+            yield first_packed_row
+            yield from packed_rows
+        elif first_raw_row is not None:
+            yield tuple(first_raw_row)
+            yield from map(tuple, raw_rows)
+        return
+
+    packed_rows, raw_rows = chain([first_packed_row], packed_rows), chain([first_raw_row], raw_rows)
+    keyed_packed_rows = ((timestamp_to_epoch_ms(row[0]), 0, row) for row in packed_rows)
+    keyed_raw_rows = ((timestamp_to_epoch_ms(row[0]), 1, tuple(row)) for row in raw_rows)
+
+    pending_epoch_ms, pending_row = None, None
+    for epoch_ms, _, row in heapq.merge(keyed_packed_rows, keyed_raw_rows, key=lambda item: item[:2]):
+        if pending_row is not None and epoch_ms != pending_epoch_ms:
+            yield pending_row
+        pending_epoch_ms, pending_row = epoch_ms, row
+
+    if pending_row is not None:
+        yield pending_row
+
+
+def iter_telemetry_for_session(
+    transaction_id: int, db_file: str = database_file, batch_size: int = stream_batch_size
+) -> Iterator[tuple]:
+    """
+    Streaming variant of get_telemetry_for_session: the packed blob is decoded lazily and the
+    ticks are read in fetchmany batches, so the memory use does not grow with the session length.
+    Runs on its own connection (see stream_query_rows), closed once exhausted or closed, errors included.
+    """
+    conn = open_connection(db_file)
+    try:
+        packed_row = conn.execute(packed_telemetry_select_query, (transaction_id,)).fetchone()
+        packed_rows = iter_telemetry_blob(*packed_row) if packed_row else iter(())
+
+        tick_cursor = conn.execute(telemetry_select_query, (transaction_id,))
+        raw_rows = map(get_telemetry_row_from_tick, iter_cursor_rows(tick_cursor, batch_size))
+        legacy_rows = get_legacy_telemetry_rows(conn, transaction_id)  # Only until move_legacy_telemetry
+        if legacy_rows:
+            raw_rows = iter(merge_telemetry_rows(legacy_rows, list(raw_rows)))
+
+        yield from iter_merged_telemetry_rows(packed_rows, raw_rows)
+    finally:
+        conn.close()
+
+
+def compact_session_telemetry(transaction_id: int, db_file: str = database_file) -> int:
+    """
+    Packs the telemetry rows of a completed charging session into a single blob, in the
+    charging_session_telemetry_packed table, and deletes the packed rows, in one transaction.
+    Ticks stored after a previous compaction are merged into the existing blob.
+    Returns the number of compacted rows.
+    """
+    upsert_query = """
+        INSERT OR REPLACE INTO charging_session_telemetry_packed
+        (transaction_id, start_epoch_ms, tick_count, payload) VALUES (?, ?, ?, ?);
+    """
+    delete_query = "DELETE FROM charging_session_telemetry_tick WHERE transaction_id = ?;"
+    legacy_delete_query = "DELETE FROM charging_session_telemetry WHERE transaction_id = ?;"
+    try:
+        with get_connection(db_file) as conn:
+            raw_rows = get_session_tick_rows(conn, transaction_id)
+            if not raw_rows:
+                return 0
+
+            packed_row = conn.execute(packed_telemetry_select_query, (transaction_id,)).fetchone()
+            packed_rows = unpack_telemetry_blob(*packed_row) if packed_row else []
+            rows = merge_telemetry_rows(packed_rows, raw_rows)
+
+            start_epoch_ms, tick_count, payload = pack_telemetry_rows(rows)
+            conn.execute(upsert_query, (transaction_id, start_epoch_ms, tick_count, payload))
+            conn.execute(delete_query, (transaction_id,))
+            if len(raw_rows) > conn.execute("SELECT changes();").fetchone()[0]:  # Some were legacy rows
+                conn.execute(legacy_delete_query, (transaction_id,))
+            conn.commit()
+            return len(raw_rows)
+    except Exception as e:
+        logger.error(f"Error compacting telemetry for {transaction_id}: {e}")
+        return 0
+
+
+def get_uncompacted_session_ids(limit: int = 500, db_file: str = database_file) -> list[int]:
+    """Provides the transaction_id of completed sessions (in the history table) with telemetry rows left."""
+    query = """
+        SELECT DISTINCT t.transaction_id FROM charging_session_telemetry_tick t
+        WHERE EXISTS (SELECT 1 FROM charging_session_history h WHERE h.transaction_id = t.transaction_id)
+        LIMIT ?;
+    """
+    try:
+        with get_connection(db_file) as conn:
+            return [row[0] for row in conn.execute(query, (limit,)).fetchall()]
+    except Exception as e:
+        logger.error(f"Exception during get_uncompacted_session_ids: {e}")
+        return []
+
+
 def update_database_tagoio_device(pool_code: int, device_id: str, device_token: str, db_file: str = database_file):
     "Updates an existing tagoio_device in the database table."
     query = """
@@ -197,7 +495,7 @@ def update_database_tagoio_device(pool_code: int, device_id: str, device_token:
         WHERE pool_code = ?;
     """
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             conn.execute(query, (device_id, device_token, pool_code))
             conn.commit()
     except Exception as e:
@@ -208,114 +506,287 @@ def delete_database_tagoio_device(pool_code: int, db_file: str = database_file):
     "Deletes an existing tagoio_device from the database table."
     query = "DELETE FROM tagoio_device WHERE pool_code = ?;"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             conn.execute(query, (pool_code,))
             conn.commit()
     except Exception as e:
         logger.error(f"Exception during delete_database_tagoio_device: {e}")
 
 
-def get_charging_sessions_from_pool_code(pool_code: int, db_file: str = database_file):
-    "Returns all charging sessions for a given pool code."
-    select_query = """
+def get_start_ts_conditions(start_day: Optional[str], end_day: Optional[str]) -> tuple[list[str], list[int]]:
+    """Provides the start_ts conditions and params of an inclusive range of local days (YYYY-MM-DD)."""
+    conditions, params = [], []
+    start_epoch, end_epoch = get_day_range_epochs(start_day, end_day)
+    if start_epoch is not None:
+        conditions.append("start_ts >= ?")
+        params.append(start_epoch)
+    if end_epoch is not None:
+        conditions.append("start_ts < ?")
+        params.append(end_epoch)
+    return conditions, params
+
+
+def get_pool_sessions_query(
+    pool_code: int, start_day: Optional[str] = None, end_day: Optional[str] = None
+) -> tuple[str, tuple]:
+    """
+    Builds the query of the charging sessions of a pool code. With a range of session start days
+    (YYYY-MM-DD, inclusive, local time), an index seek on (pool_code, start_ts) ordered by start.
+    Returns tuple: (query, params)
+    """
+    query = """
         SELECT
             created_at, pool_code, station_name, connector_id, card_alias,
             start_date, time_band, start_meter_value, last_meter_value, cost
         FROM charging_session_history
         WHERE pool_code = ?
-        ORDER BY created_at ASC;
     """
+    conditions, params = get_start_ts_conditions(start_day, end_day)
+    if conditions:
+        query += " AND " + " AND ".join(conditions) + " ORDER BY start_ts ASC;"
+    else:
+        query += " ORDER BY created_at ASC;"
+    return query, (pool_code, *params)
+
+
+def get_charging_sessions_from_pool_code(
+    pool_code: int, start_day: Optional[str] = None, end_day: Optional[str] = None, db_file: str = database_file
+):
+    "Returns all charging sessions for a given pool code, optionally within a range of start days."
     try:
-        with sqlite3.connect(db_file) as conn:
-            return conn.execute(select_query, (pool_code,)).fetchall()
+        select_query, params = get_pool_sessions_query(pool_code, start_day, end_day)
+        with get_connection(db_file) as conn:
+            return conn.execute(select_query, params).fetchall()
     except Exception as e:
         logger.error(f"Exception during get_charging_sessions_from_pool_code: {e}")
         return []
 
 
-def get_noc_from_db(station_name: str, db_file: str = database_file) -> Optional[int]:
-    """Retrieves the number of connectors (NOC) for a given station."""
-    query = "SELECT noc FROM station_config WHERE station_name = ?;"
+def iter_charging_sessions_from_pool_code(
+    pool_code: int,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    db_file: str = database_file,
+    batch_size: int = stream_batch_size,
+) -> Iterator[tuple]:
+    """Streaming variant of get_charging_sessions_from_pool_code (see stream_query_rows)."""
+    select_query, params = get_pool_sessions_query(pool_code, start_day, end_day)
+    return stream_query_rows(select_query, params, db_file, batch_size)
+
+
+def get_all_station_profiles(db_file: str = database_file) -> list[tuple[str, int, int]]:
+    """Retrieves all (station_name, pool_code, noc) station profiles to fill the in-memory cache on startup."""
+    query = "SELECT station_name, pool_code, noc FROM station_config;"
     try:
-        with sqlite3.connect(db_file) as conn:
-            result = conn.execute(query, (station_name,)).fetchone()
-            if result:
-                return result[0]
-            return None
+        with get_connection(db_file) as conn:
+            return conn.execute(query).fetchall()
     except Exception as e:
-        logger.error(f"Error retrieving NOC for station {station_name}: {e}")
-        return None
+        logger.error(f"Error retrieving station profiles: {e}")
+        return []
 
 
-def update_station_noc_if_needed(
-    pool_code: int, station_name: str, connector_id: int, db_file: str = database_file
-) -> None:
+def upsert_station_profile(pool_code: int, station_name: str, noc: int, db_file: str = database_file) -> bool:
     """
-    Infers and updates the number of connectors (NOC) for a station.
-    If the incoming connector_id is higher than the stored NOC, the database is updated.
+    Registers a new station profile, or updates its number of connectors (NOC)
+    only when the provided one is higher than the stored NOC.
     """
-    select_query = "SELECT noc FROM station_config WHERE station_name = ?;"
-    insert_query = """
+    query = """
         INSERT INTO station_config (station_name, pool_code, noc)
-        VALUES (?, ?, ?);
-    """
-    update_query = """
-        UPDATE station_config
-        SET noc = ?, is_modified = 1
-        WHERE station_name = ?;
+        VALUES (?, ?, ?)
+        ON CONFLICT(station_name) DO UPDATE SET noc = excluded.noc, is_modified = 1
+        WHERE excluded.noc > station_config.noc;
     """
+    try:
+        with get_connection(db_file) as conn:
+            conn.execute(query, (station_name, pool_code, noc))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Error upserting station profile {pool_code}/{station_name}: {e}")
+        return False
+
+
+connector_status_upsert_query: str = """
+    INSERT INTO connector_status (pool_code, station_name, connector_id, charge_point_status, is_modified)
+    VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT(pool_code, station_name, connector_id) 
+    DO UPDATE SET charge_point_status=excluded.charge_point_status, is_modified=1;
+"""
+
 
+def upsert_connector_statuses_batch(rows: list[tuple[int, str, int, str]], db_file: str = database_file) -> bool:
+    """Inserts or updates several (pool_code, station_name, connector_id, status) rows in a single transaction."""
     try:
-        with sqlite3.connect(db_file) as conn:
-            result = conn.execute(select_query, (station_name,)).fetchone()
+        with get_connection(db_file) as conn:
+            conn.executemany(connector_status_upsert_query, rows)
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Error upserting a batch of {len(rows)} connector statuses: {e}")
+        return False
+
+
+connector_statuses_select_query: str = """
+    SELECT pool_code, station_name, connector_id, charge_point_status
+    FROM connector_status
+    ORDER BY pool_code, station_name, connector_id;
+"""
+
+
+def iter_all_connector_statuses(db_file: str = database_file, batch_size: int = stream_batch_size) -> Iterator[tuple]:
+    """Streams all stored connector statuses to rehydrate memory on startup (see stream_query_rows)."""
+    return stream_query_rows(connector_statuses_select_query, (), db_file, batch_size)
 
-            if result is None:  # Station not in DB, insert it with the current connector_id as NOC
-                conn.execute(insert_query, (station_name, pool_code, connector_id))
-                conn.commit()
-                logger.info(f"Registered new station {pool_code}/{station_name} with NOC {connector_id}.")
 
-            elif connector_id > result[0]:  # Station exists, but a higher connector_id was broadcasted
-                conn.execute(update_query, (connector_id, station_name))
-                conn.commit()
-                logger.info(f"Updated station {pool_code}/{station_name} NOC from {result[0]} to {connector_id}.")
+active_session_upsert_query: str = """
+    INSERT INTO active_session (pool_code, station_name, connector_id, transaction_id, updated_at, payload)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(pool_code, station_name, connector_id)
+    DO UPDATE SET transaction_id=excluded.transaction_id, updated_at=excluded.updated_at, payload=excluded.payload;
+"""
 
+
+def checkpoint_active_sessions_batch(
+    upsert_rows: list[tuple[int, str, int, int, int, str]],
+    deleted_keys: list[tuple[int, str, int]],
+    db_file: str = database_file,
+) -> bool:
+    """
+    Stores the latest state of the changed active sessions in a single transaction:
+    upsert_rows are (pool_code, station_name, connector_id, transaction_id, updated_at, payload),
+    and deleted_keys the (pool_code, station_name, connector_id) of the finished sessions.
+    """
+    delete_query = "DELETE FROM active_session WHERE pool_code = ? AND station_name = ? AND connector_id = ?;"
+    try:
+        with get_connection(db_file) as conn:
+            conn.executemany(active_session_upsert_query, upsert_rows)
+            conn.executemany(delete_query, deleted_keys)
+            conn.commit()
+            return True
     except Exception as e:
-        logger.error(f"Error updating NOC for station {pool_code}/{station_name}: {e}")
+        logger.error(f"Error checkpointing {len(upsert_rows) + len(deleted_keys)} active sessions: {e}")
+        return False
 
 
-def upsert_connector_status(
-    pool_code: int, station_name: str, connector_id: int, status: str, db_file: str = database_file
-):
-    """Inserts or updates the last known status of a connector."""
+def delete_stale_active_sessions(max_age_hours: int = 24, db_file: str = database_file) -> int:
+    """
+    Deletes the checkpointed sessions not updated within max_age_hours, or already stored
+    in the history (completed before their removal was checkpointed). Returns the deleted count.
+    """
     query = """
-        INSERT INTO connector_status (pool_code, station_name, connector_id, charge_point_status, is_modified)
-        VALUES (?, ?, ?, ?, 1)
-        ON CONFLICT(pool_code, station_name, connector_id) 
-        DO UPDATE SET charge_point_status=excluded.charge_point_status, is_modified=1;
+        DELETE FROM active_session
+        WHERE updated_at < CAST(strftime('%s', 'now', ?) AS INTEGER)
+        OR transaction_id IN (SELECT transaction_id FROM charging_session_history);
     """
     try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(query, (pool_code, station_name, connector_id, status))
+        with get_connection(db_file) as conn:
+            deleted_count = conn.execute(query, (f"-{max_age_hours} hours",)).rowcount
             conn.commit()
+            return deleted_count
     except Exception as e:
-        logger.error(f"Error upserting connector status: {e}")
+        logger.error(f"Exception during delete_stale_active_sessions: {e}")
+        return 0
 
 
-def get_all_connector_statuses(db_file: str = database_file) -> list[tuple]:
-    """Retrieves all stored connector statuses to rehydrate memory on startup."""
+def get_all_active_sessions(db_file: str = database_file) -> list[tuple[int, str, int, str]]:
+    """Retrieves the checkpointed (pool_code, station_name, connector_id, payload) sessions on startup."""
     query = """
-        SELECT pool_code, station_name, connector_id, charge_point_status
-        FROM connector_status
+        SELECT pool_code, station_name, connector_id, payload
+        FROM active_session
         ORDER BY pool_code, station_name, connector_id;
     """
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query).fetchall()
     except Exception as e:
-        logger.error(f"Error retrieving connector statuses: {e}")
+        logger.error(f"Error retrieving active sessions: {e}")
+        return []
+
+
+def insert_outbox_entry(pool_code: int, payload: str, db_file: str = database_file) -> Optional[int]:
+    """Stores a pending TagoIO variable insert (JSON payload) of a pool, due right away. Returns its id."""
+    query = """
+        INSERT INTO tagoio_outbox (pool_code, created_at, next_attempt_ts, payload)
+        VALUES (?, CAST(strftime('%s', 'now') AS INTEGER), ?, ?);
+    """
+    try:
+        with get_connection(db_file) as conn:
+            entry_id = conn.execute(query, (pool_code, time(), payload)).lastrowid
+            conn.commit()
+            return entry_id
+    except Exception as e:
+        logger.error(f"Exception during insert_outbox_entry for pool {pool_code}: {e}")
+        return None
+
+
+def get_due_outbox_pools(now_ts: float, db_file: str = database_file) -> list[int]:
+    """Provides the pool codes whose oldest outbox entry is due (next_attempt_ts <= now_ts)."""
+    query = """
+        SELECT pool_code FROM tagoio_outbox
+        WHERE id IN (SELECT MIN(id) FROM tagoio_outbox GROUP BY pool_code) AND next_attempt_ts <= ?
+        ORDER BY id;
+    """
+    try:
+        with get_connection(db_file) as conn:
+            return [row[0] for row in conn.execute(query, (now_ts,)).fetchall()]
+    except Exception as e:
+        logger.error(f"Exception during get_due_outbox_pools: {e}")
+        return []
+
+
+def get_outbox_entries(pool_code: int, limit: int = 50, db_file: str = database_file) -> list[tuple[int, int, str]]:
+    """Retrieves the oldest (id, attempts, payload) outbox entries of a pool, in order."""
+    query = "SELECT id, attempts, payload FROM tagoio_outbox WHERE pool_code = ? ORDER BY id LIMIT ?;"
+    try:
+        with get_connection(db_file) as conn:
+            return conn.execute(query, (pool_code, limit)).fetchall()
+    except Exception as e:
+        logger.error(f"Exception during get_outbox_entries for pool {pool_code}: {e}")
         return []
 
 
+def delete_outbox_entries(entry_ids: list[int], db_file: str = database_file) -> int:
+    """Deletes the sent (or dropped) outbox entries. Returns the deleted count."""
+    query = "DELETE FROM tagoio_outbox WHERE id = ?;"
+    try:
+        with get_connection(db_file) as conn:
+            deleted_count = conn.executemany(query, [(entry_id,) for entry_id in entry_ids]).rowcount
+            conn.commit()
+            return deleted_count
+    except Exception as e:
+        logger.error(f"Exception during delete_outbox_entries: {e}")
+        return 0
+
+
+def reschedule_outbox_entries(
+    entry_ids: list[int], next_attempt_ts: float, last_error: str, db_file: str = database_file
+) -> bool:
+    """Counts a failed attempt of the outbox entries, and delays their next attempt to next_attempt_ts."""
+    query = """
+        UPDATE tagoio_outbox SET attempts = attempts + 1, next_attempt_ts = ?, last_error = ?
+        WHERE id = ?;
+    """
+    try:
+        with get_connection(db_file) as conn:
+            conn.executemany(query, [(next_attempt_ts, last_error, entry_id) for entry_id in entry_ids])
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Exception during reschedule_outbox_entries: {e}")
+        return False
+
+
+def get_outbox_depth(db_file: str = database_file) -> dict[int, int]:
+    """Provides the count of pending outbox entries, by pool code."""
+    query = "SELECT pool_code, COUNT(*) FROM tagoio_outbox GROUP BY pool_code;"
+    try:
+        with get_connection(db_file) as conn:
+            return dict(conn.execute(query).fetchall())
+    except Exception as e:
+        logger.error(f"Exception during get_outbox_depth: {e}")
+        return {}
+
+
 def get_session_history(transaction_id: int, db_file: str = database_file) -> Optional[dict]:
     """Retrieves the full metadata and frozen rates for a specific charging session."""
     query = """
@@ -328,86 +799,448 @@ def get_session_history(transaction_id: int, db_file: str = database_file) -> Op
         WHERE transaction_id = ?
     """
     try:
-        with sqlite3.connect(db_file) as conn:
-            conn.row_factory = sqlite3.Row
-            row = conn.execute(query, (transaction_id,)).fetchone()
+        with get_connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            row = cursor.execute(query, (transaction_id,)).fetchone()
             return dict(row) if row else None
     except Exception as e:
         logger.error(f"Error retrieving session history for {transaction_id}: {e}")
         return None
 
 
-def get_recent_sessions(limit: int = 50, pool_code: Optional[int] = None, db_file: str = database_file) -> list[dict]:
-    """Retrieves recent completed sessions with full rate and energy breakdown."""
+def get_sessions_page(
+    limit: int = 50,
+    cursor: Optional[tuple[str, int, int]] = None,
+    pool_code: Optional[int] = None,
+    station_name: Optional[str] = None,
+    card_alias: Optional[str] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    db_file: str = database_file,
+) -> tuple[list[dict], Optional[tuple[str, int, int]]]:
+    """
+    Retrieves a page of completed sessions with full rate and energy breakdown, newest first.
+    Keyset pagination: cursor is the (created_at, transaction_id, row_id) of the last row of the previous
+    page, so every page is an index seek. The rowid breaks the ties of the transaction_ids, which are not
+    unique across pools. Days (YYYY-MM-DD, inclusive) filter by the session start day in local time,
+    as the pool sessions export does (see get_start_ts_conditions).
+    Returns tuple: (sessions, next_cursor), with next_cursor None on the last page.
+    """
     query = """
-        SELECT transaction_id, pool_code, station_name, connector_id, 
+        SELECT created_at, transaction_id, rowid AS row_id, pool_code, station_name, connector_id,
             start_date, time_band, cost, card_alias,
             (last_meter_value - start_meter_value) / 1000.0 AS total_energy_kwh,
             rate_off_peak, rate_flat, rate_peak,
             energy_off_peak, energy_flat, energy_peak
-        FROM charging_session_history 
+        FROM charging_session_history
     """
-    params = []
-
-    # Conditionally add the WHERE clause
+    conditions, params = [], []
     if pool_code is not None:
-        query += " WHERE pool_code = ?"
+        conditions.append("pool_code = ?")
         params.append(pool_code)
+    if station_name is not None:
+        conditions.append("station_name = ?")
+        params.append(station_name)
+    if card_alias is not None:
+        conditions.append("card_alias = ?")
+        params.append(card_alias)
+    day_conditions, day_params = get_start_ts_conditions(start_day, end_day)
+    conditions.extend(day_conditions)
+    params.extend(day_params)
+    if cursor is not None:
+        conditions.append("(created_at, transaction_id, rowid) < (?, ?, ?)")
+        params.extend(cursor)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY created_at DESC, transaction_id DESC, rowid DESC LIMIT ?"
+    params.append(limit + 1)  # One more row tells if there is a next page
+
+    try:
+        with get_connection(db_file) as conn:
+            cursor_obj = conn.cursor()
+            cursor_obj.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            sessions = [dict(row) for row in cursor_obj.execute(query, tuple(params)).fetchall()]
+    except Exception as e:
+        logger.error(f"Error retrieving a sessions page: {e}")
+        return [], None
+
+    if len(sessions) <= limit:
+        return sessions, None
+
+    sessions = sessions[:limit]
+    last_session = sessions[-1]
+    return sessions, (last_session["created_at"], last_session["transaction_id"], last_session["row_id"])
 
-    # Always append the ORDER BY and LIMIT
-    query += " ORDER BY created_at DESC LIMIT ?"
+
+def get_search_match_expression(search_text: str) -> str:
+    """Builds an FTS5 MATCH expression requiring every word of the search text, as literal fragments."""
+    words = search_text.split()
+    return " AND ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def search_sessions(
+    search_text: str, limit: int = 50, pool_code: Optional[int] = None, db_file: str = database_file
+) -> list[dict]:
+    """
+    Searches completed sessions by card alias, station name or transaction_id fragments (3 or more
+    characters per word), through the charging_session_search full-text index. Newest sessions first.
+    """
+    match_expression = get_search_match_expression(search_text)
+    if not match_expression:
+        return []
+
+    query = """
+        SELECT h.created_at, h.transaction_id, h.pool_code, h.station_name, h.connector_id,
+            h.start_date, h.time_band, h.cost, h.card_alias,
+            (h.last_meter_value - h.start_meter_value) / 1000.0 AS total_energy_kwh,
+            h.rate_off_peak, h.rate_flat, h.rate_peak,
+            h.energy_off_peak, h.energy_flat, h.energy_peak
+        FROM charging_session_search s
+        JOIN charging_session_history h ON h.rowid = s.rowid
+        WHERE charging_session_search MATCH ?
+    """
+    params: list = [match_expression]
+    if pool_code is not None:
+        query += " AND h.pool_code = ?"
+        params.append(pool_code)
+    query += " ORDER BY s.rowid DESC LIMIT ?"
     params.append(limit)
 
     try:
-        with sqlite3.connect(db_file) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(query, tuple(params)).fetchall()
-            return [dict(row) for row in rows]
+        with get_connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            return [dict(row) for row in cursor.execute(query, tuple(params)).fetchall()]
     except Exception as e:
-        logger.error(f"Error retrieving recent sessions: {e}")
+        logger.error(f"Error searching sessions for '{search_text}': {e}")
         return []
 
 
-def delete_database_cs_telemetry(db_file: str = database_file, days_threshold: int = 120) -> tuple[int, int]:
+def get_recent_sessions_query(
+    limit: int = 50, pool_code: Optional[int] = None, start_day: Optional[str] = None, end_day: Optional[str] = None
+) -> tuple[str, tuple]:
     """
-    Deletes old charging_session_telemetry records from the database table to avoid DB bloat.
-    Returns tuple: (deleted_records_count, remaining_records_count)
+    Builds the query of the latest completed sessions, newest first (as the first get_sessions_page).
+    With a range of session start days (YYYY-MM-DD, inclusive, local time), the latest started ones,
+    through the start_ts indexes. Returns tuple: (query, params)
     """
-    delete_query = f"""
-        DELETE FROM charging_session_telemetry
-        WHERE timestamp < datetime('now', '-{days_threshold} days');
+    query = """
+        SELECT created_at, transaction_id, pool_code, station_name, connector_id,
+            start_date, time_band, cost, card_alias,
+            (last_meter_value - start_meter_value) / 1000.0 AS total_energy_kwh,
+            rate_off_peak, rate_flat, rate_peak,
+            energy_off_peak, energy_flat, energy_peak
+        FROM charging_session_history
+    """
+    conditions, params = get_start_ts_conditions(start_day, end_day)
+    order_by = "start_ts DESC" if conditions else "created_at DESC, transaction_id DESC"
+    if pool_code is not None:
+        conditions.insert(0, "pool_code = ?")
+        params.insert(0, pool_code)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order_by} LIMIT ?"
+    return query, (*params, limit)
+
+
+def get_recent_sessions(
+    limit: int = 50,
+    pool_code: Optional[int] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    db_file: str = database_file,
+) -> list[dict]:
+    """Retrieves recent completed sessions with full rate and energy breakdown (see get_recent_sessions_query)."""
+    try:
+        query, params = get_recent_sessions_query(limit, pool_code, start_day, end_day)
+        with get_connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            return [dict(row) for row in cursor.execute(query, params).fetchall()]
+    except Exception as e:
+        logger.error(f"Error retrieving recent sessions from {start_day} to {end_day}: {e}")
+        return []
+
+
+def iter_recent_sessions(
+    limit: int = 50,
+    pool_code: Optional[int] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    db_file: str = database_file,
+    batch_size: int = stream_batch_size,
+) -> Iterator[dict]:
+    """Streaming variant of get_recent_sessions (see stream_query_rows)."""
+    query, params = get_recent_sessions_query(limit, pool_code, start_day, end_day)
+    return stream_query_rows(query, params, db_file, batch_size, as_dict=True)
+
+
+def get_daily_pool_stats(
+    pool_code: Optional[int] = None,
+    station_name: Optional[str] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    db_file: str = database_file,
+) -> list[dict]:
+    """
+    Retrieves the daily_pool_stats rows (energy in Wh), optionally filtered by pool, station
+    and an inclusive range of YYYY-MM-DD days, newest first.
+    """
+    query = """
+        SELECT pool_code, station_name, day, session_count, energy_total,
+            energy_off_peak, energy_flat, energy_peak, cost
+        FROM daily_pool_stats
     """
-    count_query = "SELECT COUNT(*) FROM charging_session_telemetry;"
+    conditions, params = [], []
+    if pool_code is not None:
+        conditions.append("pool_code = ?")
+        params.append(pool_code)
+    if station_name is not None:
+        conditions.append("station_name = ?")
+        params.append(station_name)
+    if start_day is not None:
+        conditions.append("day >= ?")
+        params.append(start_day)
+    if end_day is not None:
+        conditions.append("day <= ?")
+        params.append(end_day)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY day DESC, pool_code, station_name"
+
+    try:
+        with get_connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            return [dict(row) for row in cursor.execute(query, tuple(params)).fetchall()]
+    except Exception as e:
+        logger.error(f"Error retrieving daily pool stats: {e}")
+        return []
+
+
+def get_station_stats_summary(
+    pool_code: Optional[int] = None, days: int = 30, db_file: str = database_file
+) -> list[dict]:
+    """Sums the daily_pool_stats of the last days by station, with the energy in kWh."""
+    query = """
+        SELECT pool_code, station_name, SUM(session_count) AS session_count,
+            SUM(energy_total) / 1000.0 AS energy_total_kwh,
+            SUM(energy_off_peak) / 1000.0 AS energy_off_peak_kwh,
+            SUM(energy_flat) / 1000.0 AS energy_flat_kwh,
+            SUM(energy_peak) / 1000.0 AS energy_peak_kwh,
+            SUM(cost) AS cost
+        FROM daily_pool_stats
+        WHERE day >= date('now', ?)
+    """
+    params: list = [f"-{days} days"]
+    if pool_code is not None:
+        query += " AND pool_code = ?"
+        params.append(pool_code)
+    query += " GROUP BY pool_code, station_name ORDER BY pool_code, station_name"
+
+    try:
+        with get_connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            return [dict(row) for row in cursor.execute(query, tuple(params)).fetchall()]
+    except Exception as e:
+        logger.error(f"Error retrieving the station stats summary: {e}")
+        return []
 
+
+def get_telemetry_rollups(transaction_id: int, resolution: str = "minute", db_file: str = database_file) -> list[dict]:
+    """Retrieves the per-minute or per-hour telemetry rollups of a transaction, with the average power."""
+    table_name = f"charging_session_telemetry_{resolution}"
+    if table_name not in rollup_tables:
+        logger.error(f"Unknown telemetry rollup resolution: {resolution}")
+        return []
+
+    query = f"""
+        SELECT bucket_start_ms, sample_count, power_min, power_max,
+            CAST(power_sum AS REAL) / sample_count AS power_avg,
+            energy_off_peak, energy_flat, energy_peak, cost_off_peak, cost_flat, cost_peak
+        FROM {table_name}
+        WHERE transaction_id = ?
+        ORDER BY bucket_start_ms ASC
+    """
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row  # Per cursor, the connection is shared
+            rows = cursor.execute(query, (transaction_id,)).fetchall()
+            return [dict(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Error retrieving {resolution} telemetry rollups for {transaction_id}: {e}")
+        return []
+
+
+def delete_telemetry_rollups(
+    resolution: str = "minute",
+    days_threshold: int = 730,
+    db_file: str = database_file,
+    batch_size: int = 5000,
+    pause_seconds: float = 0.05,
+) -> int:
+    """
+    Deletes the telemetry rollups older than the threshold, in bounded chunks (found with the bucket index),
+    each in its own short transaction, pausing between chunks. Returns the number of deleted buckets.
+    """
+    table_name = f"charging_session_telemetry_{resolution}"
+    if table_name not in rollup_tables:
+        logger.error(f"Unknown telemetry rollup resolution: {resolution}")
+        return 0
 
-            cursor.execute(delete_query)  # Execute deletion and get the number of affected rows
-            deleted_count = cursor.rowcount
+    cutoff_query = "SELECT CAST(strftime('%s', 'now', ?) AS INTEGER) * 1000;"
+    delete_query = f"""
+        DELETE FROM {table_name} WHERE (transaction_id, bucket_start_ms) IN (
+            SELECT transaction_id, bucket_start_ms FROM {table_name} WHERE bucket_start_ms < ? LIMIT ?
+        );
+    """
+    deleted_count: int = 0
+    try:
+        conn = get_connection(db_file)
+        cutoff_ms: int = conn.execute(cutoff_query, (f"-{days_threshold} days",)).fetchone()[0]
+        while True:
+            with conn:  # One short transaction per chunk
+                chunk_count: int = conn.execute(delete_query, (cutoff_ms, batch_size)).rowcount
+                deleted_count += chunk_count
+
+            if chunk_count < batch_size:  # Nothing else to delete
+                break
+            sleep(pause_seconds)  # Yield the write lock to the other writers
+
+        return deleted_count
+    except Exception as e:
+        logger.error(f"Exception during delete_telemetry_rollups ({resolution}): {e}")
+        return deleted_count
 
-            cursor.execute(count_query)  # Count the remaining rows
-            remaining_count = cursor.fetchone()[0]
 
+def analyze_cs_telemetry(db_file: str = database_file, analysis_limit: int = 1000) -> bool:
+    """
+    Refreshes the sqlite_stat1 statistics of charging_session_telemetry_tick, with an ANALYZE that
+    visits about analysis_limit rows per index. Meant for the scheduled maintenance, it uses its own
+    connection so the analysis_limit is not left set on the shared ones.
+    """
+    try:
+        conn = open_connection(db_file)
+        try:
+            conn.execute(f"PRAGMA analysis_limit = {int(analysis_limit)};")
+            conn.execute("ANALYZE charging_session_telemetry_tick;")
             conn.commit()
-            return deleted_count, remaining_count
+            return True
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"Exception during analyze_cs_telemetry: {e}")
+        return False
+
+
+def estimate_cs_telemetry_count(db_file: str = database_file) -> int:
+    """
+    Estimates the charging_session_telemetry_tick rows (the ticks not compacted yet) from the sqlite_stat1
+    statistics of the last analyze_cs_telemetry. Unlike a COUNT(*), its cost does not grow with the table
+    (which has no rowid range to estimate from). Returns 0 if the table was never analyzed.
+    """
+    check_stat_query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1';"
+    stat_query = "SELECT stat FROM sqlite_stat1 WHERE tbl = 'charging_session_telemetry_tick';"
+    try:
+        with get_connection(db_file) as conn:
+            if conn.execute(check_stat_query).fetchone() is None:  # Created by the first ANALYZE
+                return 0
+
+            # The first number of each index stat is its approximate row count (no stat row for an empty table)
+            return max((int(row[0].split(" ")[0]) for row in conn.execute(stat_query).fetchall()), default=0)
+    except Exception as e:
+        logger.error(f"Exception during estimate_cs_telemetry_count: {e}")
+        return 0
+
+
+def delete_database_cs_telemetry(
+    db_file: str = database_file,
+    days_threshold: int = 120,
+    batch_size: int = 5000,
+    pause_seconds: float = 0.05,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> tuple[int, int]:
+    """
+    Deletes old charging_session_telemetry_tick records from the database table to avoid DB bloat,
+    including the packed telemetry of the sessions started before the threshold.
+    Raw rows are deleted in bounded chunks (found with the epoch_ms index), each in its own short
+    transaction, pausing between chunks so other writers are not blocked for the whole deletion.
+    The optional progress_callback receives (deleted_records_count, processed_chunks).
+    Returns tuple: (deleted_records_count, remaining_records_estimate), see estimate_cs_telemetry_count.
+    """
+    cutoff_query = "SELECT CAST(strftime('%s', 'now', ?) AS INTEGER) * 1000;"
+    delete_query = """
+        DELETE FROM charging_session_telemetry_tick WHERE (transaction_id, epoch_ms) IN (
+            SELECT transaction_id, epoch_ms FROM charging_session_telemetry_tick WHERE epoch_ms < ? LIMIT ?
+        );
+    """
+    packed_count_query = """
+        SELECT COALESCE(SUM(tick_count), 0) FROM charging_session_telemetry_packed WHERE start_epoch_ms < ?;
+    """
+    packed_delete_query = "DELETE FROM charging_session_telemetry_packed WHERE start_epoch_ms < ?;"
+
+    deleted_count: int = 0
+    try:
+        conn = get_connection(db_file)
+        cutoff_ms: int = conn.execute(cutoff_query, (f"-{days_threshold} days",)).fetchone()[0]
+        with conn:  # Packed sessions are a single row each, deleted at once
+            deleted_count += conn.execute(packed_count_query, (cutoff_ms,)).fetchone()[0]
+            conn.execute(packed_delete_query, (cutoff_ms,))
+
+        processed_chunks: int = 0
+        while True:
+            with conn:  # One short transaction per chunk
+                chunk_count: int = conn.execute(delete_query, (cutoff_ms, batch_size)).rowcount
+                deleted_count += chunk_count
+
+            if chunk_count == 0:  # Nothing else to delete
+                break
+
+            processed_chunks += 1
+            if progress_callback is not None:
+                progress_callback(deleted_count, processed_chunks)
+            if chunk_count < batch_size:
+                break
+            sleep(pause_seconds)  # Yield the write lock to the other writers
+
+        return deleted_count, estimate_cs_telemetry_count(db_file)
     except Exception as e:
         logger.error(f"Exception during delete_database_cs_telemetry: {e}")
-        return 0, 0
+        return deleted_count, 0
 
 
-def ensure_station_profile_exists(pool_code: int, station_name: str, db_file: str = database_file):
-    """Inserts a default configuration profile if the station was deleted or is brand new."""
-    query = """
-        INSERT OR IGNORE INTO station_config (pool_code, station_name)
-        VALUES (?, ?);
+def incremental_vacuum_database(
+    db_file: str = database_file, pages_per_step: int = 1000, pause_seconds: float = 0.05
+) -> int:
+    """
+    Returns the free pages to the file system in small incremental_vacuum steps
+    (requires auto_vacuum = INCREMENTAL). Returns the number of reclaimed pages.
     """
+    reclaimed_pages: int = 0
     try:
-        with sqlite3.connect(db_file) as conn:
-            conn.execute(query, (pool_code, station_name))
-            conn.commit()
+        conn = get_connection(db_file)
+        free_pages: int = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        while free_pages > 0:
+            # ! executescript steps the PRAGMA to completion, execute would only free a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({pages_per_step});")
+            remaining_pages: int = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+            if remaining_pages >= free_pages:  # No progress, e.g. auto_vacuum is not INCREMENTAL
+                break
+
+            reclaimed_pages += free_pages - remaining_pages
+            free_pages = remaining_pages
+            sleep(pause_seconds)
+
+        return reclaimed_pages
     except Exception as e:
-        logger.error(f"Error auto-provisioning station profile: {e}")
+        logger.error(f"Exception during incremental_vacuum_database: {e}")
+        return reclaimed_pages
 
 
 def delete_station_from_db(pool_code: int, station_name: str, db_file: str = database_file) -> bool:
@@ -416,7 +1249,7 @@ def delete_station_from_db(pool_code: int, station_name: str, db_file: str = dat
     delete_status_query = "DELETE FROM connector_status WHERE pool_code = ? AND station_name = ?;"
 
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             cursor = conn.cursor()
 
             # Delete the station configuration
@@ -439,7 +1272,7 @@ def get_max_pool_code(db_file: str = database_file) -> Optional[int]:
     """Retrieves the highest existing pool_code in the local database, or None if empty."""
     query = "SELECT MAX(pool_code) FROM tagoio_device;"
     try:
-        with sqlite3.connect(db_file) as conn:
+        with get_connection(db_file) as conn:
             return conn.execute(query).fetchone()[0]
     except Exception as e:
         logger.error(f"Exception fetching max pool code: {e}")
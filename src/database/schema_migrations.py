@@ -0,0 +1,88 @@
+"""
+Versioned schema migrations, keyed on PRAGMA user_version. Each migration step
+has a version number, and the database stores the version of the last applied
+step, so a startup with an up-to-date schema is a single PRAGMA read. Pending
+steps are applied in order within one transaction (DDL is transactional in
+SQLite), and the user_version is bumped in the same transaction. Heavy steps
+(e.g. index builds on large tables) can be flagged to run in the background,
+each one in its own transaction, after the application has started.
+"""
+
+import sqlite3
+from collections.abc import Callable
+from itertools import takewhile
+from typing import NamedTuple
+
+from loguru import logger
+
+from database import database_file
+
+# ruff: noqa: BLE001
+
+
+class Migration(NamedTuple):
+    version: int  # Stored in PRAGMA user_version once applied, strictly increasing
+    description: str
+    apply: Callable[[sqlite3.Connection], None]  # Runs inside the migration transaction, must not commit
+    in_background: bool = False  # Heavy step, skipped by the startup run and applied by the background one
+
+
+def get_schema_version(db_file: str = database_file) -> int:
+    """Provides the version of the last migration applied to the database (0 for a new database)."""
+    try:
+        with sqlite3.connect(db_file) as conn:
+            return conn.execute("PRAGMA user_version;").fetchone()[0]
+    except Exception as e:
+        logger.error(f"Exception reading the schema version of {db_file}: {e}")
+        return 0
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: list[Migration]) -> int:
+    """Applies the migrations in a single transaction. Returns the new version, rolling back on error."""
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        for migration in migrations:
+            migration.apply(conn)
+            conn.execute(f"PRAGMA user_version = {migration.version};")
+        conn.execute("COMMIT;")
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+
+    for migration in migrations:
+        logger.info(f"Database Migration: Applied version {migration.version} ({migration.description}).")
+    return migrations[-1].version
+
+
+def run_migrations(migrations: list[Migration], db_file: str = database_file, include_background: bool = True) -> int:
+    """
+    Applies the pending migrations: the leading foreground steps in one transaction and,
+    if include_background, the remaining steps (each background step in its own transaction).
+    As user_version is linear, the steps after a pending background step wait for it.
+    Returns the schema version after the run.
+    """
+    version = get_schema_version(db_file)
+    pending = [migration for migration in migrations if migration.version > version]
+    if not pending:
+        if version > migrations[-1].version:
+            logger.warning(f"Database schema version {version} is newer than this release ({migrations[-1].version}).")
+        return version
+
+    try:
+        conn = sqlite3.connect(db_file, isolation_level=None, timeout=30)  # Explicit transactions, waits for writers
+        try:
+            while pending:
+                if pending[0].in_background and not include_background:
+                    logger.info(f"Database Migration: {len(pending)} steps deferred to the background run.")
+                    break
+
+                # The leading foreground steps together, or a single background step
+                batch = list(takewhile(lambda migration: not migration.in_background, pending)) or pending[:1]
+                version = apply_migrations(conn, batch)
+                pending = pending[len(batch) :]
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"Exception during the database migration to version {pending[0].version}: {e}")
+
+    return version
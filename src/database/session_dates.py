@@ -0,0 +1,50 @@
+"""
+Normalized epochs of the charging session history. The CSMS reports the session
+start as a DD/MM/YYYY start_date and a HH:MM - HH:MM time_band, in local time,
+which can not be range-filtered by an index. Their epoch seconds are stored in
+the start_ts and end_ts columns of charging_session_history.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from pytz import timezone as pytz_timezone
+
+sessions_timezone = pytz_timezone("Europe/Madrid")  # Local time of the start_date and time_band values
+
+
+def get_local_epoch(local_datetime: datetime) -> int:
+    """Converts a naive local datetime (sessions_timezone) to epoch seconds."""
+    return int(sessions_timezone.localize(local_datetime).timestamp())
+
+
+def get_session_epochs(start_date: str, time_band: Optional[str]) -> tuple[Optional[int], Optional[int]]:
+    """
+    Provides the (start_ts, end_ts) epoch seconds of a session, from its start_date and time_band.
+    An end time earlier than the start time ends on the next day. Unparseable values give None.
+    """
+    try:
+        start_time, end_time = [part.strip() for part in (time_band or "").split("-")]
+        session_day = datetime.strptime(start_date, "%d/%m/%Y")
+        start_dt = datetime.combine(session_day, datetime.strptime(start_time, "%H:%M").time())
+        end_dt = datetime.combine(session_day, datetime.strptime(end_time, "%H:%M").time())
+    except ValueError:
+        return None, None
+
+    if end_dt < start_dt:  # Crossed midnight
+        end_dt += timedelta(days=1)
+    return get_local_epoch(start_dt), get_local_epoch(end_dt)
+
+
+def get_day_range_epochs(start_day: Optional[str], end_day: Optional[str]) -> tuple[Optional[int], Optional[int]]:
+    """
+    Converts an inclusive range of days (YYYY-MM-DD, local time) to the half-open
+    [start, end) epoch seconds range compared with start_ts. Missing days stay None.
+    """
+    start_epoch = end_epoch = None
+    if start_day is not None:
+        start_epoch = get_local_epoch(datetime.combine(date.fromisoformat(start_day), datetime.min.time()))
+    if end_day is not None:
+        next_day = date.fromisoformat(end_day) + timedelta(days=1)
+        end_epoch = get_local_epoch(datetime.combine(next_day, datetime.min.time()))
+    return start_epoch, end_epoch
@@ -0,0 +1,169 @@
+"""
+Write-behind buffer for the charging session telemetry. Meter ticks are kept
+in memory and stored with a single executemany transaction (group commit),
+either when max_rows are pending or when the oldest row has waited for
+max_latency_ms, instead of one INSERT and one commit for each tick.
+"""
+
+import asyncio
+from time import monotonic, perf_counter
+from typing import Any, Optional
+
+from loguru import logger
+
+from config import telemetry_flush_ms, telemetry_flush_rows
+from database import database_file
+from database.async_database import async_database
+from database.query_database import get_telemetry_row, insert_charging_session_telemetry_batch
+from database.telemetry_packing import timestamp_to_epoch_ms
+from schemas.ocpp_csms import ChargingSessionUpdate
+
+
+def is_later_row(row: tuple, other_row: Optional[tuple]) -> bool:
+    """Tells whether a telemetry row is later than another one, or there is no other one."""
+    return other_row is None or timestamp_to_epoch_ms(row[1]) > timestamp_to_epoch_ms(other_row[1])
+
+
+class TelemetryWriteBuffer:
+    def __init__(
+        self,
+        max_rows: int = 200,
+        max_latency_ms: int = 2000,
+        db_file: str = database_file,
+        max_idle_seconds: int = 24 * 60 * 60,
+    ):
+        self.max_rows = max_rows
+        self.max_latency_ms = max_latency_ms
+        self.db_file = db_file
+        self.max_idle_seconds = max_idle_seconds
+
+        # Pending rows by (transaction_id, timestamp), so duplicated ticks never reach SQLite
+        self.pending_rows: dict[tuple[int, str], tuple] = {}
+        # Last flushed row by transaction_id, to also drop re-sent ticks after a flush, and to compute
+        # the rollup deltas of the next flush without reading the previous tick back from SQLite
+        self.last_flushed_rows: dict[int, tuple] = {}
+        # Last flush time (monotonic) by transaction_id, to forget the sessions that stopped sending ticks
+        self.last_flush_times: dict[int, float] = {}
+
+        self.flush_lock = asyncio.Lock()
+        self.flush_event = asyncio.Event()
+        self._is_running = False
+
+        # Counters to tune max_rows and max_latency_ms
+        self.flush_count: int = 0
+        self.flushed_rows: int = 0
+        self.dropped_duplicates: int = 0
+        self.last_flush_size: int = 0
+        self.last_flush_ms: float = 0.0
+
+    def add(self, update: ChargingSessionUpdate) -> bool:
+        """Buffers the telemetry of a charging session update. Returns False for duplicated ticks."""
+        search_key = (update.transaction_id, update.last_meter_ts)
+        last_flushed_row = self.last_flushed_rows.get(update.transaction_id)
+        if search_key in self.pending_rows or (last_flushed_row and last_flushed_row[1] == update.last_meter_ts):
+            self.dropped_duplicates += 1
+            return False
+
+        self.pending_rows[search_key] = get_telemetry_row(update)
+        if len(self.pending_rows) >= self.max_rows:
+            self.flush_event.set()  # Wake up the background loop to flush right away
+        return True
+
+    def forget_transaction(self, transaction_id: int):
+        """Drops the duplicate tracking of a finished charging session."""
+        self.last_flushed_rows.pop(transaction_id, None)
+        self.last_flush_times.pop(transaction_id, None)
+
+    def forget_idle_transactions(self, now: float) -> int:
+        """
+        Drops the duplicate tracking of the transactions without a flushed tick for max_idle_seconds, e.g. the
+        sessions whose COMPLETED update never arrived. Returns the number of forgotten transactions.
+        """
+        idle_transaction_ids = [
+            transaction_id
+            for transaction_id, flush_time in self.last_flush_times.items()
+            if now - flush_time > self.max_idle_seconds
+        ]
+        for transaction_id in idle_transaction_ids:
+            self.forget_transaction(transaction_id)
+        return len(idle_transaction_ids)
+
+    async def flush(self) -> int:
+        """Stores all the pending rows in a single transaction. Returns the number of flushed rows."""
+        async with self.flush_lock:
+            if not self.pending_rows:
+                return 0
+
+            pending_rows, self.pending_rows = self.pending_rows, {}
+            rows = list(pending_rows.values())
+
+            previous_rows = {
+                transaction_id: self.last_flushed_rows[transaction_id]
+                for transaction_id, _ in pending_rows
+                if transaction_id in self.last_flushed_rows
+            }
+
+            start_time = perf_counter()
+            result_ok = await async_database.run_write(
+                insert_charging_session_telemetry_batch, rows, self.db_file, previous_rows
+            )
+            elapsed_ms = (perf_counter() - start_time) * 1000
+
+            if not result_ok:  # Keep the rows for the next flush, without overwriting newer ones
+                for search_key, row in pending_rows.items():
+                    self.pending_rows.setdefault(search_key, row)
+                return 0
+
+            flush_time = monotonic()
+            for row in rows:  # The latest flushed row of each transaction: a late tick does not replace it
+                self.last_flush_times[row[0]] = flush_time
+                if is_later_row(row, self.last_flushed_rows.get(row[0])):
+                    self.last_flushed_rows[row[0]] = row
+            self.forget_idle_transactions(flush_time)
+
+            self.flush_count += 1
+            self.flushed_rows += len(rows)
+            self.last_flush_size = len(rows)
+            self.last_flush_ms = elapsed_ms
+            logger.debug(f"Flushed {len(rows)} telemetry rows in {elapsed_ms:.1f} ms")
+            return len(rows)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Provides the buffer settings and counters."""
+        return {
+            "max_rows": self.max_rows,
+            "max_latency_ms": self.max_latency_ms,
+            "pending_rows": len(self.pending_rows),
+            "tracked_transactions": len(self.last_flushed_rows),
+            "flush_count": self.flush_count,
+            "flushed_rows": self.flushed_rows,
+            "dropped_duplicates": self.dropped_duplicates,
+            "last_flush_size": self.last_flush_size,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+    async def run(self):
+        """Flushes the buffer each max_latency_ms, or earlier when max_rows are pending."""
+        self._is_running = True
+        while self._is_running:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=self.max_latency_ms / 1000)
+            except TimeoutError:
+                pass
+
+            self.flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Error flushing the telemetry buffer: {e}")
+
+    async def stop(self):
+        """Stops the background loop and flushes the remaining rows."""
+        self._is_running = False
+        self.flush_event.set()
+        flushed_rows = await self.flush()
+        logger.info(f"Telemetry buffer stopped, {flushed_rows} rows flushed at shutdown. Stats: {self.get_stats()}")
+
+
+# Global singleton instance, flushed by the FastAPI lifespan handler
+telemetry_buffer = TelemetryWriteBuffer(telemetry_flush_rows, telemetry_flush_ms)
@@ -0,0 +1,156 @@
+"""
+Compact binary encoding for the telemetry of completed charging sessions.
+All the ticks of a session are stored as a single zlib compressed blob of
+delta-encoded arrays: epoch offsets, meter deltas, power, cost, tariff band
+codes and the deltas of the cumulative energy of each band. The ticks of the
+ongoing sessions are stored one per row, with an integer epoch and band code.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from itertools import accumulate
+
+# ? Version byte, size of the band table (bytes) and number of ticks
+header_format: str = "<BHI"
+header_size: int = struct.calcsize(header_format)
+packing_version: int = 1
+
+# Typecodes of the packed arrays, in storage order (all little-endian)
+offsets_typecode: str = "q"
+meter_typecode: str = "q"
+power_typecode: str = "q"
+cost_typecode: str = "d"
+band_typecode: str = "B"
+energy_typecode: str = "q"
+
+
+def timestamp_to_epoch_ms(timestamp: str) -> int:
+    """Converts an ISO timestamp (naive ones are considered UTC) to epoch milliseconds."""
+    dt_obj = datetime.fromisoformat(timestamp)
+    if dt_obj.tzinfo is None:
+        dt_obj = dt_obj.replace(tzinfo=UTC)
+    return round(dt_obj.timestamp() * 1000)
+
+
+def epoch_ms_to_timestamp(epoch_ms: int) -> str:
+    """Converts epoch milliseconds to an UTC ISO timestamp, with the 'Z' suffix used by the CSMS."""
+    dt_obj = datetime.fromtimestamp(epoch_ms / 1000, tz=UTC)
+    timespec = "seconds" if epoch_ms % 1000 == 0 else "milliseconds"
+    return dt_obj.isoformat(timespec=timespec).replace("+00:00", "Z")
+
+
+# Integer codes of the tariff bands in charging_session_telemetry_tick (0 for an unknown band)
+tariff_band_codes: dict[str, int] = {"Off-Peak": 1, "Flat": 2, "Peak": 3}
+tariff_band_names: dict[int, str] = {code: band_name for band_name, code in tariff_band_codes.items()}
+
+
+def get_tick_row(row: tuple) -> tuple:
+    """Converts a telemetry row (see get_telemetry_row) to a charging_session_telemetry_tick row."""
+    transaction_id, timestamp, meter_value, power, cost, band_name, *energies = row
+    band_code = tariff_band_codes.get(band_name, 0)
+    return (transaction_id, timestamp_to_epoch_ms(timestamp), meter_value, power, cost, band_code, *energies)
+
+
+def get_telemetry_row_from_tick(tick_row: tuple) -> tuple:
+    """Converts a charging_session_telemetry_tick row, without the transaction_id, back to a telemetry row."""
+    epoch_ms, meter_value, power, cost, band_code, *energies = tick_row
+    band_name = tariff_band_names.get(band_code, "Unknown")
+    return (epoch_ms_to_timestamp(epoch_ms), meter_value, power, cost, band_name, *energies)
+
+
+def delta_encode(values: list[int]) -> list[int]:
+    """Replaces each value by its difference with the previous one (the first one is kept, see accumulate)."""
+    return [value - previous for previous, value in zip([0] + values[:-1], values)]
+
+
+def array_to_bytes(typecode: str, values: list) -> bytes:
+    """Serializes the values as a little-endian array."""
+    values_array = array(typecode, values)
+    if sys.byteorder == "big":
+        values_array.byteswap()
+    return values_array.tobytes()
+
+
+def bytes_to_array(typecode: str, data: bytes, offset: int, count: int) -> tuple[array, int]:
+    """Deserializes count little-endian values from data[offset:]. Returns the values array and the next offset."""
+    values_array = array(typecode)
+    end = offset + count * values_array.itemsize
+    values_array.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        values_array.byteswap()
+    return values_array, end
+
+
+def pack_telemetry_rows(rows: list[tuple]) -> tuple[int, int, bytes]:
+    """
+    Packs telemetry rows, as returned by get_telemetry_for_session (ordered by timestamp):
+    (timestamp, meter_value, power, cost, current_tariff_band, energy_off_peak, energy_flat, energy_peak)
+    Returns tuple: (start_epoch_ms, tick_count, blob)
+    """
+    epochs = [timestamp_to_epoch_ms(row[0]) for row in rows]
+    start_epoch_ms = epochs[0] if epochs else 0
+
+    band_names: list[str] = list(dict.fromkeys(row[4] for row in rows))  # Ordered and unique
+    band_codes = {band_name: code for code, band_name in enumerate(band_names)}
+    band_table = "\n".join(band_names).encode("utf-8")
+
+    payload = b"".join(
+        [
+            struct.pack(header_format, packing_version, len(band_table), len(rows)),
+            band_table,
+            array_to_bytes(offsets_typecode, [epoch - start_epoch_ms for epoch in epochs]),
+            array_to_bytes(meter_typecode, delta_encode([row[1] for row in rows])),
+            array_to_bytes(power_typecode, [row[2] for row in rows]),
+            array_to_bytes(cost_typecode, [row[3] for row in rows]),
+            array_to_bytes(band_typecode, [band_codes[row[4]] for row in rows]),
+            array_to_bytes(energy_typecode, delta_encode([row[5] for row in rows])),
+            array_to_bytes(energy_typecode, delta_encode([row[6] for row in rows])),
+            array_to_bytes(energy_typecode, delta_encode([row[7] for row in rows])),
+        ]
+    )
+    return start_epoch_ms, len(rows), zlib.compress(payload)
+
+
+def iter_telemetry_blob(start_epoch_ms: int, blob: bytes) -> Iterator[tuple]:
+    """
+    Yields the telemetry rows packed by pack_telemetry_rows, with the same tuple layout. Only the
+    compact arrays are kept in memory, the row tuples are built one by one.
+    """
+    payload = zlib.decompress(blob)
+    version, band_table_size, count = struct.unpack_from(header_format, payload)
+    if version != packing_version:
+        raise ValueError(f"Unsupported telemetry packing version: {version}")
+
+    offset = header_size + band_table_size
+    band_table = payload[header_size:offset].decode("utf-8")
+    band_names = band_table.split("\n") if count else []
+
+    offsets, offset = bytes_to_array(offsets_typecode, payload, offset, count)
+    meter_deltas, offset = bytes_to_array(meter_typecode, payload, offset, count)
+    powers, offset = bytes_to_array(power_typecode, payload, offset, count)
+    costs, offset = bytes_to_array(cost_typecode, payload, offset, count)
+    band_codes, offset = bytes_to_array(band_typecode, payload, offset, count)
+    off_peak_deltas, offset = bytes_to_array(energy_typecode, payload, offset, count)
+    flat_deltas, offset = bytes_to_array(energy_typecode, payload, offset, count)
+    peak_deltas, offset = bytes_to_array(energy_typecode, payload, offset, count)
+    del payload
+
+    yield from zip(
+        (epoch_ms_to_timestamp(start_epoch_ms + tick_offset) for tick_offset in offsets),
+        accumulate(meter_deltas),
+        powers,
+        costs,
+        (band_names[code] for code in band_codes),
+        accumulate(off_peak_deltas),
+        accumulate(flat_deltas),
+        accumulate(peak_deltas),
+    )
+
+
+def unpack_telemetry_blob(start_epoch_ms: int, blob: bytes) -> list[tuple]:
+    """Restores the telemetry rows packed by pack_telemetry_rows, with the same tuple layout."""
+    return list(iter_telemetry_blob(start_epoch_ms, blob))
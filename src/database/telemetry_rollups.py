@@ -0,0 +1,111 @@
+"""
+Per-minute and per-hour rollups of the charging session telemetry, so that the
+long-term power and energy curves survive the pruning of the raw meter ticks.
+Each bucket keeps the power min/max/sum (average = sum / sample_count) and the
+energy and cost consumed in each tariff band since the previous tick.
+"""
+
+from typing import Optional
+
+from database.telemetry_packing import timestamp_to_epoch_ms
+
+# ? Bucket size in milliseconds, by rollup table
+rollup_tables: dict[str, int] = {
+    "charging_session_telemetry_minute": 60_000,
+    "charging_session_telemetry_hour": 3_600_000,
+}
+
+# Column suffix for each tariff band, as in ChargingSessionUpdate.current_tariff_band
+band_suffixes: dict[str, str] = {"Off-Peak": "off_peak", "Flat": "flat", "Peak": "peak"}
+
+# Order of the aggregated values of a bucket, after (transaction_id, bucket_start_ms)
+rollup_columns: tuple[str, ...] = (
+    "sample_count",
+    "power_min",
+    "power_max",
+    "power_sum",
+    "energy_off_peak",
+    "energy_flat",
+    "energy_peak",
+    "cost_off_peak",
+    "cost_flat",
+    "cost_peak",
+)
+
+
+def get_tick_values(row: tuple, previous_row: Optional[tuple]) -> list:
+    """
+    Provides the rollup values of a single telemetry row (see get_telemetry_row), with the
+    cumulative energy and cost converted to deltas from the previous tick of the session.
+    Negative deltas (counter resets) are dropped, and the cost is assigned to the tick band.
+    """
+    _, _, _, power, cost, band, energy_off_peak, energy_flat, energy_peak = row
+    if previous_row is None:  # First tick of the session, the cumulative values start at zero
+        previous_row = (None, None, None, 0, 0.0, None, 0, 0, 0)
+
+    cost_delta = max(0.0, cost - previous_row[4])
+    costs = [cost_delta if band_suffixes.get(band) == suffix else 0.0 for suffix in band_suffixes.values()]
+    return [
+        1,
+        power,
+        power,
+        power,
+        max(0, energy_off_peak - previous_row[6]),
+        max(0, energy_flat - previous_row[7]),
+        max(0, energy_peak - previous_row[8]),
+        *costs,
+    ]
+
+
+def merge_bucket_values(bucket: list, values: list) -> list:
+    """Adds the values of a tick (or another bucket) to a bucket."""
+    return [
+        bucket[0] + values[0],
+        min(bucket[1], values[1]),
+        max(bucket[2], values[2]),
+        *(total + value for total, value in zip(bucket[3:], values[3:])),
+    ]
+
+
+def get_rollup_buckets(
+    rows: list[tuple], previous_rows: dict[int, tuple], duplicated_rows: Optional[list[tuple]] = None
+) -> dict[str, list[tuple]]:
+    """
+    Aggregates new telemetry rows into the buckets of each rollup table.
+    previous_rows holds the last stored tick (before the new rows) of each transaction_id.
+    duplicated_rows were already stored: they are not aggregated, but the deltas of the
+    following rows are computed from them.
+    Returns the (transaction_id, bucket_start_ms, *rollup_columns) rows by rollup table.
+    """
+    skipped_rows = set(duplicated_rows or [])
+    buckets: dict[str, dict[tuple[int, int], list]] = {table_name: {} for table_name in rollup_tables}
+    previous_rows = dict(previous_rows)
+    for row in sorted([*rows, *skipped_rows], key=lambda row: (row[0], timestamp_to_epoch_ms(row[1]))):
+        transaction_id, epoch_ms = row[0], timestamp_to_epoch_ms(row[1])
+        values = get_tick_values(row, previous_rows.get(transaction_id))
+        previous_rows[transaction_id] = row
+        if row in skipped_rows:
+            continue
+
+        for table_name, bucket_ms in rollup_tables.items():
+            search_key = (transaction_id, epoch_ms - epoch_ms % bucket_ms)
+            bucket = buckets[table_name].get(search_key)
+            buckets[table_name][search_key] = values if bucket is None else merge_bucket_values(bucket, values)
+
+    return {
+        table_name: [(*search_key, *values) for search_key, values in table_buckets.items()]
+        for table_name, table_buckets in buckets.items()
+    }
+
+
+def get_rollup_upsert_query(table_name: str) -> str:
+    """Provides the query merging the aggregated buckets into a rollup table."""
+    columns = ", ".join(rollup_columns)
+    placeholders = ", ".join("?" for _ in range(len(rollup_columns) + 2))
+    sum_columns = [column for column in rollup_columns if column not in ("power_min", "power_max")]
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in sum_columns)
+    return f"""
+        INSERT INTO {table_name} (transaction_id, bucket_start_ms, {columns}) VALUES ({placeholders})
+        ON CONFLICT(transaction_id, bucket_start_ms) DO UPDATE SET
+        power_min = MIN(power_min, excluded.power_min), power_max = MAX(power_max, excluded.power_max), {updates};
+    """
@@ -1,27 +1,65 @@
+import csv
+from collections.abc import Iterable, Iterator
 from datetime import datetime
-from io import BytesIO
+from io import BytesIO, StringIO
 
 import openpyxl
-from openpyxl.cell.cell import Cell
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font, PatternFill
 from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.worksheet import Worksheet
+
+# Column headers of the CSV exports, in the row layout of the query_database functions
+telemetry_csv_headers: list[str] = [
+    "timestamp",
+    "meter_value",
+    "power",
+    "cost",
+    "current_tariff_band",
+    "energy_off_peak",
+    "energy_flat",
+    "energy_peak",
+]
+pool_sessions_csv_headers: list[str] = [
+    "created_at",
+    "pool_code",
+    "station_name",
+    "connector_id",
+    "card_alias",
+    "start_date",
+    "time_band",
+    "start_meter_value",
+    "last_meter_value",
+    "cost",
+]
+
+
+def iter_csv_chunks(headers: list[str], rows: Iterable[tuple], rows_per_chunk: int = 500) -> Iterator[str]:
+    """Yields a CSV document in chunks of rows_per_chunk rows, as the rows are consumed (for a StreamingResponse)."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
 
 
 # Note: #00571B is a dark forest green that provides good contrast with white text
 def generate_telemetry_excel(
-    session: dict, telemetry_data: list[tuple], text_color: str = "FFFFFF", fill_color: str = "00571B"
+    session: dict, telemetry_data: Iterable[tuple], text_color: str = "FFFFFF", fill_color: str = "00571B"
 ) -> BytesIO:
-    """Generates an XLSX file containing session metadata and tick-by-tick telemetry."""
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
-    # Strict type narrowing for the worksheet
-    if not isinstance(ws, Worksheet):
-        ws = wb.create_sheet()
-
+    """
+    Generates an XLSX file containing session metadata and tick-by-tick telemetry. The workbook is
+    write-only: the telemetry rows are written as they are consumed (e.g. from iter_telemetry_for_session),
+    so the memory use does not grow with the session length. Rows are written top to bottom.
+    """
+    wb = openpyxl.Workbook(write_only=True)
     transaction_id = session["transaction_id"]
-    ws.title = f"Audit_{transaction_id}"
+    ws = wb.create_sheet(title=f"Audit_{transaction_id}")
 
     # Styling elements
     title_font = Font(bold=True, size=14, color=text_color)
@@ -31,51 +69,60 @@ def generate_telemetry_excel(
     meta_label_font = Font(bold=True)
     center_align = Alignment(horizontal="center", vertical="center")
 
+    def styled_cell(value, font: Font, fill=None, alignment=None) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if alignment is not None:
+            cell.alignment = alignment
+        return cell
+
+    def label(value: str) -> WriteOnlyCell:
+        return styled_cell(value, meta_label_font)
+
+    # Column widths must be set before the first row of a write-only sheet
+    for col in range(1, 10):
+        ws.column_dimensions[get_column_letter(col)].width = 20
+
     # * 1. SUMMARY METADATA TABLE (Rows 1-5)
-    ws.merge_cells("A1:I1")
-    ws["A1"] = f"Velo Energy: Charging Session Audit Report - Transaction {transaction_id}"
-    ws["A1"].font = title_font
-    ws["A1"].fill = title_fill
-    ws["A1"].alignment = center_align
+    ws.merged_cells.add("A1:I1")
+    title = f"Velo Energy: Charging Session Audit Report - Transaction {transaction_id}"
+    ws.append([styled_cell(title, title_font, title_fill, center_align)])
 
     # Row 2: Station Data
-    ws["A2"] = "Station:"
-    ws["B2"] = f"{session['pool_code']} / {session['station_name']} [Conn: {session['connector_id']}]"
-    ws["C2"] = "Start Date:"
-    ws["D2"] = session["start_date"]
-    ws["E2"] = "Charging Interval:"
-    ws["F2"] = session["time_band"]
+    station = f"{session['pool_code']} / {session['station_name']} [Conn: {session['connector_id']}]"
+    ws.append(
+        [
+            label("Station:"),
+            station,
+            label("Start Date:"),
+            session["start_date"],
+            label("Charging Interval:"),
+            session["time_band"],
+        ]
+    )
 
     # Row 3: Frozen Rates
-    ws["A3"] = "Rates (€/kWh):"
-    ws["B3"] = f"Valle: {session['rate_off_peak']:.4f} €"
-    ws["C3"] = f"Llano: {session['rate_flat']:.4f} €"
-    ws["D3"] = f"Punta: {session['rate_peak']:.4f} €"
+    ws.append(
+        [
+            label("Rates (€/kWh):"),
+            f"Valle: {session['rate_off_peak']:.4f} €",
+            f"Llano: {session['rate_flat']:.4f} €",
+            f"Punta: {session['rate_peak']:.4f} €",
+        ]
+    )
 
     # Row 4: Final Aggregated Totals
-    ws["A4"] = "Final Energy:"
-    ws["B4"] = f"{session['total_energy_kwh']:.3f} kWh"
-    ws["C4"] = "Final Cost:"
-    ws["D4"] = f"{session['cost']:.2f} €"
-
-    # Apply bold labels to metadata (using strict type checks)
-    for r in range(2, 5):
-        # Column 1 always contains a label (A2, A3, A4)
-        cell_1 = ws.cell(row=r, column=1)
-        if isinstance(cell_1, Cell):
-            cell_1.font = meta_label_font
-
-        # Column 3 contains a label ONLY for rows 2 and 4 (C2, C4)
-        if r in [2, 4]:
-            cell_3 = ws.cell(row=r, column=3)
-            if isinstance(cell_3, Cell):
-                cell_3.font = meta_label_font
-
-        # Column 5 contains a label ONLY for row 2 (E2)
-        if r == 2:
-            cell_5 = ws.cell(row=r, column=5)
-            if isinstance(cell_5, Cell):
-                cell_5.font = meta_label_font
+    ws.append(
+        [
+            label("Final Energy:"),
+            f"{session['total_energy_kwh']:.3f} kWh",
+            label("Final Cost:"),
+            f"{session['cost']:.2f} €",
+        ]
+    )
+    ws.append([])  # Row 5: Spacer
 
     # * 2. TELEMETRY TIME-SERIES TABLE (Row 7+)
     headers = [
@@ -91,17 +138,7 @@ def generate_telemetry_excel(
     ]
 
     header_row = 6
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=header_row, column=col)
-
-        # Strict type narrowing for the header cells
-        if isinstance(cell, Cell):
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = center_align
-
-        ws.column_dimensions[get_column_letter(col)].width = 20
+    ws.append([styled_cell(header, header_font, header_fill, center_align) for header in headers])
 
     # Extract rates to simplify the calculation loop
     rates = {"off_peak": session["rate_off_peak"], "flat": session["rate_flat"], "peak": session["rate_peak"]}
@@ -110,7 +147,7 @@ def generate_telemetry_excel(
     band_translation = {"Off-Peak": "Valle", "Flat": "Llano", "Peak": "Punta"}
 
     # Append data and calculate Evaluated Cost
-    current_row = header_row + 1
+    current_row = header_row
     for row_data in telemetry_data:
         raw_timestamp = row_data[0]
 
@@ -141,9 +178,13 @@ def generate_telemetry_excel(
             + (cum_peak / 1000.0 * rates["peak"])
         )
 
+        # Apply specific datetime formatting to the Timestamp column
+        date_cell = WriteOnlyCell(ws, value=dt_val)
+        date_cell.number_format = "yyyy-mm-dd hh:mm:ss"
+
         ws.append(
             [
-                dt_val,
+                date_cell,
                 meter_val,
                 power,
                 reported_cost,
@@ -155,16 +196,11 @@ def generate_telemetry_excel(
             ]
         )  # Retain 4 decimal precision for debugging evaluated_cost
 
-        # Apply specific datetime formatting to the Timestamp column
-        date_cell = ws.cell(row=current_row, column=1)
-        if isinstance(date_cell, Cell):
-            date_cell.number_format = "yyyy-mm-dd hh:mm:ss"
-
         current_row += 1
 
     # * 3. EXCEL AUTO-FILTER
-    # Enable filtering on the headers row (Row 6) down to the max row
-    ws.auto_filter.ref = f"A{header_row}:I{ws.max_row}"
+    # Enable filtering on the headers row (Row 6) down to the last written row
+    ws.auto_filter.ref = f"A{header_row}:I{current_row}"
 
     stream = BytesIO()
     wb.save(stream)
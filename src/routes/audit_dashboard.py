@@ -1,35 +1,142 @@
-from fastapi import APIRouter, Depends, Request, HTTPException
-from fastapi.templating import Jinja2Templates
+from datetime import date
+from itertools import chain
+from typing import Literal, Optional
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from database.query_database import get_recent_sessions, get_session_history, get_telemetry_for_session
-from export_utils import generate_telemetry_excel
+from fastapi.templating import Jinja2Templates
+
+from database.async_database import async_database
+from database.query_database import (
+    get_daily_pool_stats,
+    get_session_history,
+    get_sessions_page,
+    get_station_stats_summary,
+    get_telemetry_rollups,
+    iter_charging_sessions_from_pool_code,
+    iter_telemetry_for_session,
+)
+from export_utils import generate_telemetry_excel, iter_csv_chunks, pool_sessions_csv_headers, telemetry_csv_headers
 from security import check_admin_credentials
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
 
-@router.get("/emsp-dashboard/audits", dependencies=[Depends(check_admin_credentials)])
-async def render_global_audit_dashboard(request: Request):
-    """Renders the audit dashboard with the latest charging sessions."""
-    recent_sessions = get_recent_sessions(limit=100)
+# Sessions per page of the audit dashboard, further pages are loaded by HTMX infinite scroll
+audit_page_size: int = 50
+
+
+async def get_audit_page(
+    pool_code: Optional[int],
+    filters: dict[str, Optional[str]],
+    cursor: Optional[tuple[str, int, int]] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """Fetches a page of sessions. Returns the sessions and the URL of the next page partial, if any."""
+    sessions, next_cursor = await async_database.run_read(
+        get_sessions_page, audit_page_size, cursor, pool_code, **filters
+    )
+    if next_cursor is None:
+        return sessions, None
+
+    query_params = {key: value for key, value in filters.items() if value}
+    if pool_code is not None:
+        query_params["pool_code"] = pool_code
+    query_params.update(zip(["before_created_at", "before_transaction_id", "before_row_id"], next_cursor))
+    return sessions, f"/partial/audit-sessions?{urlencode(query_params)}"
+
+
+def parse_filter_day(day: Optional[str]) -> Optional[str]:
+    """Validates a YYYY-MM-DD day of the filter form, which submits empty fields as empty strings."""
+    if not day:
+        return None
+    try:
+        return date.fromisoformat(day).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid day: {day}")
+
+
+def get_audit_filters(
+    station_name: Optional[str], card_alias: Optional[str], start_day: Optional[str], end_day: Optional[str]
+) -> dict[str, Optional[str]]:
+    """Provides the get_sessions_page filters, ignoring the empty fields of the filter form."""
+    return {
+        "station_name": station_name or None,
+        "card_alias": card_alias or None,
+        "start_day": parse_filter_day(start_day),
+        "end_day": parse_filter_day(end_day),
+    }
+
+
+async def render_audit_dashboard(request: Request, pool_code: Optional[int], filters: dict[str, Optional[str]]):
+    """Renders the audit dashboard with the first page of sessions and the station stats."""
+    sessions, next_page_url = await get_audit_page(pool_code, filters)
+    station_stats = await async_database.run_read(get_station_stats_summary, pool_code=pool_code, days=30)
 
     return templates.TemplateResponse(
         request=request,
         name="audit-dashboard.html",
-        context={"request": request, "sessions": recent_sessions},
+        context={
+            "request": request,
+            "sessions": sessions,
+            "next_page_url": next_page_url,
+            "filters": filters,
+            "pool_code": pool_code,
+            "station_stats": station_stats,
+        },
     )
 
 
+@router.get("/emsp-dashboard/audits", dependencies=[Depends(check_admin_credentials)])
+async def render_global_audit_dashboard(
+    request: Request,
+    station_name: Optional[str] = None,
+    card_alias: Optional[str] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+):
+    """Renders the audit dashboard with the latest charging sessions."""
+    filters = get_audit_filters(station_name, card_alias, start_day, end_day)
+    return await render_audit_dashboard(request, None, filters)
+
+
 @router.get("/emsp-dashboard/audits/{pool_code}", dependencies=[Depends(check_admin_credentials)])
-async def render_pool_audit_dashboard(request: Request, pool_code: int):
+async def render_pool_audit_dashboard(
+    request: Request,
+    pool_code: int,
+    station_name: Optional[str] = None,
+    card_alias: Optional[str] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+):
     """Renders the audit dashboard with the latest charging sessions for a specific pool."""
-    recent_sessions = get_recent_sessions(limit=100, pool_code=pool_code)
+    filters = get_audit_filters(station_name, card_alias, start_day, end_day)
+    return await render_audit_dashboard(request, pool_code, filters)
+
+
+@router.get("/partial/audit-sessions", dependencies=[Depends(check_admin_credentials)])
+async def render_audit_sessions_page(
+    request: Request,
+    before_created_at: str,
+    before_transaction_id: int,
+    before_row_id: int,
+    pool_code: Optional[int] = None,
+    station_name: Optional[str] = None,
+    card_alias: Optional[str] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+):
+    """Renders the next page of session rows (keyset pagination), for the HTMX infinite scroll."""
+    filters = get_audit_filters(station_name, card_alias, start_day, end_day)
+    sessions, next_page_url = await get_audit_page(
+        pool_code, filters, (before_created_at, before_transaction_id, before_row_id)
+    )
 
     return templates.TemplateResponse(
         request=request,
-        name="audit-dashboard.html",
-        context={"request": request, "sessions": recent_sessions},
+        name="partials/audit-session-rows.html",
+        context={"request": request, "sessions": sessions, "next_page_url": next_page_url},
     )
 
 
@@ -38,19 +145,76 @@ async def export_session_audit(transaction_id: int):
     """Generates an XLSX file containing session metadata and tick-by-tick telemetry."""
 
     # 1. Fetch metadata (frozen rates, final totals)
-    session_metadata = get_session_history(transaction_id)
+    session_metadata = await async_database.run_read(get_session_history, transaction_id)
     if not session_metadata:
         raise HTTPException(status_code=404, detail="No session metadata found for this transaction.")
 
-    # 2. Fetch the time-series arrays
-    telemetry_data = get_telemetry_for_session(transaction_id)
-    if not telemetry_data:
+    # 2. Stream the time-series rows, the first one tells if there is any
+    telemetry_rows = iter_telemetry_for_session(transaction_id)
+    first_row = await async_database.run_read(next, telemetry_rows, None)
+    if first_row is None:
         raise HTTPException(status_code=404, detail="No telemetry data found for this transaction.")
 
-    # 3. Generate the blob
-    excel_stream = generate_telemetry_excel(session_metadata, telemetry_data)
+    # 3. Generate the blob, consuming the rows in a reader thread
+    excel_stream = await async_database.run_read(
+        generate_telemetry_excel, session_metadata, chain([first_row], telemetry_rows)
+    )
 
     headers = {"Content-Disposition": f'attachment; filename="charging_session_audit_{transaction_id}.xlsx"'}
 
     media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     return StreamingResponse(excel_stream, media_type=media_type, headers=headers)
+
+
+@router.get("/api/export-telemetry/{transaction_id}", dependencies=[Depends(check_admin_credentials)])
+async def export_session_telemetry_csv(transaction_id: int):
+    """Streams the tick-by-tick telemetry of a session as CSV, read in batches while the response is sent."""
+    telemetry_rows = iter_telemetry_for_session(transaction_id)
+    first_row = await async_database.run_read(next, telemetry_rows, None)
+    if first_row is None:
+        raise HTTPException(status_code=404, detail="No telemetry data found for this transaction.")
+
+    csv_chunks = iter_csv_chunks(telemetry_csv_headers, chain([first_row], telemetry_rows))
+    headers = {"Content-Disposition": f'attachment; filename="charging_session_telemetry_{transaction_id}.csv"'}
+    return StreamingResponse(csv_chunks, media_type="text/csv", headers=headers)
+
+
+@router.get("/api/export-sessions/{pool_code}", dependencies=[Depends(check_admin_credentials)])
+async def export_pool_sessions_csv(pool_code: int, start_day: Optional[date] = None, end_day: Optional[date] = None):
+    """Streams the charging sessions of a pool as CSV, optionally within a range of session start days."""
+    session_rows = iter_charging_sessions_from_pool_code(
+        pool_code,
+        start_day=start_day.isoformat() if start_day else None,
+        end_day=end_day.isoformat() if end_day else None,
+    )
+    csv_chunks = iter_csv_chunks(pool_sessions_csv_headers, session_rows)
+    headers = {"Content-Disposition": f'attachment; filename="charging_sessions_{pool_code}.csv"'}
+    return StreamingResponse(csv_chunks, media_type="text/csv", headers=headers)
+
+
+@router.get("/api/telemetry-rollups/{transaction_id}", dependencies=[Depends(check_admin_credentials)])
+async def get_session_telemetry_rollups(transaction_id: int, resolution: Literal["minute", "hour"] = "minute"):
+    """Provides the per-minute or per-hour power and energy curve of a session, kept after the raw ticks are pruned."""
+    rollups = await async_database.run_read(get_telemetry_rollups, transaction_id, resolution)
+    if not rollups:
+        raise HTTPException(status_code=404, detail="No telemetry rollups found for this transaction.")
+
+    return {"transaction_id": transaction_id, "resolution": resolution, "buckets": rollups}
+
+
+@router.get("/api/pool-stats", dependencies=[Depends(check_admin_credentials)])
+async def get_pool_daily_stats(
+    pool_code: Optional[int] = None,
+    station_name: Optional[str] = None,
+    start_day: Optional[date] = None,
+    end_day: Optional[date] = None,
+):
+    """Provides the daily sessions, energy (Wh) per band and cost, by pool and station."""
+    daily_stats = await async_database.run_read(
+        get_daily_pool_stats,
+        pool_code=pool_code,
+        station_name=station_name,
+        start_day=start_day.isoformat() if start_day else None,
+        end_day=end_day.isoformat() if end_day else None,
+    )
+    return {"daily_stats": daily_stats}
@@ -4,10 +4,9 @@ from fastapi import APIRouter, Form, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
 from loguru import logger
 
-from schemas.analysis import VPOSStartEvent, VPOSStopEvent
-from data_handling import get_active_session, get_charge_point
-from database.query_database import get_noc_from_db
+from data_handling import get_active_session, get_charge_point, get_station_noc
 from enumerations import ChargePointStatus
+from schemas.analysis import VPOSStartEvent, VPOSStopEvent
 from schemas.ocpp_csms import PaymentAuthRequest
 from sse_broker import event_broker
 from tagoio.pool_setup_fetching import get_pool_config
@@ -37,7 +36,7 @@ async def render_public_dashboard(
 
     # URL parameter validation and boundary checks (FastAPI already validates types, e.g., ChargePointStatus)
     noc = max(1, noc)  # Ensure at least 1 connector
-    actual_noc = get_noc_from_db(station_name) or noc
+    actual_noc = get_station_noc(station_name) or noc
     cid = max(1, min(cid, actual_noc))  # Ensure the connector ID does not exceed the noc, but is at least 1
 
     # Safely attempt to convert the string to the Enum (avoids 'Input should be' errors and allows for graceful handling of invalid values)
@@ -0,0 +1,43 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.templating import Jinja2Templates
+
+from database.async_database import async_database
+from database.query_database import search_sessions
+from security import check_admin_credentials
+
+router = APIRouter()
+templates = Jinja2Templates(directory="templates")
+
+# The trigram full-text index only matches fragments of 3 or more characters
+min_search_length: int = 3
+
+
+@router.get("/api/search-sessions", dependencies=[Depends(check_admin_credentials)])
+async def search_session_history(
+    q: str = Query(min_length=min_search_length),
+    limit: int = Query(50, ge=1, le=500),
+    pool_code: Optional[int] = None,
+):
+    """Searches completed sessions by card alias, station name or transaction_id fragments."""
+    sessions = await async_database.run_read(search_sessions, q, limit, pool_code)
+    return {"query": q, "sessions": sessions}
+
+
+@router.get("/partial/audit-search", dependencies=[Depends(check_admin_credentials)])
+async def render_audit_search_results(request: Request, q: str = "", pool_code: Optional[int] = None):
+    """Renders the session rows matching the search box of the audit dashboard."""
+    search_text = q.strip()
+    if not search_text:  # Search box cleared, reload the paginated dashboard
+        return Response(headers={"HX-Refresh": "true"})
+
+    sessions = []
+    if len(search_text) >= min_search_length:
+        sessions = await async_database.run_read(search_sessions, search_text, 100, pool_code)
+
+    return templates.TemplateResponse(
+        request=request,
+        name="partials/audit-search-rows.html",
+        context={"request": request, "sessions": sessions, "search_text": search_text},
+    )
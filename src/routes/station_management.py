@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from loguru import logger
 
-from security import check_admin_credentials
-from database.query_database import delete_station_from_db
 from data_handling import remove_station_from_memory
+from database.async_database import async_database
+from database.query_database import delete_station_from_db
+from security import check_admin_credentials
 
 router = APIRouter()
 
@@ -13,7 +14,7 @@ async def delete_station(pool_code: int, station_name: str):
     """Deletes a charging station from the database and active memory."""
     try:
         # 1. Remove from SQLite Database
-        db_deleted = delete_station_from_db(pool_code, station_name)
+        db_deleted = await async_database.run_write(delete_station_from_db, pool_code, station_name)
 
         if not db_deleted:
             raise_detail: str = f"Station {station_name} not found in pool {pool_code}."
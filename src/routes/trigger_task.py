@@ -1,11 +1,16 @@
+import asyncio
+from typing import Annotated
+
 from fastapi import APIRouter, Depends
 from fastapi.security import HTTPBasic
-from typing import Annotated
 
 from config import version  # noqa: F401
+from database.database_backup import last_backup_stats
 from schedule_utils import conditional_database_backup
 from security import check_credentials
 from tagoio.data_deletion import all_pools_variable_cleanup, delete_variable_in_cloud
+from tagoio.outbox import tago_outbox
+from utils.circuit_breaker import tago_circuit_breakers
 
 router = APIRouter()
 security = HTTPBasic()
@@ -24,8 +29,14 @@ async def do_all_pools_cleanup(username: Annotated[str, Depends(check_credential
 @router.get("/{version}/trigger-task/backup-to-telegram")
 async def do_backup_to_telegram(username: Annotated[str, Depends(check_credentials)]):
     "Does a user triggered backup to Telegram of the service database file"
-    conditional_database_backup(True)
-    return {"message": "Backup to Telegram has been triggered"}
+    await asyncio.to_thread(conditional_database_backup, True)  # Snapshot and compression off the event loop
+    return {"message": "Backup to Telegram has been triggered", "backup_stats": last_backup_stats}
+
+
+@router.get("/{version}/trigger-task/tagoio-outbox")
+async def get_tagoio_outbox_stats(username: Annotated[str, Depends(check_credentials)]):
+    "Provides the depth of the TagoIO outbox (pending writes, by pool code), its counters and the failing pools"
+    return {"outbox_stats": tago_outbox.get_stats(), "circuit_breakers": tago_circuit_breakers.get_stats()}
 
 
 @router.delete("/{version}/trigger-task/single-variable/{pool_code}/{variable_name}")
@@ -1,15 +1,25 @@
 import asyncio
-import schedule
 from datetime import datetime
+from time import perf_counter, sleep
+
+import schedule
 from loguru import logger
 
-from config import service_name
+from config import minute_rollup_retention_days, service_name, telemetry_retention_days
 from database import table_names_to_modified_check
-from database.database_backup import zip_database_file, get_all_modified_rows_count
-from database.database_check import clear_modified_column
-from database.query_database import delete_database_cs_telemetry
+from database.database_backup import get_all_modified_rows_count, zip_database_file
+from database.database_check import clear_change_counter
+from database.query_database import (
+    analyze_cs_telemetry,
+    compact_session_telemetry,
+    delete_database_cs_telemetry,
+    delete_telemetry_rollups,
+    estimate_cs_telemetry_count,
+    get_uncompacted_session_ids,
+    incremental_vacuum_database,
+)
 from tagoio.check_data_amount import device_data_amount_check
-from telegram_utils import upload_document, append_doc_tuple, pending_document_generator
+from telegram_utils import append_doc_tuple, pending_document_generator, upload_document
 
 device_data_amount_check_is_due: bool = False
 
@@ -36,52 +46,100 @@ def monthly_database_backup():
     conditional_database_backup(True)
 
 
-def periodic_cs_telemetry_cleanup(days_threshold: int = 120):
-    """Manages the deletion of old records in the charging_session_telemetry table, to avoid DB bloat."""
-    deleted_count, remaining_count = delete_database_cs_telemetry(days_threshold=days_threshold)
-    logger.info(f"Deleted {deleted_count} telemetry records. {remaining_count} records remaining.")
+def periodic_cs_telemetry_cleanup(days_threshold: int = 120, report_every_chunks: int = 20):
+    """
+    Manages the deletion of old records in the charging session telemetry tables, to avoid DB bloat.
+    The long-term curves are kept by the rollup tables: per-minute ones have their own retention.
+    """
+    start_time = perf_counter()
+
+    def report_progress(deleted_count: int, processed_chunks: int):
+        if processed_chunks % report_every_chunks == 0:
+            elapsed = perf_counter() - start_time
+            logger.info(f"Telemetry cleanup in progress: {deleted_count} records deleted in {elapsed:.1f} s...")
+
+    deleted_count, _ = delete_database_cs_telemetry(days_threshold=days_threshold, progress_callback=report_progress)
+    delete_seconds = perf_counter() - start_time
+    analyze_cs_telemetry()  # Refreshes the statistics behind the remaining estimate, after the deletion
+    remaining_count = estimate_cs_telemetry_count()
+    logger.info(
+        f"Deleted {deleted_count} telemetry records in {delete_seconds:.1f} s. ~{remaining_count} records remaining."
+    )
+
+    deleted_buckets = delete_telemetry_rollups("minute", minute_rollup_retention_days)
+    retention = f"older than {minute_rollup_retention_days} days"
+    logger.info(f"Deleted {deleted_buckets} per-minute telemetry rollups {retention}.")
+
+    vacuum_start_time = perf_counter()
+    reclaimed_pages = incremental_vacuum_database()
+    vacuum_seconds = perf_counter() - vacuum_start_time
+    logger.info(f"Reclaimed {reclaimed_pages} free database pages in {vacuum_seconds:.1f} s.")
+
+
+def periodic_cs_telemetry_compaction(batch_size: int = 500, pause_seconds: float = 0.05):
+    """Packs the telemetry of completed sessions left uncompacted (older data, or failed compactions)."""
+    start_time = perf_counter()
+    compacted_sessions, compacted_rows = 0, 0
+    while session_ids := get_uncompacted_session_ids(batch_size):
+        batch_rows = [compact_session_telemetry(transaction_id) for transaction_id in session_ids]
+        if not any(batch_rows):  # No progress, avoid looping over the same failing sessions
+            break
+
+        compacted_sessions += len(session_ids)
+        compacted_rows += sum(batch_rows)
+        sleep(pause_seconds)  # Yield the write lock to the other writers
+
+    elapsed = perf_counter() - start_time
+    logger.info(f"Compacted {compacted_rows} telemetry records of {compacted_sessions} sessions in {elapsed:.1f} s.")
 
 
 def conditional_database_backup(force_backup: bool = False, table_names: list = table_names_to_modified_check):
     """Performs a database backup if there are modified rows in the specified tables."""
-    if not force_backup:
-        modified_rows_count: int = get_all_modified_rows_count(table_names)
-        if modified_rows_count == 0:
-            logger.info(f"No modified rows in the tracked tables for {service_name}.")
-            return
+    modified_rows_count: dict[str, int] = get_all_modified_rows_count(table_names)
+    if not force_backup and sum(modified_rows_count.values()) == 0:
+        logger.info(f"No modified rows in the tracked tables for {service_name}.")
+        return
 
     try:
-        backup_database_to_telegram()
-        for table_name in table_names:
-            clear_modified_column(table_name)
+        if not backup_database_to_telegram():
+            return
+
+        # Only the changes counted before the backup are cleared, later ones trigger the next backup
+        for table_name, backed_up_changes in modified_rows_count.items():
+            clear_change_counter(table_name, backed_up_changes)
 
         logger.info(f"Database backup completed for service: {service_name}.")
     except Exception as e:
         logger.error(f"Error during {service_name} database backup: {e}")
 
 
-def backup_database_to_telegram():
-    """Zips the local database file and sends it to Telegram, using a bot."""
+def backup_database_to_telegram() -> bool:
+    """Zips the local database file and sends it to Telegram, using a bot. Returns False if no backup was created."""
     zip_file = zip_database_file()
     if zip_file is None:
         logger.error("Error zipping database file, no backup was created.")
-        return
+        return False
 
     result_ok: bool = append_doc_tuple(zip_file)
     if not result_ok:
         pass  # TODO: Error handling (apart from sending a telegram message)
 
+    return True
+
 
 def register_schedules():
     """
     Synchronously registers the scheduled jobs.
     The monthly backup job executes before the conditional one, to clear the
-    is_modified flag column at the end of its backup, so the oconditional job
+    change counters at the end of its backup, so the oconditional job
     has nothing to do for the day.
     Uses its own asyncio event loop, to avoid blocking the FastAPI server.
     """
     logger.info("Setting up schedules, using schedule.run_pending...")
-    schedule.every().day.at("04:00", "Europe/Madrid").do(periodic_cs_telemetry_cleanup, days_threshold=120)
+    schedule.every().day.at("03:45", "Europe/Madrid").do(periodic_cs_telemetry_compaction)
+    schedule.every().day.at("04:00", "Europe/Madrid").do(
+        periodic_cs_telemetry_cleanup, days_threshold=telemetry_retention_days
+    )
     schedule.every().day.at("08:00", "Europe/Madrid").do(set_device_data_amount_check)
     schedule.every().day.at("20:00", "Europe/Madrid").do(set_device_data_amount_check)
     schedule.every().day.at("20:45", "Europe/Madrid").do(monthly_database_backup)
@@ -1,9 +1,11 @@
-import httpx
-from loguru import logger
 from json import JSONDecodeError
 from typing import Optional
 
+import httpx
+from loguru import logger
+
 from config import tago_account_token, tago_api_endpoint
+from utils.http_client import GlobalHTTPClient
 
 # Default headers with account token
 default_headers: dict[str, str] = {
@@ -50,7 +52,7 @@ def list_devices(
 
     params = fix_filter(params, filter)
     url: str = f"{tago_api_endpoint}/device"
-    return httpx.get(url, headers=default_headers, params=params).json()
+    return GlobalHTTPClient.get_blocking_client().get(url, headers=default_headers, params=params).json()
 
 
 def get_device_last_token(
@@ -69,7 +71,7 @@ def get_device_last_token(
     }
     params = fix_filter(params, filter)
     url: str = f"{tago_api_endpoint}/device/token/{device_id}"
-    request_json = httpx.get(url, headers=default_headers, params=params).json()
+    request_json = GlobalHTTPClient.get_blocking_client().get(url, headers=default_headers, params=params).json()
     if "result" not in request_json:
         return None
 
@@ -1,4 +1,3 @@
-import asyncio
 from typing import Optional
 
 import httpx
@@ -7,7 +6,7 @@ from loguru import logger
 from config import tago_account_token, tago_api_endpoint, tago_data_amount_token  # noqa: F401
 from tagoio.aux_functions import AMOUNT, handle_response
 from tagoio.data_deletion import delete_variable_in_cloud
-from tagoio.token_fetching import get_headers_by_pool_code, pool_code_and_device_id_generator
+from tagoio.token_fetching import get_headers_by_pool_code_async, pool_code_and_device_id_generator
 from telegram_utils import send_telegram_notification
 from utils.http_client import GlobalHTTPClient
 
@@ -16,7 +15,7 @@ individual_variable_threshold = 250  # Value to capture variables across paginat
 no_action_threshold = 25_000
 warning_amount_threshold = 40_000
 
-# TagoIO Rate Limits (Hard limits):
+# TagoIO Rate Limits (Hard limits) are applied by the GlobalHTTPClient, see utils.rate_limiter
 # ? https://help.tago.io/portal/en/kb/articles/rate-limits
 
 # Prefix of variable names that can be removed during data cleanup:
@@ -42,8 +41,6 @@ async def check_all_devices_data_amount(check_only: Optional[set[int]] = None) -
         if check_only is not None and pool_code not in check_only:
             continue
 
-        await asyncio.sleep(1)
-
         url = f"{tago_api_endpoint}/device/{device_id}/data_amount"
 
         try:
@@ -79,7 +76,7 @@ async def fetch_pool_variables_info(pool_code: int, device_id: str, data_amount:
         return amounts_by_variable
 
     url = f"{tago_api_endpoint}/data"
-    headers = get_headers_by_pool_code(pool_code)
+    headers = await get_headers_by_pool_code_async(pool_code)
 
     # Increase chunk request performance up to the data amount limit
     client = GlobalHTTPClient.get_client()
@@ -104,9 +101,6 @@ async def fetch_pool_variables_info(pool_code: int, device_id: str, data_amount:
             logger.error(f"Error fetching data chunk at skip {page_step} for pool {pool_code}: {e}")
             continue
 
-        # Short breath to prevent API rate limiting issues, but fast enough to loop cleanly
-        await asyncio.sleep(1)
-
     logger.info(f"Pool {pool_code} breakdown: {amounts_by_variable}")
     return amounts_by_variable
 
@@ -135,8 +129,3 @@ async def device_data_amount_check():
                     )
                     # Clear target records matching 0 retention weeks to immediately clear space
                     await delete_variable_in_cloud(pool_code, variable_name, 0)
-
-                    # Yield control temporarily to let deletions complete smoothly
-                    await asyncio.sleep(1)
-
-    await asyncio.sleep(60)
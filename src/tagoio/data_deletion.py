@@ -1,4 +1,3 @@
-from asyncio import sleep as asyncio_sleep
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -7,7 +6,8 @@ from loguru import logger
 
 from charge_points import known_charge_points
 from config import app_default_token, app_default_user, port, tago_api_endpoint, version
-from tagoio.token_fetching import get_all_devices_data, get_headers_by_pool_code
+from tagoio.token_fetching import get_all_devices_data, get_headers_by_pool_code_async
+from utils.circuit_breaker import CircuitOpenError, tago_circuit_breakers
 from utils.http_client import GlobalHTTPClient
 
 # from telegram_utils import send_telegram_notification
@@ -34,7 +34,7 @@ async def delete_variable_in_cloud(
     start_date = "2020-01-01"
     qty = 1000  # ? Otherwise the default is 15
 
-    headers = get_headers_by_pool_code(pool_code)
+    headers = await get_headers_by_pool_code_async(pool_code)
     if group:
         variable = f"{variable}&group={group}"
     url = f"{base_url}{variable}&start_date={start_date}&end_date={end_date}&qty={qty}"
@@ -42,9 +42,10 @@ async def delete_variable_in_cloud(
         url = f"{base_url}{variable}&qty=5000"
 
     client = GlobalHTTPClient.get_client()
-    response = await client.delete(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    with tago_circuit_breakers.guard(pool_code):  # Raises CircuitOpenError while the pool circuit is open
+        response = await client.delete(url, headers=headers)
+        response.raise_for_status()
+        return response.json()
 
 
 def handle_delete_response(pool_code: int, result: dict):
@@ -131,8 +132,10 @@ async def all_pools_variable_cleanup():
     logger.warning("Performing variable cleanup for all registered pools...")
     devices_data_by_pool_code: dict[int, tuple[str, str]] = get_all_devices_data()
     for pool_code in devices_data_by_pool_code:
-        await pool_variable_cleanup(pool_code)
-        await asyncio_sleep(30)
+        try:
+            await pool_variable_cleanup(pool_code)
+        except CircuitOpenError as e:  # The failing pool is skipped, the others are still cleaned
+            logger.warning(f"{e}, skipping its variable cleanup")
 
 
 def all_pools_variable_cleanup_trigger():
@@ -8,13 +8,29 @@ from config import tago_api_endpoint
 from enumerations import AvailabilityType, ChargePointStatus, ChargingSessionStep, ConnectionStatus, ValidationAlert
 from schemas.ocpp_csms import ChargePointUpdate, ChargingSessionUpdate, FeedbackMessage
 from tagoio.data_deletion import delete_variable_in_cloud, pool_variable_cleanup
-from tagoio.token_fetching import get_headers_by_pool_code
+from tagoio.token_fetching import get_headers_by_pool_code_async
 from user_interface import translate_status
+from utils.circuit_breaker import CircuitOpenError, tago_circuit_breakers
 from utils.http_client import GlobalHTTPClient
 
 device_full_message: str = "The device has reached the limit of 50000 data registers"
 
 
+class TagoInsertError(Exception):
+    """Raised by send_variable_insert for a negative result of the insert: {"status": false, "message": ...}"""
+
+    def __init__(self, pool_code: int, result: dict):
+        self.pool_code = pool_code
+        self.result = result
+        self.message: Optional[str] = result.get("message")
+        super().__init__(f"TagoIO insert rejected for Pool {pool_code}: {self.message or result}")
+
+    @property
+    def retryable(self) -> bool:
+        """A full device can be cleaned before the next attempt, while other rejections would happen again."""
+        return self.message == device_full_message
+
+
 def get_status_key(pool_code: int, station_name: str) -> int:
     "Provides the logic that allows to find a charge point translated status"
     return hash((pool_code, station_name))
@@ -23,51 +39,81 @@ def get_status_key(pool_code: int, station_name: str) -> int:
 translated_statuses: dict[int, dict[int, str]] = {}
 
 
-async def insert_data_in_cloud(pool_code: int, data: dict = {}):
+async def insert_data_in_cloud(pool_code: int, data: Optional[dict | list[dict]] = None):
+    """
+    Inserts a variable, or a batch of variables of the pool (a list, in a single request), in its device.
+    A full device counts as a failure of the pool circuit breaker, which raises CircuitOpenError while open.
+    """
+    if data is None:  # To avoid mutable default argument issues
+        data = {}
     url: str = f"{tago_api_endpoint}/data"
-    headers = get_headers_by_pool_code(pool_code)
+    headers = await get_headers_by_pool_code_async(pool_code)
     client = GlobalHTTPClient.get_client()
-    response = await client.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    return response.json()
+    with tago_circuit_breakers.guard(pool_code) as call:
+        response = await client.post(url, headers=headers, json=data)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("message") == device_full_message:
+            call.failure = device_full_message
+    return result
 
 
-async def handle_variable_insert(pool_code: int, data: Optional[dict] = None):
+async def send_variable_insert(pool_code: int, data: dict | list[dict]) -> dict:
     """
-    Handles the data insertion using the insert_data_in_cloud function
-    # * Positive result: {"status": true, "result": 20700}
+    Sends a variable, or a batch of variables of the pool, with insert_data_in_cloud: when the device
+    capacity limit is reached, the pool variables are cleaned and the whole batch is retried once.
+    Raises the httpx exceptions (timeouts, HTTP errors), and TagoInsertError for a negative result,
+    to be handled by the caller.
+    # * Positive result: {"status": true, "result": 20700}, or {"status": true, "result": "3 Data Added"}
     # ! Negative result: {"status": false, "message": "Authorization denied"}
     """
-    if data is None:  # To avoid mutable default argument issues
-        data = {}
+    result = await insert_data_in_cloud(pool_code, data)
 
-    try:
-        result = await insert_data_in_cloud(pool_code, data)
+    # * Use .get() to safely access dictionary keys
+    if result.get("status"):
+        return result
+
+    # ? Clean device variables and retry when the capacity limit is reached
+    if result.get("message") == device_full_message:
+        logger.info(f"Capacity limit reached for Pool {pool_code}. Executing cleanup and retrying...")
+        # ! Disabled (long background task): await device_data_amount_check()
+        # Fast, targeted cleanup for this specific Pool
+        await pool_variable_cleanup(pool_code)
 
-        # * Use .get() to safely access dictionary keys
+        # Retry the insertion. If this fails, the exception reaches the caller.
+        result = await insert_data_in_cloud(pool_code, data)
         if result.get("status"):
             return result
 
-        # ? Clean device variables and retry when the capacity limit is reached
-        error_message = result.get("message")
-        if error_message:
-            logger.warning(f"Result of cloud variable insertion ({pool_code}): {result}")
+    raise TagoInsertError(pool_code, result)
 
-            if error_message == device_full_message:
-                logger.info(f"Capacity limit reached for Pool {pool_code}. Executing cleanup and retrying...")
-                # ! Disabled (long background task): await device_data_amount_check()
-                # Fast, targeted cleanup for this specific Pool
-                await pool_variable_cleanup(pool_code)
 
-                # Retry the insertion. If this fails, it will trigger the except block below.
-                return await insert_data_in_cloud(pool_code, data)
+async def handle_variable_insert(pool_code: int, data: Optional[dict | list[dict]] = None):
+    """
+    Handles the data insertion using send_variable_insert, logging the errors. The data can be a batch
+    of variables of the pool (a list), sent in one request. The dashboard and history writes that must
+    survive a TagoIO outage go through the outbox instead (see tagoio.outbox).
+    """
+    if data is None:  # To avoid mutable default argument issues
+        data = {}
+    if isinstance(data, list) and not data:  # Empty batch, nothing to send
+        return None
 
-        else:
-            logger.error(f"Failed cloud variable insertion ({pool_code}) - Unknown format: {result}")
+    try:
+        return await send_variable_insert(pool_code, data)
 
     except httpx.TimeoutException as e:  # Expected behavior when TagoIO platform is not behaving properly.
         logger.warning(f"TagoIO timeout dropping payload for Pool {pool_code}: {e}")
 
+    except CircuitOpenError as e:  # Repeated failures of the pool device, failing fast
+        logger.warning(f"{e}, dropping payload")
+
+    except TagoInsertError as e:  # Negative result, e.g. {"status": false, "message": "Authorization denied"}
+        if e.message:
+            logger.warning(f"Result of cloud variable insertion ({pool_code}): {e.result}")
+        else:
+            logger.error(f"Failed cloud variable insertion ({pool_code}) - Unknown format: {e.result}")
+
     except httpx.HTTPStatusError as e:  # E.g., 401 Unauthorized, 500 Internal Server Error
         response_text = getattr(e.response, "text", "")
         logger.error(f"TagoIO HTTP error ({e.response.status_code}) for Pool {pool_code} | Body: {response_text}")
@@ -90,12 +136,12 @@ async def send_feedback_message(feedback: FeedbackMessage):
     await handle_variable_insert(feedback.pool_code, data)
 
 
-async def update_charge_point_status(update: ChargePointUpdate):
-    save_charge_point_status(update)
-    await update_management_dashboard_status(update)
-
+def get_charge_point_status_batch(update: ChargePointUpdate) -> list[dict]:
+    "Provides the status variables of both dashboards, once the translated status is saved"
+    batch = [get_management_dashboard_status_data(update)]
     if update.has_public_dashboard:
-        await update_public_dashboard_status(update)
+        batch.append(get_public_dashboard_status_data(update))
+    return batch
 
 
 def save_charge_point_status(update: ChargePointUpdate):
@@ -103,13 +149,24 @@ def save_charge_point_status(update: ChargePointUpdate):
     status_key = get_status_key(update.pool_code, update.station_name)
 
     if status_key not in translated_statuses:
-        translated_statuses[status_key] = dict()
+        translated_statuses[status_key] = {}
 
     translated_statuses[status_key][update.connector_id] = status
 
 
-async def update_management_dashboard_status(update: ChargePointUpdate):
-    "Updates the charge point status in the management dashboard (for owners)"
+def restore_charge_point_status(pool_code: int, station_name: str, connector_id: int, charge_point_status: str):
+    """
+    Restores the translated status of a connector from its stored status on startup, as last sent to
+    TagoIO, so the first session update after a restart does not force it again (offline connectors
+    are stored as Unavailable, so Online is assumed).
+    """
+    status = translate_status(charge_point_status, ConnectionStatus.ONLINE)
+    status_key = get_status_key(pool_code, station_name)
+    translated_statuses.setdefault(status_key, {})[connector_id] = status
+
+
+def get_management_dashboard_status_data(update: ChargePointUpdate) -> dict:
+    "Provides the charge point status variable of the management dashboard (for owners)"
     status_key = get_status_key(update.pool_code, update.station_name)
     station_statuses = translated_statuses[status_key]
 
@@ -128,14 +185,14 @@ async def update_management_dashboard_status(update: ChargePointUpdate):
     }
 
     logger.debug(f"Updating Management Dashboard for {update.pool_code}/{update.station_name} status: {data}")
-    return await handle_variable_insert(update.pool_code, data)
+    return data
 
 
-async def update_public_dashboard_status(update: ChargePointUpdate):
-    "Updates the charge point status in the public dashboard (for EV users)"
+def get_public_dashboard_status_data(update: ChargePointUpdate) -> dict:
+    "Provides the charge point status variable of the public dashboard (for EV users)"
     status_key = get_status_key(update.pool_code, update.station_name)
     station_statuses = translated_statuses[status_key]
-    data = {
+    return {
         "variable": f"state_{update.station_name}_{update.connector_id}",
         "value": station_statuses[update.connector_id],
         "group": update.station_name,
@@ -144,37 +201,43 @@ async def update_public_dashboard_status(update: ChargePointUpdate):
         "time": None,
     }
 
-    return await handle_variable_insert(update.pool_code, data)
-
-
-async def update_public_dashboard_values(update: ChargingSessionUpdate):
-    "Updates the charging session values in the public dashboard"
 
-    # STATE SYNC FIX (Fires if Handler restarts during an active session)
-    if update.step != ChargingSessionStep.COMPLETED:
-        status_key = get_status_key(update.pool_code, update.station_name)
-        current_status = translated_statuses.get(status_key, {}).get(update.connector_id)
-        expected_status = translate_status(ChargePointStatus.CHARGING, ConnectionStatus.ONLINE)
-
-        if current_status != expected_status:
-            target: str = f"{update.pool_code}/{update.station_name} [{update.connector_id}]"
-            logger.info(f"Handler restart / sync loss detected for {target}. Forcing CHARGING status.")
-
-            # Forge a status update to explicitly correct the cache and both dashboards
-            cp_update = ChargePointUpdate(
-                pool_code=update.pool_code,
-                station_name=update.station_name,
-                connector_id=update.connector_id,
-                connection_status=ConnectionStatus.ONLINE,  # Implicitly online if sending session updates
-                charge_point_status=ChargePointStatus.CHARGING,
-                availability_type=AvailabilityType.OPERATIVE,
-                charge_point_error_code="NoError",
-                has_public_dashboard=update.has_public_dashboard,
-            )
-            await update_charge_point_status(cp_update)
+def get_status_sync_batch(update: ChargingSessionUpdate) -> list[dict]:
+    """
+    Provides the status variables that force the CHARGING status of an ongoing session, if the
+    cached status differs (e.g. the Handler restarted during an active session). Empty otherwise.
+    """
+    if update.step == ChargingSessionStep.COMPLETED:
+        return []
 
+    status_key = get_status_key(update.pool_code, update.station_name)
+    current_status = translated_statuses.get(status_key, {}).get(update.connector_id)
+    expected_status = translate_status(ChargePointStatus.CHARGING, ConnectionStatus.ONLINE)
+    if current_status == expected_status:
+        return []
+
+    target: str = f"{update.pool_code}/{update.station_name} [{update.connector_id}]"
+    logger.info(f"Handler restart / sync loss detected for {target}. Forcing CHARGING status.")
+
+    # Forge a status update to explicitly correct the cache and both dashboards
+    cp_update = ChargePointUpdate(
+        pool_code=update.pool_code,
+        station_name=update.station_name,
+        connector_id=update.connector_id,
+        connection_status=ConnectionStatus.ONLINE,  # Implicitly online if sending session updates
+        charge_point_status=ChargePointStatus.CHARGING,
+        availability_type=AvailabilityType.OPERATIVE,
+        charge_point_error_code="NoError",
+        has_public_dashboard=update.has_public_dashboard,
+    )
+    save_charge_point_status(cp_update)
+    return get_charge_point_status_batch(cp_update)
+
+
+def get_public_dashboard_values_batch(update: ChargingSessionUpdate) -> list[dict]:
+    "Provides the charging session values of the public dashboard (energy, cost and time), if any"
     if not update.has_public_dashboard:
-        return
+        return []
 
     session_is_completed: bool = update.step == ChargingSessionStep.COMPLETED
     energy_value = 0.0 if session_is_completed else update.energy
@@ -184,8 +247,8 @@ async def update_public_dashboard_values(update: ChargingSessionUpdate):
     time = "0 min" if session_is_completed else update.time
 
     value_pairs: dict[str, str] = {"energy": energy, "cost": cost, "time": time}
-    for prefix, value in value_pairs.items():
-        data = {
+    return [
+        {
             "variable": f"{prefix}_{update.station_name}_{update.connector_id}",
             "value": value,
             "group": f"{update.station_name}_[{update.connector_id}]",
@@ -193,17 +256,12 @@ async def update_public_dashboard_values(update: ChargingSessionUpdate):
             "unit": None,
             "time": None,
         }
-        await handle_variable_insert(update.pool_code, data)
+        for prefix, value in value_pairs.items()
+    ]
 
 
-async def update_management_dashboard_charging_session(update: ChargingSessionUpdate):
-    "Updates the charging session values in the management dashboard"
-    pool_code: int = update.pool_code
-    history_result = await add_charging_session_to_history(update)
-    if history_result:
-        trans_id: int = update.transaction_id
-        logger.warning(f"cs history log {trans_id} result {(pool_code)}: {history_result}")
-
+def get_active_session_data(update: ChargingSessionUpdate) -> dict:
+    "Provides the charging session values variable of the management dashboard"
     value = f"{update.station_name}_[{update.connector_id}]"
     metadata = {
         "card_alias": update.card_alias,
@@ -216,7 +274,7 @@ async def update_management_dashboard_charging_session(update: ChargingSessionUp
         "energy": update.energy,
         "time": update.time,
     }
-    data = {
+    return {
         "variable": "active_cs_data",
         "value": value,
         "group": value,
@@ -224,17 +282,17 @@ async def update_management_dashboard_charging_session(update: ChargingSessionUp
         "unit": None,
         "time": None,
     }
-    return await handle_variable_insert(update.pool_code, data)
 
 
-async def add_charging_session_to_history(update: ChargingSessionUpdate):
-    "Adds the charging session to the private dashboard history, once completed"
+def get_charging_session_dashboards_batch(update: ChargingSessionUpdate) -> list[dict]:
+    "Provides the latest-value variables of a charging session update: session values, forced status and public values"
+    return [get_active_session_data(update)] + get_status_sync_batch(update) + get_public_dashboard_values_batch(update)
+
+
+def get_charging_session_history_data(update: ChargingSessionUpdate) -> Optional[dict]:
+    "Provides the charging session history variable of the private dashboard, once completed"
     if update.step != ChargingSessionStep.COMPLETED or update.cost == 0.0:
-        """
-        message_prefix = f"Session {update.transaction_id} history log skipped"
-        logger.info(f"{message_prefix} due step {update.step} or cost {update.cost}")
-        """
-        return
+        return None
 
     metadata = {
         "card_alias": update.card_alias,
@@ -250,7 +308,7 @@ async def add_charging_session_to_history(update: ChargingSessionUpdate):
         "time_band": update.time_band,
     }
     # ! "group": update.transaction_id is necessary for session not to be grouped in the dashboard
-    data = {
+    return {
         "variable": "charging_session_data",
         "value": update.transaction_id,
         "group": str(update.transaction_id),
@@ -258,8 +316,6 @@ async def add_charging_session_to_history(update: ChargingSessionUpdate):
         "unit": None,
         "time": None,
     }
-    # logger.info(f"Adding charging session to history: {data}")
-    return await handle_variable_insert(update.pool_code, data)
 
 
 async def show_validation_feedback(pool_code: int, variable: str, message: str, result_ok: bool = True):
@@ -0,0 +1,132 @@
+"""
+Latest-value-wins outbound queue for the TagoIO dashboard variables. Meter ticks
+arrive faster than a dashboard is useful, and each TagoIO insert spends device
+data registers, so the variables are kept per pool by (variable, group): a newer
+value replaces an older unsent one. A background loop sends the pending values of
+each pool as a single batch every flush_interval_ms, through the durable outbox.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from loguru import logger
+
+from config import dashboard_flush_ms
+from schemas.ocpp_csms import ChargePointUpdate, ChargingSessionUpdate
+from tagoio.data_parsing import (
+    get_charge_point_status_batch,
+    get_charging_session_dashboards_batch,
+    get_charging_session_history_data,
+    handle_variable_insert,
+    save_charge_point_status,
+)
+from tagoio.outbox import enqueue_variable_insert
+
+
+class DashboardOutboundQueue:
+    def __init__(
+        self,
+        send: Callable[[int, list[dict]], Awaitable[Any]] = handle_variable_insert,
+        flush_interval_ms: int = 2000,
+    ):
+        self.send = send
+        self.flush_interval_ms = flush_interval_ms
+
+        # Pending variables by pool_code, and by (variable, group) within the pool
+        self.pending: dict[int, dict[tuple[str, str], dict]] = {}
+
+        self.flush_lock = asyncio.Lock()
+        self.stop_event = asyncio.Event()
+
+        # Counters to tune flush_interval_ms
+        self.queued_values: int = 0
+        self.coalesced_values: int = 0
+        self.sent_values: int = 0
+        self.sent_batches: int = 0
+
+    def add(self, pool_code: int, data: dict | list[dict]) -> int:
+        """Queues the variables of a pool, replacing the unsent values of the same (variable, group)."""
+        pool_pending = self.pending.setdefault(pool_code, {})
+        replaced_count: int = 0
+        for variable_data in [data] if isinstance(data, dict) else data:
+            search_key = (variable_data["variable"], str(variable_data.get("group")))
+            replaced_count += search_key in pool_pending
+            pool_pending[search_key] = variable_data
+
+        self.queued_values += len(data) if isinstance(data, list) else 1
+        self.coalesced_values += replaced_count
+        return replaced_count
+
+    async def flush(self) -> int:
+        """Sends the pending variables, one batch per pool, concurrently. Returns the number of sent values."""
+        async with self.flush_lock:
+            if not self.pending:
+                return 0
+
+            pending, self.pending = self.pending, {}
+            batches = {pool_code: list(pool_pending.values()) for pool_code, pool_pending in pending.items()}
+            results = await asyncio.gather(
+                *[self.send(pool_code, batch) for pool_code, batch in batches.items()], return_exceptions=True
+            )
+            for pool_code, result in zip(batches, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error sending the queued dashboard variables of Pool {pool_code}: {result}")
+
+            sent_values = sum(len(batch) for batch in batches.values())
+            self.sent_values += sent_values
+            self.sent_batches += len(batches)
+            return sent_values
+
+    def get_stats(self) -> dict[str, Any]:
+        """Provides the queue settings and counters."""
+        return {
+            "flush_interval_ms": self.flush_interval_ms,
+            "pending_values": sum(len(pool_pending) for pool_pending in self.pending.values()),
+            "queued_values": self.queued_values,
+            "coalesced_values": self.coalesced_values,
+            "sent_values": self.sent_values,
+            "sent_batches": self.sent_batches,
+        }
+
+    async def run(self):
+        """Flushes the queue each flush_interval_ms, until stopped."""
+        self.stop_event.clear()
+        while not self.stop_event.is_set():
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=self.flush_interval_ms / 1000)
+            except TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Error flushing the dashboard outbound queue: {e}")
+
+    async def stop(self):
+        """Stops the background loop and sends the remaining variables."""
+        self.stop_event.set()
+        sent_values = await self.flush()
+        logger.info(f"Dashboard queue stopped, {sent_values} values sent at shutdown. Stats: {self.get_stats()}")
+
+
+# Global singleton instance, flushed by the FastAPI lifespan handler into the TagoIO outbox
+dashboard_queue = DashboardOutboundQueue(enqueue_variable_insert, dashboard_flush_ms)
+
+
+def queue_charge_point_status(update: ChargePointUpdate):
+    """Saves the translated status of a charge point, and queues the status variables of its dashboards."""
+    save_charge_point_status(update)
+    dashboard_queue.add(update.pool_code, get_charge_point_status_batch(update))
+
+
+async def queue_charging_session_dashboards(update: ChargingSessionUpdate):
+    """
+    Updates the dashboards with a charging session update: the history entry of a completed
+    session is a record, stored in the outbox right away, while the latest values are queued (coalesced).
+    """
+    history_data = get_charging_session_history_data(update)
+    if history_data is not None:
+        await enqueue_variable_insert(update.pool_code, history_data)
+
+    dashboard_queue.add(update.pool_code, get_charging_session_dashboards_batch(update))
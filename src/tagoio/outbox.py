@@ -0,0 +1,264 @@
+"""
+Durable outbox for the TagoIO dashboard and session history writes. The variables
+are stored in the tagoio_outbox table before being sent, so a TagoIO outage or a
+restart does not lose them. A background drainer sends the entries of each pool in
+order, merging the pending ones in a single batch, and retries the failed sends
+with an exponential backoff with jitter.
+"""
+
+import asyncio
+import json
+import random
+from collections.abc import Awaitable, Callable
+from time import time
+from typing import Any
+
+import httpx
+from loguru import logger
+
+from config import outbox_base_delay_ms, outbox_max_delay_ms
+from database import database_file
+from database.async_database import async_database
+from database.query_database import (
+    delete_outbox_entries,
+    get_due_outbox_pools,
+    get_outbox_depth,
+    get_outbox_entries,
+    insert_outbox_entry,
+    reschedule_outbox_entries,
+)
+from tagoio.data_parsing import TagoInsertError, handle_variable_insert, send_variable_insert
+from utils.circuit_breaker import CircuitOpenError
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Network errors, timeouts, 429 and 5xx responses, open circuits and full devices are retried.
+    Others (e.g. a 400 response, or {"status": false, "message": "Authorization denied"}) would fail again.
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, TagoInsertError):
+        return error.retryable
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code == httpx.codes.TOO_MANY_REQUESTS or status_code >= 500
+    return isinstance(error, httpx.RequestError)
+
+
+def get_backoff_seconds(attempts: int, base_delay_ms: int = 1000, max_delay_ms: int = 300_000) -> float:
+    """Delay before the next attempt: between half and all of base * 2^attempts, capped at max (equal jitter)."""
+    delay_ms = min(max_delay_ms, base_delay_ms * 2**attempts)
+    return (delay_ms / 2 + random.uniform(0, delay_ms / 2)) / 1000
+
+
+def merge_variable_batches(payloads: list[dict | list[dict]]) -> list[dict]:
+    """
+    Merges the pending payloads of a pool in a single batch. A later value of a (variable, group)
+    replaces an earlier one, and is sent in the position of the latest write.
+    """
+    merged: dict[tuple[str, str], dict] = {}
+    for payload in payloads:
+        for variable_data in [payload] if isinstance(payload, dict) else payload:
+            search_key = (variable_data["variable"], str(variable_data.get("group")))
+            merged.pop(search_key, None)
+            merged[search_key] = variable_data
+    return list(merged.values())
+
+
+class TagoOutbox:
+    def __init__(
+        self,
+        send: Callable[[int, list[dict]], Awaitable[Any]] = send_variable_insert,
+        db_file: str = database_file,
+        base_delay_ms: int = 1000,
+        max_delay_ms: int = 300_000,
+        entries_per_send: int = 50,
+        poll_interval_ms: int = 1000,
+    ):
+        self.send = send
+        self.db_file = db_file
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.entries_per_send = entries_per_send
+        self.poll_interval_ms = poll_interval_ms
+
+        # Pending entries by pool_code, loaded from the table by run() and kept up to date afterwards
+        self.depth: dict[int, int] = {}
+        # Drainer task by pool_code: a single one per pool, so its entries are sent in order
+        self.pool_tasks: dict[int, asyncio.Task] = {}
+
+        self.wake_event = asyncio.Event()
+        self.stop_event = asyncio.Event()
+
+        # Counters to follow the outbox during a TagoIO outage
+        self.enqueued_entries: int = 0
+        self.sent_entries: int = 0
+        self.sent_batches: int = 0
+        self.failed_sends: int = 0
+        self.dropped_entries: int = 0
+
+    async def enqueue(self, pool_code: int, data: dict | list[dict]) -> bool:
+        """Stores a variable insert of the pool, and wakes the drainer. Returns False if it could not be stored."""
+        if isinstance(data, list) and not data:  # Empty batch, nothing to send
+            return True
+
+        entry_id = await async_database.run_write(insert_outbox_entry, pool_code, json.dumps(data), self.db_file)
+        if entry_id is None:
+            return False
+
+        self.depth[pool_code] = self.depth.get(pool_code, 0) + 1
+        self.enqueued_entries += 1
+        self.wake_event.set()
+        return True
+
+    def forget_entries(self, pool_code: int, entry_count: int):
+        """Updates the depth of a pool once its entries left the outbox."""
+        remaining_count = self.depth.get(pool_code, 0) - entry_count
+        if remaining_count > 0:
+            self.depth[pool_code] = remaining_count
+        else:
+            self.depth.pop(pool_code, None)
+
+    async def retry_later(self, pool_code: int, entry_ids: list[int], attempts: int, error: Exception):
+        """Reschedules the entries of a failed send, with the backoff of their attempts."""
+        self.failed_sends += 1
+        delay = get_backoff_seconds(attempts, self.base_delay_ms, self.max_delay_ms)
+        if isinstance(error, CircuitOpenError):  # No attempt before the trial call of the pool circuit
+            delay = max(delay, error.retry_in)
+        logger.warning(f"TagoIO outbox send failed for Pool {pool_code}, retry in {delay:.1f}s: {error!r}")
+        await async_database.run_write(reschedule_outbox_entries, entry_ids, time() + delay, repr(error), self.db_file)
+
+    async def send_pool(self, pool_code: int) -> bool:
+        """
+        Sends the oldest pending entries of a pool as one batch. Returns True when they left the outbox
+        (sent, or dropped by a non retryable error), and False when none is pending or the send is retried later.
+        A batch of several entries rejected by a non retryable error is resent entry by entry, so a single
+        bad entry does not drop the others (e.g. a session history entry) merged with it.
+        """
+        entries = await async_database.run_read(get_outbox_entries, pool_code, self.entries_per_send, self.db_file)
+        if not entries:
+            return False
+
+        entry_ids = [entry_id for entry_id, _, _ in entries]
+        attempts = entries[0][1]
+        batch = merge_variable_batches([json.loads(payload) for _, _, payload in entries])
+        try:
+            await self.send(pool_code, batch)
+            self.sent_entries += len(entry_ids)
+            self.sent_batches += 1
+        except Exception as e:  # noqa: BLE001
+            if is_retryable_error(e):
+                await self.retry_later(pool_code, entry_ids, attempts, e)
+                return False
+
+            if len(entries) > 1:
+                logger.warning(f"TagoIO outbox batch of Pool {pool_code} rejected, resending its entries: {e!r}")
+                return await self.send_entries(pool_code, entries)
+
+            self.dropped_entries += len(entry_ids)
+            logger.error(f"Dropping {len(entry_ids)} TagoIO outbox entries of Pool {pool_code}: {e!r} | {batch}")
+
+        await async_database.run_write(delete_outbox_entries, entry_ids, self.db_file)
+        self.forget_entries(pool_code, len(entry_ids))
+        return True
+
+    async def send_entries(self, pool_code: int, entries: list[tuple[int, int, str]]) -> bool:
+        """
+        Sends the entries of a rejected batch one by one, in order, dropping only the ones rejected again.
+        Returns False when a retryable error stops the resend, with the unsent entries rescheduled.
+        """
+        for index, (entry_id, attempts, payload) in enumerate(entries):
+            data = json.loads(payload)
+            try:
+                await self.send(pool_code, data)
+                self.sent_entries += 1
+                self.sent_batches += 1
+            except Exception as e:  # noqa: BLE001
+                if is_retryable_error(e):
+                    await self.retry_later(pool_code, [entry[0] for entry in entries[index:]], attempts, e)
+                    return False
+
+                self.dropped_entries += 1
+                logger.error(f"Dropping the TagoIO outbox entry {entry_id} of Pool {pool_code}: {e!r} | {data}")
+
+            await async_database.run_write(delete_outbox_entries, [entry_id], self.db_file)
+            self.forget_entries(pool_code, 1)
+        return True
+
+    async def drain_pool(self, pool_code: int):
+        """Sends the entries of a pool in order, until none is pending or a send has to be retried later."""
+        try:
+            while not self.stop_event.is_set() and await self.send_pool(pool_code):
+                pass
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"Error draining the TagoIO outbox of Pool {pool_code}: {e}")
+
+    async def start_due_pools(self) -> list[asyncio.Task]:
+        """Starts a drainer task for each pool with due entries, unless one is already running."""
+        if not self.depth:
+            return []
+
+        started_tasks = []
+        for pool_code in await async_database.run_read(get_due_outbox_pools, time(), self.db_file):
+            if pool_code in self.pool_tasks:
+                continue
+
+            task = asyncio.create_task(self.drain_pool(pool_code))
+            task.add_done_callback(lambda _, pool_code=pool_code: self.pool_tasks.pop(pool_code, None))
+            self.pool_tasks[pool_code] = task
+            started_tasks.append(task)
+        return started_tasks
+
+    async def drain(self):
+        """Sends the due entries of every pool, and waits for them (a single pass of the background loop)."""
+        await asyncio.gather(*await self.start_due_pools())
+
+    def get_stats(self) -> dict[str, Any]:
+        """Provides the queue depth, by pool code and in total, and the counters."""
+        return {
+            "pending_entries": sum(self.depth.values()),
+            "pending_entries_by_pool": dict(self.depth),
+            "enqueued_entries": self.enqueued_entries,
+            "sent_entries": self.sent_entries,
+            "sent_batches": self.sent_batches,
+            "failed_sends": self.failed_sends,
+            "dropped_entries": self.dropped_entries,
+        }
+
+    async def run(self):
+        """Loads the pending entries left by a previous run, and drains the outbox until stopped."""
+        self.stop_event.clear()
+        self.depth = await async_database.run_read(get_outbox_depth, self.db_file)
+        if self.depth:
+            logger.info(f"TagoIO outbox: {sum(self.depth.values())} pending entries from a previous run.")
+
+        while not self.stop_event.is_set():
+            try:
+                await self.start_due_pools()
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Error starting the TagoIO outbox drainers: {e}")
+
+            try:  # Woken up by enqueue, or polling for the entries waiting for a retry
+                await asyncio.wait_for(self.wake_event.wait(), timeout=self.poll_interval_ms / 1000)
+            except TimeoutError:
+                pass
+            self.wake_event.clear()
+
+    async def stop(self):
+        """Stops the background loop, once the sends in progress end. The pending entries stay stored."""
+        self.stop_event.set()
+        self.wake_event.set()
+        await asyncio.gather(*self.pool_tasks.values(), return_exceptions=True)
+        logger.info(f"TagoIO outbox stopped. Stats: {self.get_stats()}")
+
+
+# Global singleton instance, drained by the FastAPI lifespan handler
+tago_outbox = TagoOutbox(send_variable_insert, base_delay_ms=outbox_base_delay_ms, max_delay_ms=outbox_max_delay_ms)
+
+
+async def enqueue_variable_insert(pool_code: int, data: dict | list[dict]):
+    """Stores a variable insert in the outbox, or sends it right away when it can not be stored."""
+    if not await tago_outbox.enqueue(pool_code, data):
+        logger.warning(f"TagoIO outbox not available, sending the variables of Pool {pool_code} right away.")
+        await handle_variable_insert(pool_code, data)
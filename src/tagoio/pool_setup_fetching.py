@@ -7,7 +7,8 @@ from pydantic import BaseModel
 
 from config import tago_api_endpoint
 from schemas.ocpp_csms import PoolConfigUpdate, PoolDeviceSetupResponse, RFIDCard
-from tagoio.token_fetching import delete_device_data_by_pool_code, get_headers_by_pool_code
+from tagoio.token_fetching import delete_device_data_by_pool_code, get_headers_by_pool_code_async
+from utils.circuit_breaker import CircuitOpenError, tago_circuit_breakers
 from utils.http_client import GlobalHTTPClient
 
 
@@ -48,7 +49,7 @@ async def fetch_variable_last_value(
     """Fetches the last value of a variable from TagoIO with timeouts and retries."""
     url = f"{tago_api_endpoint}/data"
     params = {"variable": variable, "qty": 1}
-    headers = get_headers_by_pool_code(pool_code)
+    headers = await get_headers_by_pool_code_async(pool_code)
     timeout = httpx.Timeout(10.0)
 
     http_client = client or GlobalHTTPClient.get_client()
@@ -56,8 +57,9 @@ async def fetch_variable_last_value(
     for att in range(1, max_retries + 1):
         msg: str = f"'{variable}' for pool {pool_code}"
         try:
-            response = await http_client.get(url, headers=headers, params=params, timeout=timeout)
-            response.raise_for_status()
+            with tago_circuit_breakers.guard(pool_code):
+                response = await http_client.get(url, headers=headers, params=params, timeout=timeout)
+                response.raise_for_status()
 
             data = response.json()
             if data.get("status") and data.get("result"):
@@ -68,6 +70,9 @@ async def fetch_variable_last_value(
         except httpx.HTTPStatusError as e:
             logger.warning(f"HTTP {e.response.status_code} fetching {msg}.")
             raise
+        except CircuitOpenError as e:  # Repeated failures of the pool device, no retries
+            logger.warning(f"{e}, skipping {msg}.")
+            return None
         except httpx.RequestError as e:
             if att < max_retries:
                 logger.debug(f"Attempt {att}/{max_retries} failed for {msg}. Retrying...")
@@ -87,7 +92,7 @@ async def fetch_variable_list(
     """Fetches a list of values for a given variable from TagoIO."""
     url = f"{tago_api_endpoint}/data"
     params = {"variable": variable, "qty": qty}
-    headers = get_headers_by_pool_code(pool_code)
+    headers = await get_headers_by_pool_code_async(pool_code)
 
     http_client = client or GlobalHTTPClient.get_client()
 
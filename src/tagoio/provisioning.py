@@ -12,6 +12,7 @@ from typing import Optional
 from loguru import logger
 
 from config import tago_api_endpoint
+from database.async_database import async_database
 from database.query_database import get_max_pool_code
 from schemas.google_forms import GoogleFormPayload
 from tagoio.data_parsing import handle_variable_insert
@@ -36,7 +37,7 @@ async def resolve_new_pool_code() -> int:
     max_sequence = 1000  # Base sequence before the first increment (1001)
 
     # 1. Check local database max existing pool code
-    local_max_code: Optional[int] = get_max_pool_code()
+    local_max_code: Optional[int] = await async_database.run_read(get_max_pool_code)
     if local_max_code is not None:
         local_code_str = str(local_max_code)
 
@@ -115,7 +116,7 @@ async def create_tagoio_user(payload: GoogleFormPayload, pool_code: int, passwor
 async def setup_default_device_variables(pool_code: int, payload: GoogleFormPayload):
     """
     Pushes the initial configuration state for a new charging pool device.
-    Uses the handler's internal capacity-aware insertion wrapper.
+    Uses the handler's internal capacity-aware insertion wrapper, with every variable in a single batch.
     """
 
     # 1. Base Installation Variables
@@ -125,9 +126,6 @@ async def setup_default_device_variables(pool_code: int, payload: GoogleFormPayl
         {"variable": "max_grid_power_consumption", "value": 5000, "group": "1"},
     ]
 
-    for data in base_variables:
-        await handle_variable_insert(pool_code, data)
-
     # 2. Rate Costs Configuration (flat 40 cents/kWh for all periods, 10% VAT)
     rates_payload = {
         "variable": "rate_costs",
@@ -135,7 +133,6 @@ async def setup_default_device_variables(pool_code: int, payload: GoogleFormPayl
         "group": "1",
         "metadata": {"valle": 0.4, "llanas": 0.4, "punta": 0.4, "IVA": 0.1},
     }
-    await handle_variable_insert(pool_code, rates_payload)
 
     # 3. CPO Operator Metadata
     cpo_payload = {
@@ -151,4 +148,4 @@ async def setup_default_device_variables(pool_code: int, payload: GoogleFormPayl
             "correo": payload.contact_email,
         },
     }
-    await handle_variable_insert(pool_code, cpo_payload)
+    await handle_variable_insert(pool_code, [*base_variables, rates_payload, cpo_payload])
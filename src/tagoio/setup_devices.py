@@ -26,7 +26,7 @@ def feed_and_return_all_devices_tokens():
 
 def setup_all_devices_tokens():
     "Checks the database tables exists and returns the devices data"
-    check_local_database()
+    check_local_database(include_background=False)  # The heavy steps run once the application has started
 
     devices: dict[int, tuple[str, str]] = {}
     local_device_rows: list[tuple[int, str, str]] = []
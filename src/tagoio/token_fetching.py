@@ -1,16 +1,18 @@
+import asyncio
+from collections.abc import Generator
+from typing import Optional
+
 from loguru import logger
-from typing import Generator, Optional
 
 from config import tago_account_token, tago_device_prefix
 from database.query_database import (
+    delete_database_tagoio_device,
     insert_database_tagoio_device,
     update_database_tagoio_device,
-    delete_database_tagoio_device,
 )
-from tagoio.aux_functions import list_devices, get_device_last_token
+from tagoio.aux_functions import get_device_last_token, list_devices
 from tagoio.setup_devices import setup_all_devices_tokens
 
-
 # device_id, device_token for each TagoIO device (one device for each pool)
 devices_data_by_pool_code: dict[int, tuple[str, str]] = setup_all_devices_tokens()
 
@@ -39,6 +41,16 @@ def get_device_data_by_pool_code(pool_code: int) -> tuple[Optional[str], Optiona
     return device_id, device_token
 
 
+async def get_device_data_by_pool_code_async(pool_code: int) -> tuple[Optional[str], Optional[str]]:
+    """
+    get_device_data_by_pool_code for the coroutines: a pool missing from the cache is fetched in a worker
+    thread, as the blocking client waits for the rate limiter with time.sleep.
+    """
+    if pool_code in devices_data_by_pool_code:
+        return devices_data_by_pool_code[pool_code]
+    return await asyncio.to_thread(get_device_data_by_pool_code, pool_code)
+
+
 def insert_device_data_by_pool_code(pool_code: int, device_id: str, device_token: str) -> bool:
     "Defines a new device data by pool code, if it does not already exists"
     if pool_code in devices_data_by_pool_code:
@@ -90,6 +102,12 @@ def get_headers_by_pool_code(pool_code: int) -> dict[str, str]:
     return get_headers(device_token)
 
 
+async def get_headers_by_pool_code_async(pool_code: int) -> dict[str, str]:
+    "get_headers_by_pool_code for the coroutines, fetching a missing pool in a worker thread"
+    _, device_token = await get_device_data_by_pool_code_async(pool_code)
+    return get_headers(device_token)
+
+
 def fetch_device_token_by_pool_code(pool_code: int) -> tuple[Optional[str], Optional[str]]:
     "Setups the device_id, device_token for a single TagoIO device, by pool code"
     logger.info(f"Fetching device id and token for pool code: {pool_code}...")
@@ -10,6 +10,7 @@ from typing import Optional
 
 from loguru import logger
 
+from database.query_database import get_database_pool_code_by_device_id
 from schemas.analysis import (
     ChangeAvailabilityEvent,
     CPOInfoEvent,
@@ -19,12 +20,11 @@ from schemas.analysis import (
     RateListEvent,
     RFIDManagementEvent,
 )
-from database.query_database import get_database_pool_code_by_device_id
 from sse_broker import event_broker
 from tagoio.data_deletion import delete_variable_in_cloud
 from tagoio.data_parsing import handle_variable_insert, show_validation_feedback
 from tagoio.setup_devices import feed_and_return_all_devices_tokens
-from tagoio.token_fetching import get_device_data_by_pool_code
+from tagoio.token_fetching import get_device_data_by_pool_code_async
 
 known_devices: dict[str, int] = {}  # Maps device_id to pool_code for quick lookup
 
@@ -60,11 +60,21 @@ def get_pool_code_by_device_id(device_id: str) -> Optional[int]:
     return known_devices[device_id]
 
 
+async def get_pool_code_by_device_id_async(device_id: str) -> Optional[int]:
+    """
+    get_pool_code_by_device_id for the coroutines: an unknown device is resolved in a worker thread,
+    as the global TagoIO refresh uses the blocking client, which waits for the rate limiter with time.sleep.
+    """
+    if device_id in known_devices:
+        return known_devices[device_id]
+    return await asyncio.to_thread(get_pool_code_by_device_id, device_id)
+
+
 async def change_availability(context, scope):
     """Translates a TagoIO availability scope into an SSE event."""
     try:
         device_id = scope[0]["device"]
-        pool_code = get_pool_code_by_device_id(device_id)
+        pool_code = await get_pool_code_by_device_id_async(device_id)
 
         if pool_code is None:
             logger.error(f"Cannot process Availability Event: Unknown Pool code for device {device_id}")
@@ -83,7 +93,7 @@ async def manage_rfid(context, scope):
     """Translates a TagoIO RFID scope into an SSE event and updates Cloud UI."""
 
     device_id = scope[0]["device"]
-    pool_code = get_pool_code_by_device_id(device_id)
+    pool_code = await get_pool_code_by_device_id_async(device_id)
     if pool_code is None:
         logger.error(f"Cannot process RFID Event: Unknown Pool code for device {device_id}")
         return
@@ -124,7 +134,6 @@ async def manage_rfid(context, scope):
             }
             # Remove old variable before insert to simulate remove_and_insert_variable
             await delete_variable_in_cloud(pool_code, "card_id", keep_weeks=0, group=group)
-            await asyncio.sleep(1.0)
             await handle_variable_insert(pool_code, rfid_data)
 
             # * 3. UI Feedback
@@ -158,7 +167,7 @@ async def change_max_grid_power(context, scope):
     """Translates a TagoIO max power scope into an SSE event."""
     try:
         device_id = scope[0]["device"]
-        pool_code = get_pool_code_by_device_id(device_id)
+        pool_code = await get_pool_code_by_device_id_async(device_id)
 
         if pool_code is None:
             logger.error(f"Cannot process Max Grid Power Event: Unknown Pool code for device {device_id}")
@@ -177,7 +186,7 @@ async def change_cpo_info(context, scope):
     """Translates a TagoIO CPO info scope into an SSE event."""
     try:
         device_id = scope[0]["device"]
-        pool_code = get_pool_code_by_device_id(device_id)
+        pool_code = await get_pool_code_by_device_id_async(device_id)
 
         if pool_code is None:
             logger.error(f"Cannot process CPO Info Event: Unknown Pool code for device {device_id}")
@@ -219,7 +228,7 @@ async def change_rate_list(context, scope):
     """Translates a TagoIO Rate List scope into an SSE event."""
     try:
         device_id = scope[0]["device"]
-        pool_code = get_pool_code_by_device_id(device_id)
+        pool_code = await get_pool_code_by_device_id_async(device_id)
 
         if pool_code is None:
             logger.error(f"Cannot process Rate List Event: Unknown Pool code for device {device_id}")
@@ -255,7 +264,6 @@ async def change_rate_list(context, scope):
 
         # * 2. Clean TagoIO Device Data
         await delete_variable_in_cloud(pool_code, "rate_costs", keep_weeks=0)
-        await asyncio.sleep(1.0)
         await handle_variable_insert(pool_code, rates_data)
 
         # * 3. UI Feedback
@@ -269,7 +277,7 @@ async def change_load_balancing_mode(context, scope):
     """Translates a TagoIO Load Balancing Mode scope into an SSE event."""
     try:
         device_id = scope[0]["device"]
-        pool_code = get_pool_code_by_device_id(device_id)
+        pool_code = await get_pool_code_by_device_id_async(device_id)
 
         if pool_code is None:
             logger.error(f"Cannot process Load Balancing Event: Unknown Pool code for device {device_id}")
@@ -319,7 +327,7 @@ async def power_consumption_update(context, scope):
 
         # 2. Resolve the Pool Code
         if device_id:
-            pool_code = get_pool_code_by_device_id(device_id)
+            pool_code = await get_pool_code_by_device_id_async(device_id)
 
         # Fallback: Extract from topic if device_id was stripped by TagoIO MQTT integration
         if pool_code is None:  # Look for the topic either at the root, or inside metadata
@@ -338,7 +346,7 @@ async def power_consumption_update(context, scope):
         # 3. Resolve Missing Device ID (Reverse Lookup)
         if not device_id:
             # With the pool_code extracted from the string, we need to fetch the device_id for the Pydantic schema
-            fetched_device_id, _ = get_device_data_by_pool_code(pool_code)
+            fetched_device_id, _ = await get_device_data_by_pool_code_async(pool_code)
             device_id = fetched_device_id or f"unmapped-pool-{pool_code}"
 
         # 4. Instantiate and Broadcast
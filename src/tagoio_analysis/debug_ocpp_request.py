@@ -12,14 +12,14 @@ from schemas.analysis import (
     UnlockConnectorPayload,
 )
 from sse_broker import event_broker
-from tagoio_analysis.analysis_callable import get_pool_code_by_device_id
+from tagoio_analysis.analysis_callable import get_pool_code_by_device_id_async
 
 
 async def ocpp_requests(context, scope):
     """Translates Debug Tab scopes into strict OCPP request events."""
     try:
         device_id = scope[0]["device"]
-        pool_code = get_pool_code_by_device_id(device_id)
+        pool_code = await get_pool_code_by_device_id_async(device_id)
 
         if pool_code is None:
             logger.error(f"Cannot process OCPP Request: Unknown Pool code for device {device_id}")
@@ -8,17 +8,32 @@ manage the OCPP stations accordingly.
 
 import asyncio
 from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from loguru import logger
 
+from config import analysis_tokens
+
 # Utilities and setup handlers
-from data_handling import load_statuses_from_db
+from data_handling import (
+    checkpoint_active_sessions,
+    checkpoint_connector_statuses,
+    load_active_sessions_from_db,
+    load_station_profiles_from_db,
+    load_statuses_from_db,
+    run_status_checkpoint_loop,
+)
+from database.async_database import async_database
+from database.connection_manager import close_all_connections
+from database.database_check import run_background_migrations
+from database.telemetry_buffer import telemetry_buffer
 from schedule_utils import register_schedules, run_schedule_loop
+from tagoio.outbound_queue import dashboard_queue
+from tagoio.outbox import tago_outbox
 from tagoio.pool_setup_fetching import init_pool_configs
 from tagoio.token_fetching import get_all_devices_data
 
 # Analysis callables & worker
-from config import analysis_tokens
 from tagoio_analysis.analysis_callable import (
     change_availability,
     change_cpo_info,
@@ -28,8 +43,8 @@ from tagoio_analysis.analysis_callable import (
     manage_rfid,
     power_consumption_update,
 )
-from tagoio_analysis.debug_ocpp_request import ocpp_requests
 from tagoio_analysis.analysis_runner import TagoAnalysisWorker
+from tagoio_analysis.debug_ocpp_request import ocpp_requests
 
 
 @asynccontextmanager
@@ -44,11 +59,19 @@ async def application_lifespan(app: FastAPI):
     devices_data = get_all_devices_data()
     known_pools = list(devices_data.keys())
     load_statuses_from_db()
+    load_active_sessions_from_db()
+    load_station_profiles_from_db()
     register_schedules()
+    async_database.start()
 
     # 2. Spawn core internal background loops
     schedule_task = asyncio.create_task(run_schedule_loop())
     pool_configs_task = asyncio.create_task(init_pool_configs(known_pools))
+    telemetry_task = asyncio.create_task(telemetry_buffer.run())
+    dashboard_task = asyncio.create_task(dashboard_queue.run())
+    outbox_task = asyncio.create_task(tago_outbox.run())  # Sends the stored TagoIO writes, and retries them
+    status_checkpoint_task = asyncio.create_task(run_status_checkpoint_loop())
+    migration_task = asyncio.create_task(asyncio.to_thread(run_background_migrations))  # E.g. index builds
 
     # 3. Instantiate and cluster your TagoIO Analysis workers cooperatively
     workers = [
@@ -75,6 +98,7 @@ async def application_lifespan(app: FastAPI):
     # 1. Cancel background loop routines
     schedule_task.cancel()
     pool_configs_task.cancel()
+    status_checkpoint_task.cancel()
 
     # 2. Tell the workers to stop and disconnect websockets
     for worker in workers:
@@ -88,5 +112,24 @@ async def application_lifespan(app: FastAPI):
         task.cancel()
 
     # 4. Await everything to finalize cleanly using return_exceptions=True
-    await asyncio.gather(schedule_task, pool_configs_task, *worker_tasks, return_exceptions=True)
+    await asyncio.gather(
+        schedule_task, pool_configs_task, status_checkpoint_task, *worker_tasks, return_exceptions=True
+    )
+
+    # 5. Flush the buffered charging session telemetry, the changed connector statuses and active sessions,
+    # and store the queued dashboard variables in the outbox, whose pending entries are sent on the next start
+    # (the HTTP client is closed afterwards, in main)
+    await checkpoint_connector_statuses()
+    await checkpoint_active_sessions()
+    await telemetry_buffer.stop()
+    await dashboard_queue.stop()
+    await asyncio.gather(dashboard_task, return_exceptions=True)
+    await tago_outbox.stop()
+    await asyncio.gather(outbox_task, return_exceptions=True)
+    await asyncio.gather(migration_task, return_exceptions=True)  # A thread can not be cancelled
+    await asyncio.gather(telemetry_task, return_exceptions=True)
+
+    # 6. Drain the queued SQLite writes and release the long-lived connections
+    await asyncio.to_thread(async_database.stop)
+    close_all_connections()
     logger.info("Application context dissolved. All background systems down.")
@@ -0,0 +1,162 @@
+"""
+Circuit breaker by pool code for the TagoIO device endpoints. After failure_threshold
+consecutive failures of a pool (timeouts, network errors, 401/403 and 5xx responses,
+or a device that stays full), its circuit opens: the calls of the pool fail fast with
+CircuitOpenError instead of waiting out the client timeout, while the other pools
+keep their connection slots. After open_seconds, a single trial call is let through
+(half-open): its success closes the circuit, and its failure opens it again.
+"""
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Optional
+
+import httpx
+from loguru import logger
+
+from config import circuit_failure_threshold, circuit_open_seconds
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling TagoIO, while the circuit of the pool is open."""
+
+    def __init__(self, pool_code: int, retry_in: float):
+        super().__init__(f"TagoIO circuit open for Pool {pool_code}, next trial in {retry_in:.0f}s")
+        self.pool_code = pool_code
+        self.retry_in = retry_in
+
+
+class BreakerCall:
+    """Outcome of a guarded call: the code inside the guard sets failure for a failed result without exception."""
+
+    def __init__(self):
+        self.failure: Optional[str] = None
+
+
+def is_failure_error(error: Exception) -> bool:
+    """Errors that tell the device endpoint of a pool is not healthy. A 429 is left to the rate limiter."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code in (httpx.codes.UNAUTHORIZED, httpx.codes.FORBIDDEN) or status_code >= 500
+    return isinstance(error, httpx.RequestError)
+
+
+class CircuitBreaker:
+    def __init__(self, pool_code: int, failure_threshold: int = 5, open_seconds: int = 60):
+        self.pool_code = pool_code
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self.state = CircuitState.CLOSED
+        self.failure_count: int = 0
+        self.opened_at: float = 0.0
+        self.trial_in_progress = False
+        self.last_failure: Optional[str] = None
+        self.lock = threading.Lock()  # The guarded calls can also run in worker threads
+
+    def check(self):
+        """Lets a call through, or raises CircuitOpenError. After open_seconds, a single trial call goes through."""
+        with self.lock:
+            if self.state == CircuitState.CLOSED:
+                return
+
+            retry_in = self.opened_at + self.open_seconds - time.monotonic()
+            if self.state == CircuitState.OPEN and retry_in <= 0:
+                self.state = CircuitState.HALF_OPEN
+            if self.state == CircuitState.HALF_OPEN and not self.trial_in_progress:
+                self.trial_in_progress = True
+                return
+
+            raise CircuitOpenError(self.pool_code, max(0.0, retry_in))
+
+    def record_success(self):
+        """Closes the circuit, and resets the consecutive failures."""
+        with self.lock:
+            if self.state != CircuitState.CLOSED:
+                logger.info(f"TagoIO circuit closed for Pool {self.pool_code}.")
+            self.state = CircuitState.CLOSED
+            self.failure_count = 0
+            self.trial_in_progress = False
+
+    def record_failure(self, reason: str):
+        """Counts a consecutive failure, opening the circuit at failure_threshold or after a failed trial."""
+        with self.lock:
+            self.failure_count += 1
+            self.last_failure = reason
+            self.trial_in_progress = False
+            if self.state == CircuitState.HALF_OPEN or self.failure_count >= self.failure_threshold:
+                if self.state != CircuitState.OPEN:
+                    logger.warning(
+                        f"TagoIO circuit open for Pool {self.pool_code} during {self.open_seconds}s, "
+                        f"after {self.failure_count} failures. Last one: {reason}"
+                    )
+                self.state = CircuitState.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Ends a call that is neither a success nor a failure (e.g. a 404 or a 429)."""
+        with self.lock:
+            self.trial_in_progress = False
+
+    @contextmanager
+    def guard(self) -> Iterator[BreakerCall]:
+        """Wraps a TagoIO call of the pool, recording its outcome. Raises CircuitOpenError while open."""
+        self.check()
+        call = BreakerCall()
+        try:
+            yield call
+        except Exception as e:
+            if is_failure_error(e):
+                self.record_failure(repr(e))
+            else:
+                self.release_trial()
+            raise
+        except BaseException:  # E.g. a cancelled task, which must not keep the trial slot
+            self.release_trial()
+            raise
+
+        if call.failure is not None:
+            self.record_failure(call.failure)
+        else:
+            self.record_success()
+
+    def get_stats(self) -> dict[str, Any]:
+        return {"state": self.state.value, "failure_count": self.failure_count, "last_failure": self.last_failure}
+
+
+class PoolCircuitBreakers:
+    def __init__(self, failure_threshold: int = 5, open_seconds: int = 60):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.breakers: dict[int, CircuitBreaker] = {}
+
+    def get_breaker(self, pool_code: int) -> CircuitBreaker:
+        """Provides the circuit breaker of a pool, created closed on its first call."""
+        if pool_code not in self.breakers:
+            self.breakers[pool_code] = CircuitBreaker(pool_code, self.failure_threshold, self.open_seconds)
+        return self.breakers[pool_code]
+
+    def guard(self, pool_code: int):
+        """Wraps a TagoIO call of the pool (see CircuitBreaker.guard)."""
+        return self.get_breaker(pool_code).guard()
+
+    def get_stats(self) -> dict[int, dict[str, Any]]:
+        """Provides the state of the circuits that are not closed, or had failures, by pool code."""
+        return {
+            pool_code: breaker.get_stats()
+            for pool_code, breaker in self.breakers.items()
+            if breaker.state != CircuitState.CLOSED or breaker.failure_count
+        }
+
+
+# Global singleton instance, wrapping the TagoIO device endpoint calls
+tago_circuit_breakers = PoolCircuitBreakers(circuit_failure_threshold, circuit_open_seconds)
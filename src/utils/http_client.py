@@ -1,6 +1,7 @@
 """
 This module provides a global HTTP client using httpx.AsyncClient for
-efficient connection pooling and reuse across the application.
+efficient connection pooling and reuse across the application. The requests
+to the TagoIO API acquire from the tago_rate_limiter token buckets.
 """
 
 from typing import Optional
@@ -8,6 +9,8 @@ from typing import Optional
 import httpx
 from loguru import logger
 
+from utils.rate_limiter import tago_rate_limiter
+
 
 class GlobalHTTPClient:
     _async_client: Optional[httpx.AsyncClient] = None
@@ -19,7 +22,11 @@ class GlobalHTTPClient:
         if cls._async_client is None:  # Setting default limits, timeouts, and standard headers...
             limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
             timeout = httpx.Timeout(timeout=15.0, connect=5.0)
-            cls._async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+            event_hooks = {
+                "request": [tago_rate_limiter.acquire],
+                "response": [tago_rate_limiter.handle_async_response],
+            }
+            cls._async_client = httpx.AsyncClient(limits=limits, timeout=timeout, event_hooks=event_hooks)
             logger.info("Global HTTPX AsyncClient initialized.")
         return cls._async_client
 
@@ -29,7 +36,11 @@ class GlobalHTTPClient:
         if cls._sync_client is None:  # Setting default limits, timeouts, and standard headers...
             limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
             timeout = httpx.Timeout(timeout=15.0, connect=5.0)
-            cls._sync_client = httpx.Client(limits=limits, timeout=timeout)
+            event_hooks = {
+                "request": [tago_rate_limiter.acquire_blocking],
+                "response": [tago_rate_limiter.handle_response],
+            }
+            cls._sync_client = httpx.Client(limits=limits, timeout=timeout, event_hooks=event_hooks)
             logger.info("Global HTTPX Client initialized.")
         return cls._sync_client
 
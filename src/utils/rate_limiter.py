@@ -0,0 +1,135 @@
+"""
+Token-bucket rate limiter for the TagoIO API traffic. TagoIO limits the requests
+of each Account-Token and of each Device-Token, so a bucket is kept per token.
+The GlobalHTTPClient acquires from it in a request event hook, which makes every
+TagoIO call wait just as long as its token requires, instead of fixed sleeps.
+"""
+
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+from config import tago_account_requests_per_minute, tago_api_endpoint, tago_device_requests_per_minute
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        self.lock = threading.Lock()  # The blocking client can be used from worker threads
+
+    def reserve(self) -> float:
+        """
+        Takes a token, and returns the seconds to wait before using it. The tokens can go
+        negative: each caller reserves its own slot, so the waiting requests are served in order.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate_per_second
+
+    def pause(self, seconds: float):
+        """Empties the bucket so no token is available for the given seconds (e.g. a 429 Retry-After)."""
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate_per_second)
+
+    async def acquire(self):
+        wait_seconds = self.reserve()
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+
+    def acquire_blocking(self):
+        wait_seconds = self.reserve()
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+
+class TagoRateLimiter:
+    def __init__(
+        self,
+        account_requests_per_minute: int = 120,
+        device_requests_per_minute: int = 120,
+        api_endpoint: Optional[str] = tago_api_endpoint,
+    ):
+        self.limits_per_minute: dict[str, int] = {
+            "Account-Token": account_requests_per_minute,
+            "Device-Token": device_requests_per_minute,
+        }
+        self.api_host: Optional[str] = httpx.URL(api_endpoint).host if api_endpoint else None
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}
+
+    def get_bucket(self, request: httpx.Request) -> Optional[TokenBucket]:
+        """Provides the bucket of the token used by a TagoIO request, None for other hosts."""
+        if self.api_host is None or request.url.host != self.api_host:
+            return None
+
+        for header, requests_per_minute in self.limits_per_minute.items():
+            token = request.headers.get(header)
+            if token is None:
+                continue
+
+            search_key = (header, token)
+            if search_key not in self.buckets:  # Burst of up to one second of requests
+                rate_per_second = requests_per_minute / 60
+                self.buckets[search_key] = TokenBucket(rate_per_second, max(1.0, rate_per_second))
+            return self.buckets[search_key]
+
+        return None
+
+    async def acquire(self, request: httpx.Request):
+        """AsyncClient request event hook."""
+        bucket = self.get_bucket(request)
+        if bucket is not None:
+            await bucket.acquire()
+
+    def acquire_blocking(self, request: httpx.Request):
+        """Client request event hook."""
+        bucket = self.get_bucket(request)
+        if bucket is not None:
+            bucket.acquire_blocking()
+
+    def handle_response(self, response: httpx.Response):
+        """Pauses the bucket of a rate limited (429) request, by its Retry-After header or a minute."""
+        if response.status_code != httpx.codes.TOO_MANY_REQUESTS:
+            return
+
+        bucket = self.get_bucket(response.request)
+        if bucket is None:
+            return
+
+        retry_after = get_retry_after_seconds(response.headers.get("Retry-After"))
+        logger.warning(f"TagoIO rate limit reached for {response.request.url.path}, pausing {retry_after}s")
+        bucket.pause(retry_after)
+
+    async def handle_async_response(self, response: httpx.Response):
+        """AsyncClient response event hook."""
+        self.handle_response(response)
+
+
+def get_retry_after_seconds(retry_after: Optional[str], default: float = 60.0) -> float:
+    """Parses a Retry-After header, given as seconds or as an HTTP date."""
+    if not retry_after:
+        return default
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+# Global singleton instance, used by the event hooks of the GlobalHTTPClient
+tago_rate_limiter = TagoRateLimiter(tago_account_requests_per_minute, tago_device_requests_per_minute)
@@ -0,0 +1,605 @@
+"""
+Offline microbenchmark harness for database/query_database.py (no TagoIO or Telegram credentials needed).
+Seeds a temporary SQLite file with realistic volumes, measures the ops/sec and the p50/p99 latency of
+every public function of the module, and writes the results as JSON, to compare them between versions.
+
+Usage, from the repository root:
+    python tests/benchmark_query_database.py --scale small --output benchmark_results.json
+    python tests/benchmark_query_database.py --scale full --compare benchmark_results.json
+"""
+
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+from collections import deque
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from statistics import mean
+from time import perf_counter, perf_counter_ns
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from loguru import logger
+
+from database import query_database
+from database.connection_manager import close_all_connections, get_connection
+from database.database_check import check_local_database, create_daily_pool_stats_table
+from database.query_database import get_telemetry_row, telemetry_insert_query
+from database.session_dates import get_session_epochs
+from database.telemetry_packing import get_tick_row
+from database.telemetry_rollups import get_rollup_buckets, get_rollup_upsert_query
+from schemas.ocpp_csms import ChargingSessionUpdate
+
+# ? Seeded volumes: stations (10 per pool, 2 connectors each), history rows and raw telemetry rows
+scales: dict[str, dict[str, int]] = {
+    "tiny": {"stations": 50, "history_rows": 2_000, "telemetry_rows": 20_000},
+    "small": {"stations": 500, "history_rows": 20_000, "telemetry_rows": 200_000},
+    "full": {"stations": 2_000, "history_rows": 200_000, "telemetry_rows": 2_000_000},
+}
+
+stations_per_pool: int = 10
+ticks_per_session: int = 1_000
+tick_seconds: int = 10
+card_alias_count: int = 5_000
+packed_session_ratio: float = 0.25  # Share of the sessions with telemetry that are seeded already compacted
+bands: list[str] = ["Off-Peak", "Flat", "Peak"]
+
+
+class BenchmarkContext:
+    """Seeded database and deterministic state shared by the benchmark cases."""
+
+    def __init__(self, db_file: str, scale: dict[str, int], seed: int = 42):
+        self.db_file = db_file
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.pool_count = max(1, scale["stations"] // stations_per_pool)
+        self.station_names = [f"STATION-{index:05d}" for index in range(scale["stations"])]
+        self.card_aliases = [f"RFID-{index:05d}" for index in range(card_alias_count)]
+        self.now = datetime.now(UTC).replace(microsecond=0)
+
+        self.raw_session_ids: list[int] = []  # Sessions with raw telemetry rows
+        self.packed_session_ids: list[int] = []  # Sessions with packed telemetry
+        self.next_transaction_id = scale["history_rows"] + 1
+        self.next_pool_code = self.pool_count + 1
+        self.inserted_pool_codes: list[int] = []
+        self.history_created_at: list[str] = []  # By transaction_id - 1
+
+    def get_pool_code(self, station_index: int) -> int:
+        return station_index // stations_per_pool + 1
+
+    def get_random_station(self) -> tuple[int, str]:
+        station_index = self.random.randrange(len(self.station_names))
+        return self.get_pool_code(station_index), self.station_names[station_index]
+
+    def get_update(self, transaction_id: int, tick: int = 0) -> ChargingSessionUpdate:
+        """Builds a ChargingSessionUpdate for a new session, with unique meter values."""
+        pool_code, station_name = self.get_random_station()
+        last_meter_ts = (self.now + timedelta(seconds=tick * tick_seconds)).isoformat().replace("+00:00", "Z")
+        return ChargingSessionUpdate(
+            pool_code=pool_code,
+            station_name=station_name,
+            connector_id=1,
+            transaction_id=transaction_id,
+            card_alias=self.random.choice(self.card_aliases),
+            card_code="1234567890123456",
+            display_id=f"{station_name} [1]",
+            start_date=self.now.strftime("%d/%m/%Y"),
+            start_time=self.now.strftime("%H:%M"),
+            step="COMPLETED",
+            start_meter_value=transaction_id * 100_000,
+            last_meter_value=transaction_id * 100_000 + 10 * (tick + 1),
+            last_meter_ts=last_meter_ts,
+            current_tariff_band=bands[tick % len(bands)],
+            rate_off_peak=0.15,
+            rate_flat=0.25,
+            rate_peak=0.35,
+            energy_off_peak=10 * (tick + 1),
+            energy_flat=0,
+            energy_peak=0,
+            energy=0.01 * (tick + 1),
+            cost=0.0025 * (tick + 1),
+            power=7400,
+            time="1 min",
+            time_band="09:00 - 10:00",
+        )
+
+    def take_transaction_id(self) -> int:
+        self.next_transaction_id += 1
+        return self.next_transaction_id
+
+
+def seed_database(context: BenchmarkContext):
+    """Fills the database with devices, stations, connector statuses, history, telemetry and rollups."""
+    check_local_database(context.db_file)
+    conn = sqlite3.connect(context.db_file)
+    scale, rng = context.scale, context.random
+
+    devices = [
+        (pool_code, f"device-{pool_code}", f"token-{pool_code}") for pool_code in range(1, context.pool_count + 1)
+    ]
+    conn.executemany("INSERT INTO tagoio_device (pool_code, device_id, device_token) VALUES (?, ?, ?);", devices)
+
+    stations = [(name, context.get_pool_code(index), 2) for index, name in enumerate(context.station_names)]
+    conn.executemany("INSERT INTO station_config (station_name, pool_code, noc) VALUES (?, ?, ?);", stations)
+    statuses = [(pool_code, name, cid, "Available") for name, pool_code, _ in stations for cid in (1, 2)]
+    conn.executemany(
+        "INSERT INTO connector_status (pool_code, station_name, connector_id, charge_point_status) VALUES (?, ?, ?, ?);",
+        statuses,
+    )
+
+    # History: one session every few minutes over the last two years, oldest transaction_id first
+    history_query = """
+        INSERT INTO charging_session_history (
+            created_at, pool_code, station_name, connector_id, transaction_id, card_alias, start_date, time_band,
+            start_meter_value, last_meter_value, cost, rate_off_peak, rate_flat, rate_peak,
+            energy_off_peak, energy_flat, energy_peak, start_ts, end_ts
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    history_rows, span_seconds = scale["history_rows"], 730 * 24 * 3600
+    session_starts: dict[int, datetime] = {}
+    rows = []
+    for transaction_id in range(1, history_rows + 1):
+        created_at = context.now - timedelta(seconds=span_seconds * (history_rows - transaction_id) // history_rows)
+        session_starts[transaction_id] = created_at - timedelta(seconds=ticks_per_session * tick_seconds)
+        context.history_created_at.append(created_at.strftime("%Y-%m-%d %H:%M:%S"))
+        station_index = rng.randrange(len(context.station_names))
+        energy = rng.randint(1_000, 60_000)
+        rows.append(
+            (
+                context.history_created_at[-1],
+                context.get_pool_code(station_index),
+                context.station_names[station_index],
+                rng.choice((1, 2)),
+                transaction_id,
+                rng.choice(context.card_aliases),
+                created_at.strftime("%d/%m/%Y"),
+                "09:00 - 10:00",
+                transaction_id * 100_000,
+                transaction_id * 100_000 + energy,
+                round(energy * 0.00025, 4),
+                0.15,
+                0.25,
+                0.35,
+                energy // 3,
+                energy // 3,
+                energy - 2 * (energy // 3),
+                *get_session_epochs(created_at.strftime("%d/%m/%Y"), "09:00 - 10:00"),
+            )
+        )
+    conn.executemany(history_query, rows)
+    conn.execute("DROP TABLE daily_pool_stats;")
+    create_daily_pool_stats_table(conn)  # Rebuilt from the seeded history
+    conn.commit()
+    conn.close()
+
+    # Telemetry of the most recent sessions, with their rollups
+    session_count = min(history_rows, max(1, scale["telemetry_rows"] // ticks_per_session))
+    session_ids = list(range(history_rows - session_count + 1, history_rows + 1))
+    conn = get_connection(context.db_file)
+    for transaction_id in session_ids:
+        start = session_starts[transaction_id]
+        rows = []
+        for tick in range(ticks_per_session):
+            timestamp = (start + timedelta(seconds=tick * tick_seconds)).isoformat().replace("+00:00", "Z")
+            band = bands[(tick * len(bands)) // ticks_per_session]
+            energy = 10 * (tick + 1)
+            rows.append(
+                (transaction_id, timestamp, energy, rng.randint(3_000, 7_400), 0.0025 * (tick + 1), band, energy, 0, 0)
+            )
+        with conn:
+            conn.executemany(telemetry_insert_query, [get_tick_row(row) for row in rows])
+            for table_name, bucket_rows in get_rollup_buckets(rows, {}).items():
+                conn.executemany(get_rollup_upsert_query(table_name), bucket_rows)
+
+    packed_count = int(len(session_ids) * packed_session_ratio)
+    context.packed_session_ids = session_ids[:packed_count]
+    context.raw_session_ids = session_ids[packed_count:]
+    for transaction_id in context.packed_session_ids:
+        query_database.compact_session_telemetry(transaction_id, context.db_file)
+
+
+def get_benchmark_cases(context: BenchmarkContext) -> dict[str, tuple[Callable[[], Any], int]]:
+    """
+    Provides, by query_database function name, a callable running one operation and the maximum
+    iterations. Destructive cases (deletes, compaction, vacuum) are last, with few iterations.
+    """
+    db_file, rng = context.db_file, context.random
+
+    def pick(values: list):
+        return values[rng.randrange(len(values))] if values else 0
+
+    def consume(rows) -> int:
+        # Exhausts a streaming (iter_*) variant, without keeping its rows
+        return len(deque(enumerate(rows, start=1), maxlen=1))
+
+    def insert_device():
+        pool_code = context.next_pool_code
+        context.next_pool_code += 1
+        context.inserted_pool_codes.append(pool_code)
+        return query_database.insert_database_tagoio_device(pool_code, f"device-{pool_code}", "token", db_file)
+
+    def insert_history():
+        return query_database.insert_database_charging_session_history(
+            context.get_update(context.take_transaction_id()), db_file
+        )
+
+    def insert_telemetry_batch():
+        transaction_id = context.take_transaction_id()
+        rows = [get_telemetry_row(context.get_update(transaction_id, tick)) for tick in range(200)]
+        return query_database.insert_charging_session_telemetry_batch(rows, db_file)
+
+    def get_session_ticks():
+        return query_database.get_session_tick_rows(get_connection(db_file), pick(context.raw_session_ids))
+
+    def get_legacy_ticks():
+        return query_database.get_legacy_telemetry_rows(get_connection(db_file), pick(context.raw_session_ids))
+
+    def get_previous_row():
+        conn = get_connection(db_file)
+        transaction_id = pick(context.raw_session_ids)
+        return query_database.get_previous_telemetry_row(conn, transaction_id, "9999-12-31T00:00:00Z")
+
+    session_rows = query_database.get_telemetry_for_session(pick(context.raw_session_ids), db_file)
+    half = len(session_rows) // 2
+
+    def get_page():
+        # Keyset cursor of a random seeded session, as sent back by the audit dashboard
+        transaction_id = rng.randint(1, context.scale["history_rows"])
+        cursor = (context.history_created_at[transaction_id - 1], transaction_id, transaction_id)  # Seeded in order
+        return query_database.get_sessions_page(50, cursor, db_file=db_file)
+
+    def get_month_range() -> tuple[str, str]:
+        # A month of session start days, within the two seeded years
+        month_start = (context.now - timedelta(days=rng.randint(30, 700))).date()
+        return month_start.isoformat(), (month_start + timedelta(days=30)).isoformat()
+
+    compact_ids = list(context.raw_session_ids[len(context.raw_session_ids) // 2 :])
+
+    def compact():
+        return query_database.compact_session_telemetry(compact_ids.pop() if compact_ids else 0, db_file)
+
+    def delete_device():
+        pool_code = context.inserted_pool_codes.pop() if context.inserted_pool_codes else 0
+        return query_database.delete_database_tagoio_device(pool_code, db_file)
+
+    def delete_station():
+        station_index = rng.randrange(len(context.station_names))
+        pool_code = context.get_pool_code(station_index)
+        return query_database.delete_station_from_db(pool_code, context.station_names[station_index], db_file)
+
+    statuses_batch = [
+        (context.get_pool_code(index), context.station_names[index], 1, "Charging")
+        for index in range(min(100, len(context.station_names)))
+    ]
+
+    # Checkpoint of the live sessions of a busy evening: one compact row per charging connector
+    active_session_rows = [
+        (
+            context.get_pool_code(index),
+            context.station_names[index],
+            1,
+            index + 1,
+            int(context.now.timestamp()),
+            context.get_update(index + 1, 100).model_dump_json(
+                exclude={"pool_code", "station_name", "connector_id"}, exclude_defaults=True
+            ),
+        )
+        for index in range(min(500, len(context.station_names)))
+    ]
+    # Dashboard batch of a pool, as stored by the TagoIO outbox while TagoIO is not reachable
+    outbox_payload = json.dumps(
+        [{"variable": f"energy_CP_{index}", "value": index, "group": f"CP_[{index}]"} for index in range(7)]
+    )
+    outbox_ids: list[int] = []
+
+    def insert_outbox():
+        entry_id = query_database.insert_outbox_entry(rng.randint(1, context.pool_count), outbox_payload, db_file)
+        outbox_ids.append(entry_id)
+        return entry_id
+
+    def delete_outbox():
+        entry_ids, outbox_ids[:] = outbox_ids[:50], outbox_ids[50:]
+        return query_database.delete_outbox_entries(entry_ids, db_file)
+
+    return {
+        "get_modified_rows_count": (
+            lambda: query_database.get_modified_rows_count("charging_session_history", db_file),
+            500,
+        ),
+        "get_database_tagoio_devices_count": (lambda: query_database.get_database_tagoio_devices_count(db_file), 500),
+        "get_database_charging_session_history_count": (
+            lambda: query_database.get_database_charging_session_history_count(db_file),
+            50,
+        ),
+        "get_all_database_tagoio_devices": (lambda: query_database.get_all_database_tagoio_devices(db_file), 200),
+        "get_database_tagoio_device": (
+            lambda: query_database.get_database_tagoio_device(rng.randint(1, context.pool_count), db_file),
+            1_000,
+        ),
+        "get_database_pool_code_by_device_id": (
+            lambda: query_database.get_database_pool_code_by_device_id(
+                f"device-{rng.randint(1, context.pool_count)}", db_file
+            ),
+            1_000,
+        ),
+        "insert_database_tagoio_device": (insert_device, 200),
+        "update_database_tagoio_device": (
+            lambda: query_database.update_database_tagoio_device(
+                rng.randint(1, context.pool_count), "device", "token", db_file
+            ),
+            200,
+        ),
+        "insert_database_charging_session_history": (insert_history, 500),
+        "get_telemetry_row": (lambda: get_telemetry_row(context.get_update(1)), 1_000),
+        "get_previous_telemetry_row": (get_previous_row, 1_000),
+        "insert_charging_session_telemetry_batch": (insert_telemetry_batch, 100),
+        "get_session_tick_rows": (get_session_ticks, 300),
+        "get_legacy_telemetry_rows": (get_legacy_ticks, 1_000),
+        "merge_telemetry_rows": (
+            lambda: query_database.merge_telemetry_rows(session_rows[:half], session_rows[half:]),
+            200,
+        ),
+        "iter_merged_telemetry_rows": (
+            lambda: consume(query_database.iter_merged_telemetry_rows(session_rows[:half], session_rows[half:])),
+            200,
+        ),
+        "get_telemetry_for_session": (
+            lambda: query_database.get_telemetry_for_session(
+                pick(context.raw_session_ids + context.packed_session_ids), db_file
+            ),
+            300,
+        ),
+        "iter_telemetry_for_session": (
+            lambda: consume(
+                query_database.iter_telemetry_for_session(
+                    pick(context.raw_session_ids + context.packed_session_ids), db_file
+                )
+            ),
+            300,
+        ),
+        "iter_cursor_rows": (
+            lambda: consume(
+                query_database.iter_cursor_rows(get_connection(db_file).execute("SELECT * FROM connector_status;"))
+            ),
+            100,
+        ),
+        "stream_query_rows": (
+            lambda: consume(query_database.stream_query_rows("SELECT * FROM connector_status;", (), db_file)),
+            100,
+        ),
+        "get_uncompacted_session_ids": (lambda: query_database.get_uncompacted_session_ids(500, db_file), 20),
+        "get_charging_sessions_from_pool_code": (
+            lambda: query_database.get_charging_sessions_from_pool_code(
+                rng.randint(1, context.pool_count), *get_month_range(), db_file=db_file
+            ),
+            200,
+        ),
+        "get_pool_sessions_query": (
+            lambda: query_database.get_pool_sessions_query(rng.randint(1, context.pool_count), *get_month_range()),
+            1_000,
+        ),
+        "iter_charging_sessions_from_pool_code": (
+            lambda: consume(
+                query_database.iter_charging_sessions_from_pool_code(
+                    rng.randint(1, context.pool_count), *get_month_range(), db_file=db_file
+                )
+            ),
+            200,
+        ),
+        "get_start_ts_conditions": (lambda: query_database.get_start_ts_conditions(*get_month_range()), 1_000),
+        "get_all_station_profiles": (lambda: query_database.get_all_station_profiles(db_file), 100),
+        "upsert_station_profile": (
+            lambda: query_database.upsert_station_profile(*context.get_random_station(), rng.randint(1, 4), db_file),
+            500,
+        ),
+        "upsert_connector_statuses_batch": (
+            lambda: query_database.upsert_connector_statuses_batch(statuses_batch, db_file),
+            100,
+        ),
+        "iter_all_connector_statuses": (lambda: consume(query_database.iter_all_connector_statuses(db_file)), 100),
+        "checkpoint_active_sessions_batch": (
+            lambda: query_database.checkpoint_active_sessions_batch(active_session_rows, [], db_file),
+            100,
+        ),
+        "get_all_active_sessions": (lambda: query_database.get_all_active_sessions(db_file), 100),
+        "delete_stale_active_sessions": (lambda: query_database.delete_stale_active_sessions(24, db_file), 100),
+        "insert_outbox_entry": (insert_outbox, 1_000),
+        "get_due_outbox_pools": (lambda: query_database.get_due_outbox_pools(context.now.timestamp(), db_file), 500),
+        "get_outbox_entries": (
+            lambda: query_database.get_outbox_entries(rng.randint(1, context.pool_count), 50, db_file),
+            500,
+        ),
+        "reschedule_outbox_entries": (
+            lambda: query_database.reschedule_outbox_entries(
+                outbox_ids[:50], context.now.timestamp() + 60, "ReadTimeout", db_file
+            ),
+            200,
+        ),
+        "get_outbox_depth": (lambda: query_database.get_outbox_depth(db_file), 500),
+        "get_session_history": (
+            lambda: query_database.get_session_history(rng.randint(1, context.scale["history_rows"]), db_file),
+            1_000,
+        ),
+        "get_sessions_page": (get_page, 300),
+        "get_search_match_expression": (
+            lambda: query_database.get_search_match_expression("rfid 00042 station"),
+            1_000,
+        ),
+        "search_sessions": (
+            lambda: query_database.search_sessions(pick(context.card_aliases), db_file=db_file),
+            300,
+        ),
+        "get_recent_sessions": (
+            lambda: query_database.get_recent_sessions(
+                100, rng.randint(1, context.pool_count), *get_month_range(), db_file
+            ),
+            300,
+        ),
+        "get_recent_sessions_query": (
+            lambda: query_database.get_recent_sessions_query(
+                100, rng.randint(1, context.pool_count), *get_month_range()
+            ),
+            1_000,
+        ),
+        "iter_recent_sessions": (
+            lambda: consume(
+                query_database.iter_recent_sessions(
+                    100, rng.randint(1, context.pool_count), *get_month_range(), db_file
+                )
+            ),
+            300,
+        ),
+        "get_daily_pool_stats": (
+            lambda: query_database.get_daily_pool_stats(rng.randint(1, context.pool_count), db_file=db_file),
+            300,
+        ),
+        "get_station_stats_summary": (lambda: query_database.get_station_stats_summary(days=30, db_file=db_file), 100),
+        "get_telemetry_rollups": (
+            lambda: query_database.get_telemetry_rollups(pick(context.raw_session_ids), "minute", db_file),
+            500,
+        ),
+        "analyze_cs_telemetry": (lambda: query_database.analyze_cs_telemetry(db_file), 20),
+        "estimate_cs_telemetry_count": (lambda: query_database.estimate_cs_telemetry_count(db_file), 500),
+        "get_max_pool_code": (lambda: query_database.get_max_pool_code(db_file), 500),
+        # Destructive cases, after the read ones
+        "compact_session_telemetry": (compact, max(1, len(compact_ids))),
+        "delete_database_tagoio_device": (delete_device, 200),
+        "delete_station_from_db": (delete_station, 100),
+        "delete_outbox_entries": (delete_outbox, 20),
+        "delete_telemetry_rollups": (lambda: query_database.delete_telemetry_rollups("minute", 3_650, db_file), 5),
+        "delete_database_cs_telemetry": (
+            lambda: query_database.delete_database_cs_telemetry(db_file, 30, pause_seconds=0),
+            3,
+        ),
+        "incremental_vacuum_database": (
+            lambda: query_database.incremental_vacuum_database(db_file, pause_seconds=0),
+            3,
+        ),
+    }
+
+
+def get_percentile(sorted_values: list[float], percentile: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    index = max(0, min(len(sorted_values) - 1, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_case(operation: Callable[[], Any], max_iterations: int, max_seconds: float) -> dict[str, Any]:
+    """Runs an operation up to max_iterations times (or max_seconds) and summarizes its latencies."""
+    latencies_ms: list[float] = []
+    start_time = perf_counter()
+    while len(latencies_ms) < max_iterations and perf_counter() - start_time < max_seconds:
+        operation_start = perf_counter_ns()
+        operation()
+        latencies_ms.append((perf_counter_ns() - operation_start) / 1e6)
+
+    latencies_ms.sort()
+    total_seconds = sum(latencies_ms) / 1000
+    return {
+        "iterations": len(latencies_ms),
+        "ops_per_sec": round(len(latencies_ms) / total_seconds, 2) if total_seconds else None,
+        "mean_ms": round(mean(latencies_ms), 4),
+        "p50_ms": round(get_percentile(latencies_ms, 50), 4),
+        "p99_ms": round(get_percentile(latencies_ms, 99), 4),
+        "max_ms": round(latencies_ms[-1], 4),
+    }
+
+
+def get_module_functions() -> list[str]:
+    """Names of the public functions defined in query_database, which should all be benchmarked."""
+    return [
+        name
+        for name, func in inspect.getmembers(query_database, inspect.isfunction)
+        if func.__module__ == query_database.__name__ and not name.startswith("_")
+    ]
+
+
+def run_benchmarks(
+    scale_name: str = "small", db_file: Optional[str] = None, max_seconds: float = 5.0, iterations_factor: float = 1.0
+) -> dict[str, Any]:
+    """Seeds the database and runs every benchmark case. Returns the machine-readable results."""
+    scale = scales[scale_name]
+    db_folder = None
+    if db_file is None:
+        db_folder = tempfile.mkdtemp(prefix="query_database_benchmark_")
+        db_file = os.path.join(db_folder, "benchmark.sqlite3")
+
+    context = BenchmarkContext(db_file, scale)
+    seed_start = perf_counter()
+    seed_database(context)
+    seed_seconds = perf_counter() - seed_start
+    logger.info(f"Seeded {scale_name} benchmark database in {seed_seconds:.1f} s: {db_file}")
+
+    results: dict[str, dict[str, Any]] = {}
+    for name, (operation, max_iterations) in get_benchmark_cases(context).items():
+        results[name] = run_case(operation, max(1, int(max_iterations * iterations_factor)), max_seconds)
+        logger.info(f"{name}: {results[name]}")
+
+    missing = sorted(set(get_module_functions()) - set(results))
+    if missing:
+        logger.warning(f"Functions without a benchmark case: {missing}")
+
+    close_all_connections()
+    if db_folder is not None:
+        for file_name in os.listdir(db_folder):
+            os.remove(os.path.join(db_folder, file_name))
+        os.rmdir(db_folder)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(UTC).isoformat(timespec="seconds"),
+            "scale": scale_name,
+            "volumes": scale,
+            "seed_seconds": round(seed_seconds, 2),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "missing": missing,
+        "results": results,
+    }
+
+
+def compare_results(previous: dict[str, Any], current: dict[str, Any], threshold: float = 1.25) -> list[str]:
+    """Lists the functions whose p50 latency grew more than threshold times since the previous results."""
+    regressions = []
+    for name, result in current["results"].items():
+        previous_result = previous.get("results", {}).get(name)
+        if not previous_result or not previous_result["p50_ms"]:
+            continue
+
+        ratio = result["p50_ms"] / previous_result["p50_ms"]
+        if ratio > threshold:
+            regressions.append(f"{name}: p50 {previous_result['p50_ms']} ms -> {result['p50_ms']} ms ({ratio:.2f}x)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=scales.keys(), default="small")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="Previous results JSON file, to report p50 regressions")
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="Time budget per function")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+
+    benchmark_results = run_benchmarks(args.scale, max_seconds=args.max_seconds)
+    with open(args.output, "w") as results_file:
+        json.dump(benchmark_results, results_file, indent=2)
+    logger.info(f"Benchmark results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            regressions = compare_results(json.load(previous_file), benchmark_results)
+        for regression in regressions:
+            logger.warning(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
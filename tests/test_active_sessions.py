@@ -0,0 +1,68 @@
+import asyncio
+import json
+import sqlite3
+from unittest.mock import AsyncMock, patch
+
+from test_charging_session_update import update
+
+import data_handling
+from data_handling import get_active_session_row, get_search_key, manage_charging_session_update
+from database.database_check import check_local_database
+from database.query_database import (
+    checkpoint_active_sessions_batch,
+    delete_stale_active_sessions,
+    get_all_active_sessions,
+    insert_database_charging_session_history,
+)
+from schemas.ocpp_csms import ChargingSessionUpdate
+
+
+def test_active_sessions_are_checkpointed_and_rehydrated(tmp_path):
+    "Tests that the compact active session rows rebuild the same sessions, and that finished ones are dropped"
+    db_file = str(tmp_path / "sessions.sqlite3")
+    check_local_database(db_file)
+
+    other_session = update.model_copy(update={"connector_id": 2, "transaction_id": update.transaction_id + 1})
+    rows = [get_active_session_row(update), get_active_session_row(other_session)]
+    assert "pool_code" not in json.loads(rows[0][-1])  # Stored as columns
+    assert checkpoint_active_sessions_batch(rows, [], db_file)
+    assert checkpoint_active_sessions_batch([get_active_session_row(update)], [], db_file)  # Latest state wins
+
+    stored_sessions = []
+    for pool_code, station_name, connector_id, payload in get_all_active_sessions(db_file):
+        session_fields = {**json.loads(payload), "pool_code": pool_code, "station_name": station_name}
+        stored_sessions.append(ChargingSessionUpdate(**session_fields, connector_id=connector_id))
+    assert stored_sessions == [update, other_session]
+
+    # A session completed before its removal was checkpointed is not rehydrated
+    insert_database_charging_session_history(other_session, db_file)
+    assert delete_stale_active_sessions(24, db_file) == 1
+    assert checkpoint_active_sessions_batch([], [rows[0][:3]], db_file)
+    assert get_all_active_sessions(db_file) == []
+
+
+def test_failed_history_insert_keeps_the_completed_session(tmp_path):
+    "Tests that a completed session whose history insert fails is kept, and stored by the retry"
+    search_key = get_search_key(update.pool_code, update.station_name, update.connector_id)
+    busy_error = sqlite3.OperationalError("database is locked")
+    run_write = AsyncMock(side_effect=[0, busy_error, update.transaction_id])  # Compaction, insert, retried insert
+
+    async def complete_and_retry():
+        with (
+            patch.object(data_handling.async_database, "run_write", run_write),
+            patch.object(data_handling, "queue_charging_session_dashboards", AsyncMock()) as queue_dashboards,
+            patch.object(data_handling.telemetry_buffer, "add"),
+            patch.object(data_handling.telemetry_buffer, "flush", AsyncMock()),
+        ):
+            completed = update  # With its time_band
+            await manage_charging_session_update(completed)
+            assert data_handling.active_sessions[search_key] == completed  # Kept, and checkpointed
+            assert completed.transaction_id in data_handling.pending_history_sessions
+            queue_dashboards.assert_not_awaited()
+
+            assert await data_handling.retry_pending_history_sessions() == 1
+            queue_dashboards.assert_awaited_once_with(completed)
+
+    asyncio.run(complete_and_retry())
+    assert search_key not in data_handling.active_sessions
+    assert data_handling.pending_history_sessions == {}
@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from database.async_database import AsyncDatabase
+
+
+def test_writes_run_in_order_on_the_writer_thread():
+    "Tests that the queued writes run one by one, in FIFO order, on the single writer thread"
+    database = AsyncDatabase(reader_count=2)
+    calls: list[tuple[int, str]] = []
+
+    def write(index: int) -> int:
+        calls.append((index, threading.current_thread().name))
+        return index
+
+    async def queue_writes() -> list[int]:
+        return await asyncio.gather(*[database.run_write(write, index) for index in range(20)])
+
+    try:
+        assert asyncio.run(queue_writes()) == list(range(20))
+    finally:
+        database.stop()
+    assert [index for index, _ in calls] == list(range(20))
+    assert {thread_name for _, thread_name in calls} == {"sqlite-writer"}
+
+
+def test_write_exception_reaches_the_caller():
+    "Tests that an exception raised by a write function is raised to the awaiting caller, and the writer goes on"
+    database = AsyncDatabase(reader_count=1)
+
+    def failing_write():
+        raise sqlite3.OperationalError("database is locked")
+
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+            asyncio.run(database.run_write(failing_write))
+        assert asyncio.run(database.run_write(sum, [1, 2])) == 3
+    finally:
+        database.stop()
+
+
+def test_reads_run_concurrently():
+    "Tests that the reads run at the same time in the reader pool, instead of waiting for each other"
+    database = AsyncDatabase(reader_count=2)
+    barrier = threading.Barrier(2, timeout=5)  # Broken if the two reads do not overlap
+
+    def read() -> str:
+        barrier.wait()
+        return threading.current_thread().name
+
+    async def read_twice() -> list[str]:
+        return await asyncio.gather(database.run_read(read), database.run_read(read))
+
+    try:
+        thread_names = asyncio.run(read_twice())
+    finally:
+        database.stop()
+    assert len(set(thread_names)) == 2
+
+
+def test_stop_drains_the_queued_writes():
+    "Tests that stop returns once the writes queued before it have run"
+    database = AsyncDatabase(reader_count=1)
+    write_gate = threading.Event()
+    written: list[int] = []
+
+    async def queue_writes_and_stop():
+        blocked_write = asyncio.create_task(database.run_write(write_gate.wait, 5))
+        writes = [asyncio.create_task(database.run_write(written.append, index)) for index in range(5)]
+        await asyncio.sleep(0)  # The tasks queue their commands behind the blocked write
+
+        stop_task = asyncio.create_task(asyncio.to_thread(database.stop))
+        await asyncio.sleep(0.05)
+        assert written == []  # Still queued, stop is waiting for the writer
+        write_gate.set()
+        await stop_task
+        assert written == list(range(5))
+        await asyncio.gather(blocked_write, *writes)
+
+    asyncio.run(queue_writes_and_stop())
+    assert database.writer_thread is None and database.get_write_queue_size() == 0
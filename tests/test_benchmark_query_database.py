@@ -0,0 +1,11 @@
+from benchmark_query_database import compare_results, run_benchmarks
+
+
+def test_benchmark_harness_covers_every_query_function(tmp_path):
+    "Tests that the offline benchmark measures every query_database function at the tiny scale"
+    results = run_benchmarks("tiny", str(tmp_path / "benchmark.sqlite3"), max_seconds=0.2, iterations_factor=0.05)
+    assert results["missing"] == []
+    assert all(
+        result["iterations"] >= 1 and result["p99_ms"] >= result["p50_ms"] for result in results["results"].values()
+    )
+    assert compare_results(results, results) == []
@@ -0,0 +1,24 @@
+from test_charging_session_update import update
+
+from database.database_backup import get_all_modified_rows_count
+from database.database_check import check_local_database, clear_change_counter
+from database.query_database import insert_database_charging_session_history, insert_database_tagoio_device
+
+
+def test_change_counters_track_writes_and_keep_changes_after_backup(tmp_path):
+    "Tests that the triggers count the changed rows, and clearing only drops the backed up changes"
+    db_file = str(tmp_path / "changes.sqlite3")
+    check_local_database(db_file)
+    table_names = ["tagoio_device", "charging_session_history"]
+    assert get_all_modified_rows_count(table_names, db_file) == {"tagoio_device": 0, "charging_session_history": 0}
+
+    insert_database_tagoio_device(1, "device-id", "device-token", db_file)
+    insert_database_charging_session_history(update, db_file)
+    modified_rows_count = get_all_modified_rows_count(table_names, db_file)
+    assert modified_rows_count == {"tagoio_device": 1, "charging_session_history": 1}
+
+    # A change made during the backup is kept for the next one
+    insert_database_tagoio_device(2, "other-device-id", "other-device-token", db_file)
+    for table_name, backed_up_changes in modified_rows_count.items():
+        assert clear_change_counter(table_name, backed_up_changes, db_file)
+    assert get_all_modified_rows_count(table_names, db_file) == {"tagoio_device": 1, "charging_session_history": 0}
@@ -0,0 +1,80 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from tagoio import data_parsing
+from tagoio.data_parsing import device_full_message, insert_data_in_cloud
+from utils.circuit_breaker import CircuitOpenError, CircuitState, PoolCircuitBreakers
+
+
+def fail_call(breakers: PoolCircuitBreakers, pool_code: int):
+    with pytest.raises(httpx.ReadTimeout), breakers.guard(pool_code):
+        raise httpx.ReadTimeout("timeout")
+
+
+def test_circuit_opens_half_opens_and_closes():
+    "Tests that a pool circuit opens after the threshold, fails fast, lets one trial through, and closes"
+    breakers = PoolCircuitBreakers(failure_threshold=3, open_seconds=60)
+    for _ in range(3):
+        fail_call(breakers, 1)
+
+    breaker = breakers.get_breaker(1)
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError), breakers.guard(1):
+        pytest.fail("An open circuit must not call TagoIO")
+    with breakers.guard(2):  # Other pools are not affected
+        pass
+
+    breaker.opened_at -= 60  # The open period is over: a single trial call
+    with breakers.guard(1):
+        assert breaker.state == CircuitState.HALF_OPEN
+        with pytest.raises(CircuitOpenError), breakers.guard(1):
+            pass
+    assert breaker.state == CircuitState.CLOSED
+    assert breakers.get_stats() == {}
+
+    for _ in range(2):  # A failed trial opens the circuit again, not waiting for the threshold
+        fail_call(breakers, 1)
+    breaker.opened_at -= 60
+    fail_call(breakers, 1)
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_neutral_errors_do_not_count():
+    "Tests that a 404 or a 429 is not a failure of the pool device, while a 401 is"
+    breakers = PoolCircuitBreakers(failure_threshold=1, open_seconds=60)
+    request = httpx.Request("GET", "https://api.tago.io/data")
+    for status_code in (404, 429, 401):
+        error = httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+        with pytest.raises(httpx.HTTPStatusError), breakers.guard(1):
+            raise error
+        assert breakers.get_breaker(1).state == (CircuitState.OPEN if status_code == 401 else CircuitState.CLOSED)
+
+
+def test_full_device_opens_the_circuit_of_its_pool():
+    "Tests that insert_data_in_cloud counts a full device as a failure, and then fails fast"
+    breakers = PoolCircuitBreakers(failure_threshold=2, open_seconds=60)
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"status": False, "message": device_full_message})
+
+    async def send_updates():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with (
+            patch.object(data_parsing, "tago_circuit_breakers", breakers),
+            patch.object(data_parsing, "get_headers_by_pool_code_async", AsyncMock(return_value={})),
+            patch.object(data_parsing.GlobalHTTPClient, "get_client", return_value=client),
+        ):
+            for _ in range(2):
+                await insert_data_in_cloud(7, {"variable": "state", "value": "Disponible"})
+            with pytest.raises(CircuitOpenError):
+                await insert_data_in_cloud(7, {"variable": "state", "value": "Disponible"})
+        await client.aclose()
+
+    asyncio.run(send_updates())
+    assert len(requests) == 2
+    assert breakers.get_stats()[7]["last_failure"] == device_full_message
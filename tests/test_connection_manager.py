@@ -0,0 +1,35 @@
+import gc
+import sqlite3
+import threading
+
+import pytest
+
+from database import connection_manager
+from database.connection_manager import close_all_connections, get_connection
+
+
+def test_connections_are_closed_when_their_thread_exits(tmp_path):
+    "Tests that each thread reuses its connection, closed once the thread exits or by close_all_connections"
+    db_file = str(tmp_path / "connections.sqlite3")
+    worker_connections: list[sqlite3.Connection] = []
+
+    def run_queries():
+        conn = get_connection(db_file)
+        assert get_connection(db_file) is conn  # Reused by the thread
+        conn.execute("SELECT 1;")
+        worker_connections.append(conn)
+
+    worker = threading.Thread(target=run_queries)
+    worker.start()
+    worker.join()
+    gc.collect()
+
+    assert not any(db_file == search_key[1] for search_key in connection_manager.open_connections)
+    with pytest.raises(sqlite3.ProgrammingError):  # Closed by the finalizer of the thread
+        worker_connections[0].execute("SELECT 1;")
+
+    conn = get_connection(db_file)
+    close_all_connections()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1;")
+    assert get_connection(db_file).execute("SELECT 1;").fetchone() == (1,)  # Opened again
@@ -0,0 +1,41 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from test_charging_session_update import update
+
+import data_handling
+from data_handling import checkpoint_connector_statuses, get_search_key, mark_connector_status
+from enumerations import ChargePointStatus
+from schemas.ocpp_csms import ChargePointData
+
+
+def test_status_change_during_the_checkpoint_write_is_kept():
+    "Tests that a connector going back to its stored status during a checkpoint write is checkpointed again"
+    search_key = get_search_key(update.pool_code, "race-station", 1)
+
+    def set_status(status: ChargePointStatus):
+        data_handling.charge_points[search_key] = ChargePointData(
+            pool_code=update.pool_code, station_name="race-station", connector_id=1, charge_point_status=status
+        )
+        mark_connector_status(search_key, status.value)
+
+    async def write_while_flapping(upsert, rows):
+        set_status(ChargePointStatus.AVAILABLE)  # Back to the stored status, before the Charging write ends
+        return True
+
+    async def checkpoint_twice():
+        data_handling.persisted_statuses[search_key] = ChargePointStatus.AVAILABLE.value
+        set_status(ChargePointStatus.CHARGING)
+        with patch.object(data_handling.async_database, "run_write", AsyncMock(side_effect=write_while_flapping)):
+            assert await checkpoint_connector_statuses() == 1
+        assert search_key in data_handling.dirty_statuses  # The stored status is now Charging
+
+        with patch.object(data_handling.async_database, "run_write", AsyncMock(return_value=False)):
+            assert await checkpoint_connector_statuses() == 0
+        assert data_handling.persisted_statuses[search_key] == ChargePointStatus.CHARGING.value  # Restored
+        assert search_key in data_handling.dirty_statuses
+
+    try:
+        asyncio.run(checkpoint_twice())
+    finally:
+        data_handling.remove_station_from_memory(update.pool_code, "race-station")
@@ -0,0 +1,25 @@
+from test_charging_session_update import update
+
+from database.database_check import check_local_database
+from database.query_database import get_daily_pool_stats, insert_database_charging_session_history
+
+
+def test_daily_pool_stats_are_updated_with_each_session(tmp_path):
+    "Tests that each stored session is added once to the stats of its pool, station and day"
+    db_file = str(tmp_path / "history.sqlite3")
+    check_local_database(db_file)
+
+    assert insert_database_charging_session_history(update, db_file) == update.transaction_id
+    second_session = update.model_copy(
+        update={"transaction_id": update.transaction_id + 1, "last_meter_value": update.last_meter_value + 1}
+    )
+    assert insert_database_charging_session_history(second_session, db_file) == second_session.transaction_id
+    assert insert_database_charging_session_history(update, db_file) is None  # Duplicated session
+
+    daily_stats = get_daily_pool_stats(pool_code=update.pool_code, db_file=db_file)
+    assert len(daily_stats) == 1
+    assert daily_stats[0]["day"] == "2024-02-27" and daily_stats[0]["session_count"] == 2
+    assert daily_stats[0]["energy_total"] == 2 * (update.last_meter_value - update.start_meter_value) + 1
+    assert daily_stats[0]["energy_flat"] == 2 * update.energy_flat
+    assert round(daily_stats[0]["cost"], 6) == round(2 * update.cost, 6)
+    assert get_daily_pool_stats(start_day="2024-02-28", db_file=db_file) == []
@@ -0,0 +1,24 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from tagoio.outbound_queue import DashboardOutboundQueue
+
+
+def test_burst_of_updates_is_one_write():
+    "Tests that a burst of values of the same variable is sent once, with the latest value, in one batch per pool"
+    send = AsyncMock(return_value={"status": True})
+    queue = DashboardOutboundQueue(send, flush_interval_ms=1000)
+
+    for tick in range(20):
+        queue.add(
+            1, [{"variable": "energy_CP_1", "value": tick, "group": "CP_[1]"}, {"variable": "state", "value": "CP"}]
+        )
+    queue.add(2, {"variable": "energy_CP_1", "value": 99, "group": "CP_[1]"})  # Same variable, another pool
+
+    assert asyncio.run(queue.flush()) == 3
+    assert sorted(call.args for call in send.await_args_list) == [
+        (1, [{"variable": "energy_CP_1", "value": 19, "group": "CP_[1]"}, {"variable": "state", "value": "CP"}]),
+        (2, [{"variable": "energy_CP_1", "value": 99, "group": "CP_[1]"}]),
+    ]
+    assert queue.get_stats()["coalesced_values"] == 38
+    assert asyncio.run(queue.flush()) == 0  # Nothing pending
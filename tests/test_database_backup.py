@@ -0,0 +1,30 @@
+import os
+import sqlite3
+from contextlib import closing
+
+from database import database_backup
+from database.database_backup import BackupProgress, last_backup_stats, zip_database_file
+from database.database_check import check_local_database
+from database.query_database import insert_database_tagoio_device
+
+
+def test_backup_ends_while_the_database_is_written(tmp_path, monkeypatch):
+    "Tests that a stepped backup restarted by the writes falls back to a single step, and ends"
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "backups").mkdir()
+    db_file = str(tmp_path / "busy.sqlite3")
+    check_local_database(db_file)
+    for index in range(100):
+        insert_database_tagoio_device(index, f"device-id-{index}" * 50, "device-token", db_file)
+
+    class WrittenBackupProgress(BackupProgress):
+        def __call__(self, status: int, remaining: int, total: int):
+            with closing(sqlite3.connect(db_file)) as conn, conn:  # A write between every step
+                conn.execute("UPDATE tagoio_device SET device_token = ? WHERE pool_code = 0;", (str(self.steps),))
+            super().__call__(status, remaining, total)
+
+    monkeypatch.setattr(database_backup, "BackupProgress", WrittenBackupProgress)
+    zip_file = zip_database_file(db_file, "backups/backup.sqlite3", backup_pages=1, max_backup_restarts=2)
+
+    assert zip_file is not None and os.path.exists(zip_file)
+    assert last_backup_stats["backup_restarts"] == 3
@@ -0,0 +1,48 @@
+import sqlite3
+
+from database.database_check import check_local_database, query_indexes
+
+
+def get_query_plan(conn: sqlite3.Connection, query: str, params: tuple) -> str:
+    """Joins the details of the EXPLAIN QUERY PLAN rows of the query"""
+    return " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall())
+
+
+def test_query_indexes_are_created(tmp_path):
+    "Tests that all the query indexes exist once the background migrations are applied"
+    db_file = str(tmp_path / "indexes.sqlite3")
+    check_local_database(db_file)
+
+    with sqlite3.connect(db_file) as conn:
+        index_names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+    assert set(query_indexes).issubset(index_names)
+
+
+def test_history_queries_use_the_query_indexes(tmp_path):
+    "Tests that the pool date range, keyset page and retention queries seek an index instead of scanning the table"
+    db_file = str(tmp_path / "indexes.sqlite3")
+    check_local_database(db_file)
+
+    with sqlite3.connect(db_file) as conn:
+        pool_range_plan = get_query_plan(
+            conn,
+            "SELECT * FROM charging_session_history WHERE pool_code = ? AND start_ts BETWEEN ? AND ?;",
+            (1234, "2024-01-01", "2024-02-01"),
+        )
+        assert "USING INDEX idx_cs_history_pool_start" in pool_range_plan
+
+        keyset_plan = get_query_plan(
+            conn,
+            """
+            SELECT * FROM charging_session_history WHERE station_name = ? AND created_at < ?
+            ORDER BY created_at DESC, transaction_id DESC LIMIT 50;
+            """,
+            ("station", "2024-02-01"),
+        )
+        assert "USING INDEX idx_cs_history_station_created_tx" in keyset_plan
+        assert "TEMP B-TREE" not in keyset_plan  # Rows come already sorted from the index
+
+        retention_plan = get_query_plan(
+            conn, "SELECT COUNT(*) FROM charging_session_telemetry_minute WHERE bucket_start_ms < ?;", (0,)
+        )
+        assert "idx_cs_telemetry_minute_bucket" in retention_plan
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+
+from tagoio import token_fetching
+from utils.rate_limiter import TagoRateLimiter, TokenBucket, get_retry_after_seconds
+
+
+def test_token_bucket_reserves_in_order():
+    "Tests that the burst is served right away, and the next requests wait one slot each"
+    bucket = TokenBucket(rate_per_second=2.0, capacity=2.0)
+
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    waits = [bucket.reserve() for _ in range(3)]
+    assert [round(wait, 1) for wait in waits] == [0.5, 1.0, 1.5]
+
+    bucket.pause(10)
+    assert bucket.reserve() > 10
+
+
+def test_buckets_by_token_and_host():
+    "Tests that each Account-Token and Device-Token has its own bucket, and other hosts are not limited"
+    limiter = TagoRateLimiter(120, 60, api_endpoint="https://api.tago.io")
+    device_request = httpx.Request("POST", "https://api.tago.io/data", headers={"Device-Token": "a"})
+    other_device_request = httpx.Request("GET", "https://api.tago.io/data", headers={"Device-Token": "b"})
+    account_request = httpx.Request("GET", "https://api.tago.io/device", headers={"Account-Token": "a"})
+
+    device_bucket = limiter.get_bucket(device_request)
+    assert device_bucket.rate_per_second == 1.0
+    assert limiter.get_bucket(httpx.Request("GET", "https://api.tago.io/data", headers={"Device-Token": "a"})) is (
+        device_bucket
+    )
+    assert limiter.get_bucket(other_device_request) is not device_bucket
+    assert limiter.get_bucket(account_request).rate_per_second == 2.0
+    assert limiter.get_bucket(httpx.Request("GET", "https://api.telegram.org", headers={"Device-Token": "a"})) is None
+
+
+def test_client_hooks_pace_requests_and_honor_429():
+    "Tests that the request hook paces a burst of requests, and a 429 pauses the bucket by its Retry-After"
+    limiter = TagoRateLimiter(600, 600, api_endpoint="https://api.tago.io")  # 10 req/s, burst of 10
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/limited":
+            return httpx.Response(429, headers={"Retry-After": "30"})
+        return httpx.Response(200, json={"status": True, "result": []})
+
+    async def send_burst() -> float:
+        event_hooks = {"request": [limiter.acquire], "response": [limiter.handle_async_response]}
+        headers = {"Device-Token": "a"}
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), event_hooks=event_hooks) as client:
+            start = time.monotonic()
+            await asyncio.gather(*[client.get("https://api.tago.io/data", headers=headers) for _ in range(13)])
+            elapsed = time.monotonic() - start
+            await client.get("https://api.tago.io/limited", headers=headers)
+        return elapsed
+
+    elapsed = asyncio.run(send_burst())
+    assert 0.2 <= elapsed < 1.0  # 3 requests over the burst, at 10 req/s
+    assert limiter.buckets[("Device-Token", "a")].reserve() > 29
+
+
+def test_retry_after_parsing():
+    "Tests the Retry-After parsing, as seconds, as an HTTP date, or missing"
+    assert get_retry_after_seconds("5") == 5.0
+    assert get_retry_after_seconds(None) == 60.0
+    assert get_retry_after_seconds("not a date", default=1.0) == 1.0
+    assert get_retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_device_fetch_from_a_coroutine_runs_in_a_worker_thread():
+    "Tests that a pool missing from the cache is fetched outside the event loop, as the blocking client sleeps"
+    fetch_threads: list[threading.Thread] = []
+
+    def fetch_device_data(pool_code: int) -> tuple[str, str]:
+        fetch_threads.append(threading.current_thread())
+        time.sleep(0.01)  # E.g. waiting for the Account-Token bucket
+        return "device-id", "device-token"
+
+    async def get_headers():
+        with patch.object(token_fetching, "get_device_data_by_pool_code", side_effect=fetch_device_data):
+            return await token_fetching.get_headers_by_pool_code_async(-1)
+
+    assert asyncio.run(get_headers())["Device-Token"] == "device-token"
+    assert fetch_threads and fetch_threads[0] is not threading.main_thread()
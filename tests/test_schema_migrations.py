@@ -0,0 +1,86 @@
+import sqlite3
+
+from database.database_check import check_local_database, query_indexes, run_background_migrations, schema_migrations
+from database.schema_migrations import Migration, get_schema_version, run_migrations
+
+
+def test_pending_migrations_are_applied_once(tmp_path):
+    "Tests that a new database gets every step, deferring the background ones when asked"
+    db_file = str(tmp_path / "new.sqlite3")
+    latest_version = schema_migrations[-1].version
+    background_version = next(migration.version for migration in schema_migrations if migration.in_background)
+
+    check_local_database(db_file, include_background=False)
+    assert get_schema_version(db_file) == background_version - 1  # The query indexes are built in the background
+    assert run_background_migrations(db_file) == latest_version
+
+    with sqlite3.connect(db_file) as conn:
+        index_names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+    assert "idx_cs_history_created_tx" in index_names
+
+
+def test_each_query_index_is_its_own_background_step():
+    "Tests that every query index is built by a single background step, so no transaction builds them all"
+    background_steps = [migration for migration in schema_migrations if migration.in_background]
+    assert len(background_steps) == len(query_indexes)
+    assert [migration.description for migration in background_steps] == [
+        f"query index {index_name}" for index_name in query_indexes
+    ]
+
+
+def test_startup_schema_does_not_wait_for_the_background_steps(tmp_path):
+    "Tests that a new database has the epoch columns, the tick table and the outbox before the index build"
+    db_file = str(tmp_path / "startup.sqlite3")
+    check_local_database(db_file, include_background=False)
+
+    assert all(
+        migration.in_background for migration in schema_migrations if migration.version > get_schema_version(db_file)
+    )
+    with sqlite3.connect(db_file) as conn:
+        history_columns = {row[1] for row in conn.execute("PRAGMA table_info(charging_session_history);")}
+        table_names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    assert {"start_ts", "end_ts"} <= history_columns
+    assert {"charging_session_telemetry_tick", "tagoio_outbox"} <= table_names
+
+
+def test_legacy_database_is_migrated_without_losing_history(tmp_path):
+    "Tests that a database created before the versioned migrations keeps its sessions, minus the duplicates"
+    db_file = str(tmp_path / "legacy.sqlite3")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("""
+            CREATE TABLE charging_session_history(
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP, pool_code INTEGER NOT NULL,
+                station_name TEXT NOT NULL, connector_id INTEGER NOT NULL, transaction_id INTEGER NOT NULL DEFAULT 0,
+                card_alias TEXT NOT NULL, start_date TEXT NOT NULL, time_band TEXT NOT NULL,
+                start_meter_value INTEGER NOT NULL, last_meter_value INTEGER NOT NULL, cost REAL NOT NULL,
+                is_modified INTEGER NOT NULL DEFAULT 1
+            );
+        """)
+        row = (1, "STATION", 1, 1234, "RFID", "27/02/2024", "09:00 - 10:00", 1000, 2000, 0.5)
+        insert_query = """
+            INSERT INTO charging_session_history (pool_code, station_name, connector_id, transaction_id, card_alias,
+            start_date, time_band, start_meter_value, last_meter_value, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """
+        conn.executemany(insert_query, [row, row, (*row[:7], 2000, 3000, 0.5)])
+
+    check_local_database(db_file)
+    assert get_schema_version(db_file) == schema_migrations[-1].version
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("SELECT COUNT(*), SUM(energy_flat) FROM charging_session_history;").fetchone() == (2, 0)
+        assert conn.execute("SELECT SUM(session_count) FROM daily_pool_stats;").fetchone()[0] == 2
+
+
+def test_failed_migration_is_rolled_back(tmp_path):
+    "Tests that a failing step rolls back the whole pending batch"
+    db_file = str(tmp_path / "failed.sqlite3")
+
+    def failing_step(conn: sqlite3.Connection):
+        conn.execute("SELECT * FROM missing_table;")
+
+    migrations = [
+        Migration(1, "new table", lambda conn: conn.execute("CREATE TABLE new_table(id INTEGER);")),
+        Migration(2, "failing step", failing_step),
+    ]
+    assert run_migrations(migrations, db_file) == 0
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'new_table';").fetchone() is None
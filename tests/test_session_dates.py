@@ -0,0 +1,44 @@
+import sqlite3
+
+from test_charging_session_update import update
+
+from database.database_check import backfill_session_epochs, check_local_database
+from database.query_database import (
+    get_charging_sessions_from_pool_code,
+    get_recent_sessions,
+    insert_database_charging_session_history,
+)
+from database.session_dates import get_session_epochs
+
+
+def test_session_epochs_cross_midnight():
+    "Tests that a time band ending earlier than its start ends on the next day, in local time"
+    start_ts, end_ts = get_session_epochs("30/03/2025", "23:30 - 01:15")  # Before the DST change at 02:00
+    assert end_ts - start_ts == 105 * 60
+    assert get_session_epochs("30/03/2025", None) == (None, None)
+
+
+def test_sessions_are_filtered_by_start_day(tmp_path):
+    "Tests that the date-range queries return the sessions started within the days, including backfilled ones"
+    db_file = str(tmp_path / "history.sqlite3")
+    check_local_database(db_file)
+    for index, start_date in enumerate(["28/02/2024", "01/03/2024", "31/03/2024", "01/04/2024"]):
+        session = update.model_copy(
+            update={
+                "transaction_id": index,
+                "start_date": start_date,
+                "last_meter_value": update.last_meter_value + index,
+            }
+        )
+        insert_database_charging_session_history(session, db_file)
+
+    with sqlite3.connect(db_file) as conn:  # As inserted before the epoch columns
+        conn.execute("UPDATE charging_session_history SET start_ts = NULL, end_ts = NULL WHERE transaction_id = 2;")
+    assert backfill_session_epochs(db_file, batch_size=1, pause_seconds=0) == 1
+
+    march_sessions = get_charging_sessions_from_pool_code(update.pool_code, "2024-03-01", "2024-03-31", db_file)
+    assert [session[5] for session in march_sessions] == ["01/03/2024", "31/03/2024"]
+
+    recent_sessions = get_recent_sessions(10, update.pool_code, start_day="2024-03-01", db_file=db_file)
+    assert [session["transaction_id"] for session in recent_sessions] == [3, 2, 1]
+    assert len(get_charging_sessions_from_pool_code(update.pool_code, db_file=db_file)) == 4
@@ -0,0 +1,25 @@
+from test_charging_session_update import update
+
+from database.database_check import check_local_database
+from database.query_database import insert_database_charging_session_history, search_sessions
+
+
+def test_session_search_finds_fragments_and_follows_history_changes(tmp_path):
+    "Tests that the full-text index matches alias, station and transaction fragments, kept in sync by triggers"
+    db_file = str(tmp_path / "history.sqlite3")
+    check_local_database(db_file)
+    for index, card_alias in enumerate(["RFID-ALPHA", "RFID-BRAVO", "APP-ALPHA"]):
+        session = update.model_copy(
+            update={
+                "transaction_id": 7700 + index,
+                "last_meter_value": update.last_meter_value + index,
+                "card_alias": card_alias,
+            }
+        )
+        insert_database_charging_session_history(session, db_file)
+
+    assert [session["transaction_id"] for session in search_sessions("alpha", db_file=db_file)] == [7702, 7700]
+    assert [session["transaction_id"] for session in search_sessions("rfid alp", db_file=db_file)] == [7700]
+    assert [session["transaction_id"] for session in search_sessions("7701", db_file=db_file)] == [7701]
+    assert len(search_sessions(update.station_name, pool_code=update.pool_code, db_file=db_file)) == 3
+    assert search_sessions('"', db_file=db_file) == []
@@ -0,0 +1,71 @@
+from test_charging_session_update import update
+
+from database.database_check import check_local_database
+from database.query_database import get_sessions_page, insert_database_charging_session_history
+
+
+def test_sessions_pages_follow_the_keyset_cursor(tmp_path):
+    "Tests that the keyset pages cover every filtered session once, newest first"
+    db_file = str(tmp_path / "history.sqlite3")
+    check_local_database(db_file)
+    for index in range(7):
+        session = update.model_copy(
+            update={
+                "transaction_id": index,
+                "last_meter_value": update.last_meter_value + index,
+                "card_alias": "CARD-A" if index % 2 else "CARD-B",
+            }
+        )
+        insert_database_charging_session_history(session, db_file)
+
+    transaction_ids, cursor = [], None
+    while True:
+        sessions, cursor = get_sessions_page(2, cursor, card_alias="CARD-B", db_file=db_file)
+        transaction_ids += [session["transaction_id"] for session in sessions]
+        if cursor is None:
+            break
+
+    assert transaction_ids == [6, 4, 2, 0]  # Same created_at second, ordered by transaction_id
+    assert get_sessions_page(10, start_day="2000-01-01", end_day="2000-12-31", db_file=db_file) == ([], None)
+
+
+def test_sessions_page_days_are_local_start_days(tmp_path):
+    "Tests that the day filters match the local start day of the sessions, as the export does, not created_at"
+    db_file = str(tmp_path / "history.sqlite3")
+    check_local_database(db_file)
+    # 00:30 in Madrid on 28/02/2024 is still 27/02/2024 in UTC
+    after_midnight = update.model_copy(
+        update={
+            "transaction_id": update.transaction_id + 1,
+            "last_meter_value": update.last_meter_value + 1,
+            "start_date": "28/02/2024",
+            "time_band": "00:30 - 01:00",
+        }
+    )
+    insert_database_charging_session_history(update, db_file)
+    insert_database_charging_session_history(after_midnight, db_file)
+
+    def get_day_transaction_ids(start_day: str, end_day: str) -> list[int]:
+        sessions, _ = get_sessions_page(10, start_day=start_day, end_day=end_day, db_file=db_file)
+        return [session["transaction_id"] for session in sessions]
+
+    assert get_day_transaction_ids("2024-02-27", "2024-02-27") == [update.transaction_id]
+    assert get_day_transaction_ids("2024-02-28", "2024-02-28") == [after_midnight.transaction_id]
+    assert get_day_transaction_ids("2024-02-27", "2024-02-28") == [after_midnight.transaction_id, update.transaction_id]
+
+
+def test_sessions_pages_break_ties_by_rowid(tmp_path):
+    "Tests that the sessions sharing created_at and transaction_id (of different pools) are all paged once"
+    db_file = str(tmp_path / "history.sqlite3")
+    check_local_database(db_file)
+    for pool_code in range(5):  # Same transaction_id in every pool, inserted in the same second
+        insert_database_charging_session_history(update.model_copy(update={"pool_code": pool_code}), db_file)
+
+    pool_codes, cursor = [], None
+    while True:
+        sessions, cursor = get_sessions_page(2, cursor, db_file=db_file)
+        pool_codes += [session["pool_code"] for session in sessions]
+        if cursor is None:
+            break
+
+    assert pool_codes == [4, 3, 2, 1, 0]  # Newest insert first
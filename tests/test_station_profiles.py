@@ -0,0 +1,51 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import data_handling
+from data_handling import ensure_station_profile, get_station_noc, load_station_profiles_from_db
+from database.database_check import check_local_database
+from database.query_database import get_all_station_profiles, upsert_station_profile
+
+
+def test_station_profile_upsert_only_grows_the_noc(tmp_path):
+    "Tests that the station profile upsert inserts new stations, and only updates the NOC when it grows"
+    db_file = str(tmp_path / "stations.sqlite3")
+    check_local_database(db_file)
+
+    assert upsert_station_profile(1234, "profile-station", 2, db_file)
+    assert upsert_station_profile(1234, "profile-station", 1, db_file)  # Lower NOC, kept as 2
+    assert get_all_station_profiles(db_file) == [("profile-station", 1234, 2)]
+
+    assert upsert_station_profile(1234, "profile-station", 3, db_file)
+    assert get_all_station_profiles(db_file) == [("profile-station", 1234, 3)]
+
+
+def test_station_profile_cache_skips_the_known_stations(tmp_path):
+    "Tests that SQLite is only written when a station is new or its NOC grows, and the NOC is answered from memory"
+    db_file = str(tmp_path / "stations.sqlite3")
+    check_local_database(db_file)
+    assert upsert_station_profile(1234, "cached-station", 2, db_file)
+
+    async def write_to_test_database(func, *args):
+        return func(*args, db_file)
+
+    async def update_connectors():
+        for connector_id in [0, 1, 2, 1, 3, 2]:
+            await ensure_station_profile(1234, "cached-station", connector_id)
+        await ensure_station_profile(1234, "new-station", 1)
+
+    run_write = AsyncMock(side_effect=write_to_test_database)
+    try:
+        with patch.object(data_handling, "get_all_station_profiles", lambda: get_all_station_profiles(db_file)):
+            load_station_profiles_from_db()
+        assert get_station_noc("cached-station") == 2
+
+        with patch.object(data_handling.async_database, "run_write", run_write):
+            asyncio.run(update_connectors())
+        assert run_write.await_count == 2  # The NOC growing to 3 and the new station
+        assert get_station_noc("cached-station") == 3 and get_station_noc("new-station") == 1
+        assert sorted(get_all_station_profiles(db_file)) == [("cached-station", 1234, 3), ("new-station", 1234, 1)]
+    finally:
+        data_handling.remove_station_from_memory(1234, "cached-station")
+        data_handling.remove_station_from_memory(1234, "new-station")
+    assert get_station_noc("cached-station") is None
@@ -0,0 +1,90 @@
+import csv
+import sqlite3
+from io import BytesIO, StringIO
+
+import openpyxl
+import pytest
+from test_charging_session_update import update
+
+from database.database_check import check_local_database
+from database.query_database import (
+    compact_session_telemetry,
+    get_charging_sessions_from_pool_code,
+    get_recent_sessions,
+    get_session_history,
+    get_telemetry_for_session,
+    insert_charging_session_telemetry_batch,
+    insert_database_charging_session_history,
+    iter_all_connector_statuses,
+    iter_charging_sessions_from_pool_code,
+    iter_recent_sessions,
+    iter_telemetry_for_session,
+    stream_query_rows,
+    upsert_connector_statuses_batch,
+)
+from export_utils import generate_telemetry_excel, iter_csv_chunks, telemetry_csv_headers
+
+
+def test_streaming_variants_match_the_lists(tmp_path):
+    "Tests that the fetchmany streams provide the same rows as the fetchall queries, across batches"
+    db_file = str(tmp_path / "streaming.sqlite3")
+    check_local_database(db_file)
+    for index in range(5):
+        session = update.model_copy(
+            update={"transaction_id": index, "last_meter_value": update.last_meter_value + index}
+        )
+        insert_database_charging_session_history(session, db_file)
+    upsert_connector_statuses_batch([(update.pool_code, f"STATION-{i}", 1, "Available") for i in range(5)], db_file)
+
+    rows = [(1234, f"2024-02-27T09:{i:02d}:00Z", 10000 + i, 7400, 0.1 * i, "Flat", 0, i, 0) for i in range(7)]
+    insert_charging_session_telemetry_batch(rows[:4], db_file)
+    compact_session_telemetry(1234, db_file)
+    insert_charging_session_telemetry_batch(rows[4:], db_file)  # Packed and raw ticks, merged
+
+    assert list(iter_telemetry_for_session(1234, db_file, batch_size=2)) == get_telemetry_for_session(1234, db_file)
+    assert len(get_telemetry_for_session(1234, db_file)) == len(rows)
+    assert list(iter_charging_sessions_from_pool_code(update.pool_code, db_file=db_file, batch_size=2)) == (
+        get_charging_sessions_from_pool_code(update.pool_code, db_file=db_file)
+    )
+    assert list(iter_all_connector_statuses(db_file, batch_size=2)) == [
+        (update.pool_code, f"STATION-{i}", 1, "Available") for i in range(5)
+    ]
+    assert list(iter_recent_sessions(3, db_file=db_file, batch_size=2)) == get_recent_sessions(3, db_file=db_file)
+    assert list(iter_telemetry_for_session(999, db_file)) == []
+
+
+def test_exports_consume_the_streams(tmp_path):
+    "Tests that the CSV and XLSX exports write every streamed telemetry row"
+    db_file = str(tmp_path / "exports.sqlite3")
+    check_local_database(db_file)
+    insert_database_charging_session_history(update, db_file)
+    rows = [
+        (update.transaction_id, f"2024-02-27T09:{i:02d}:00Z", 10000 + i, 7400, 0.1, "Peak", 0, 0, i) for i in range(5)
+    ]
+    insert_charging_session_telemetry_batch(rows, db_file)
+
+    csv_chunks = iter_csv_chunks(telemetry_csv_headers, iter_telemetry_for_session(update.transaction_id, db_file), 2)
+    csv_rows = list(csv.reader(StringIO("".join(csv_chunks))))
+    assert csv_rows[0] == telemetry_csv_headers
+    assert [csv_row[0] for csv_row in csv_rows[1:]] == [row[1] for row in rows]
+
+    session = get_session_history(update.transaction_id, db_file)
+    excel_stream = generate_telemetry_excel(session, iter_telemetry_for_session(update.transaction_id, db_file))
+    ws = openpyxl.load_workbook(BytesIO(excel_stream.getvalue())).active
+    assert ws.max_row == 6 + len(rows)
+    assert ws.auto_filter.ref == f"A6:I{6 + len(rows)}"
+    assert [ws.cell(row=7 + i, column=2).value for i in range(len(rows))] == [row[2] for row in rows]
+
+
+def test_stream_errors_reach_the_consumer(tmp_path):
+    "Tests that a failing stream raises to its consumer, instead of ending as if it had no more rows"
+    db_file = str(tmp_path / "streaming.sqlite3")
+    check_local_database(db_file)
+
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        list(stream_query_rows("SELECT * FROM missing_table;", (), db_file))
+
+    with sqlite3.connect(db_file) as conn:  # A legacy table without the expected columns
+        conn.execute("CREATE TABLE charging_session_telemetry (transaction_id INTEGER);")
+    with pytest.raises(sqlite3.OperationalError):
+        list(iter_telemetry_for_session(1234, db_file))
@@ -0,0 +1,53 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from test_charging_session_update import update
+
+from tagoio import data_parsing
+from tagoio.data_parsing import (
+    device_full_message,
+    get_charging_session_dashboards_batch,
+    handle_variable_insert,
+    send_variable_insert,
+)
+from tagoio.outbound_queue import DashboardOutboundQueue
+
+
+def test_session_update_is_a_single_batch():
+    "Tests that the session values, the forced status and the public values of a tick are sent in one request"
+    session = update.model_copy(update={"step": "INPROGRESS", "time_band": None, "has_public_dashboard": True})
+    data_parsing.translated_statuses.clear()  # Sync loss, the CHARGING status is forced
+    queue = DashboardOutboundQueue(send_variable_insert)
+
+    with patch.object(data_parsing, "insert_data_in_cloud", AsyncMock(return_value={"status": True})) as mock_insert:
+        queue.add(session.pool_code, get_charging_session_dashboards_batch(session))
+        assert asyncio.run(queue.flush()) == 6
+
+    mock_insert.assert_awaited_once()
+    pool_code, batch = mock_insert.await_args.args
+    assert pool_code == session.pool_code
+    suffix = f"{session.station_name}_{session.connector_id}"
+    assert [data["variable"] for data in batch] == [
+        "active_cs_data",
+        "state",
+        f"state_{suffix}",
+        f"energy_{suffix}",
+        f"cost_{suffix}",
+        f"time_{suffix}",
+    ]
+
+
+def test_full_device_retries_the_whole_batch():
+    "Tests that the capacity-limit cleanup retries the batch as a whole, and that empty batches are not sent"
+    batch = [{"variable": "energy", "value": 1}, {"variable": "cost", "value": 2}]
+    results = [{"status": False, "message": device_full_message}, {"status": True, "result": "2 Data Added"}]
+
+    with (
+        patch.object(data_parsing, "insert_data_in_cloud", AsyncMock(side_effect=results)) as mock_insert,
+        patch.object(data_parsing, "pool_variable_cleanup", AsyncMock()) as mock_cleanup,
+    ):
+        assert asyncio.run(handle_variable_insert(1, batch)) == results[1]
+        assert asyncio.run(handle_variable_insert(1, [])) is None
+
+    mock_cleanup.assert_awaited_once_with(1)
+    assert [call.args for call in mock_insert.await_args_list] == [(1, batch), (1, batch)]
@@ -0,0 +1,166 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from database.database_check import check_local_database
+from database.query_database import get_outbox_entries
+from tagoio import data_parsing
+from tagoio.data_parsing import TagoInsertError, device_full_message, send_variable_insert
+from tagoio.outbox import TagoOutbox, get_backoff_seconds, is_retryable_error
+
+
+def get_status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.tago.io/data")
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status_code}", request=request, response=response)
+
+
+def test_failed_writes_survive_and_are_sent_in_order(tmp_path):
+    "Tests that a failed send is kept with a backoff, survives a restart, and is then sent in order, merged"
+    db_file = str(tmp_path / "outbox.sqlite3")
+    check_local_database(db_file)
+
+    async def enqueue_and_fail():
+        outbox = TagoOutbox(AsyncMock(side_effect=httpx.ReadTimeout("timeout")), db_file)
+        await outbox.enqueue(1, [{"variable": "energy_CP_1", "value": 1, "group": "CP_[1]"}])
+        await outbox.enqueue(1, {"variable": "charging_session_data", "value": 7, "group": "7"})
+        await outbox.enqueue(1, [{"variable": "energy_CP_1", "value": 2, "group": "CP_[1]"}])
+        await outbox.enqueue(2, [])  # Empty batch, nothing stored
+        await outbox.drain()
+        return outbox
+
+    outbox = asyncio.run(enqueue_and_fail())
+    assert outbox.get_stats()["pending_entries"] == 3
+    assert outbox.get_stats()["failed_sends"] == 1
+    assert [attempts for _, attempts, _ in get_outbox_entries(1, db_file=db_file)] == [1, 1, 1]
+
+    async def restart_and_send():
+        send = AsyncMock(return_value={"status": True})
+        outbox = TagoOutbox(send, db_file, poll_interval_ms=10)
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.05)
+        assert outbox.get_stats()["pending_entries"] == 3  # Loaded from the table, waiting for the retry
+        await asyncio.sleep(1.0)  # First backoff: 0.5 to 1 second
+        await outbox.stop()
+        await task
+        return outbox, send
+
+    outbox, send = asyncio.run(restart_and_send())
+    send.assert_awaited_once_with(
+        1,
+        [
+            {"variable": "charging_session_data", "value": 7, "group": "7"},
+            {"variable": "energy_CP_1", "value": 2, "group": "CP_[1]"},
+        ],
+    )
+    assert outbox.get_stats()["pending_entries"] == 0
+    assert get_outbox_entries(1, db_file=db_file) == []
+
+
+def test_not_retryable_errors_are_dropped(tmp_path):
+    "Tests that a rejected batch (e.g. 400 Bad Request) leaves the outbox, while a 503 is retried"
+    db_file = str(tmp_path / "outbox.sqlite3")
+    check_local_database(db_file)
+
+    async def send_rejected():
+        outbox = TagoOutbox(AsyncMock(side_effect=get_status_error(400)), db_file)
+        await outbox.enqueue(1, {"variable": "state", "value": "Disponible"})
+        await outbox.drain()
+        return outbox
+
+    outbox = asyncio.run(send_rejected())
+    assert outbox.get_stats()["dropped_entries"] == 1
+    assert get_outbox_entries(1, db_file=db_file) == []
+
+    assert is_retryable_error(get_status_error(503))
+    assert is_retryable_error(get_status_error(429))
+    assert is_retryable_error(httpx.ConnectError("refused"))
+    assert not is_retryable_error(get_status_error(401))
+
+
+def test_rejected_batch_is_resent_entry_by_entry(tmp_path):
+    "Tests that a rejected merged batch only drops its bad entry, and the session history entry is still sent"
+    db_file = str(tmp_path / "outbox.sqlite3")
+    check_local_database(db_file)
+    bad_entry = {"variable": "state", "value": None}
+    history_entry = {"variable": "charging_session_data", "value": 7, "group": "7"}
+
+    async def send(pool_code: int, data: dict | list[dict]):
+        if isinstance(data, list) or data == bad_entry:
+            raise get_status_error(400)  # The merged batch, or the bad entry alone
+        return {"status": True}
+
+    async def enqueue_and_send():
+        outbox = TagoOutbox(AsyncMock(side_effect=send), db_file)
+        await outbox.enqueue(1, bad_entry)
+        await outbox.enqueue(1, history_entry)
+        await outbox.drain()
+        return outbox
+
+    outbox = asyncio.run(enqueue_and_send())
+    assert [call.args for call in outbox.send.await_args_list] == [
+        (1, [bad_entry, history_entry]),
+        (1, bad_entry),
+        (1, history_entry),
+    ]
+    assert (outbox.get_stats()["sent_entries"], outbox.get_stats()["dropped_entries"]) == (1, 1)
+    assert outbox.get_stats()["pending_entries"] == 0
+    assert get_outbox_entries(1, db_file=db_file) == []
+
+
+def test_retryable_error_stops_the_entry_resend(tmp_path):
+    "Tests that a retryable error while resending the entries of a rejected batch keeps the unsent ones"
+    db_file = str(tmp_path / "outbox.sqlite3")
+    check_local_database(db_file)
+    results = [get_status_error(400), {"status": True}, get_status_error(503)]
+
+    async def enqueue_and_send():
+        outbox = TagoOutbox(AsyncMock(side_effect=results), db_file)
+        for value in range(3):
+            await outbox.enqueue(1, {"variable": f"energy_{value}", "value": value})
+        await outbox.drain()
+        return outbox
+
+    outbox = asyncio.run(enqueue_and_send())
+    assert (outbox.get_stats()["sent_entries"], outbox.get_stats()["failed_sends"]) == (1, 1)
+    assert [json.loads(payload)["value"] for _, _, payload in get_outbox_entries(1, db_file=db_file)] == [1, 2]
+
+
+def test_negative_results_are_not_sent_entries(tmp_path):
+    "Tests that a {'status': false} result is dropped, or retried for a full device, instead of counting as sent"
+    db_file = str(tmp_path / "outbox.sqlite3")
+    check_local_database(db_file)
+    rejected = {"status": False, "message": "Authorization denied"}
+    full = {"status": False, "message": device_full_message}
+
+    async def send_with_results(results: list[dict]) -> TagoOutbox:
+        outbox = TagoOutbox(send_variable_insert, db_file)
+        with (
+            patch.object(data_parsing, "insert_data_in_cloud", AsyncMock(side_effect=results)),
+            patch.object(data_parsing, "pool_variable_cleanup", AsyncMock()),
+        ):
+            await outbox.enqueue(1, {"variable": "state", "value": "Disponible"})
+            await outbox.drain()
+        return outbox
+
+    outbox = asyncio.run(send_with_results([rejected]))
+    assert (outbox.get_stats()["sent_entries"], outbox.get_stats()["dropped_entries"]) == (0, 1)
+    assert get_outbox_entries(1, db_file=db_file) == []
+
+    outbox = asyncio.run(send_with_results([full, full]))  # Still full after the cleanup: retried later
+    assert (outbox.get_stats()["sent_entries"], outbox.get_stats()["failed_sends"]) == (0, 1)
+    assert len(get_outbox_entries(1, db_file=db_file)) == 1
+
+    assert is_retryable_error(TagoInsertError(1, full))
+    assert not is_retryable_error(TagoInsertError(1, rejected))
+
+
+def test_backoff_is_exponential_with_jitter():
+    "Tests that the backoff doubles with each attempt, within its jitter range, up to the maximum delay"
+    for attempts in range(4):
+        delay = get_backoff_seconds(attempts, base_delay_ms=1000, max_delay_ms=60_000)
+        assert 2**attempts / 2 <= delay <= 2**attempts
+
+    assert 30 <= get_backoff_seconds(20, base_delay_ms=1000, max_delay_ms=60_000) <= 60
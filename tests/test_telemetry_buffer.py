@@ -0,0 +1,69 @@
+import asyncio
+from time import monotonic
+from unittest.mock import patch
+
+from test_charging_session_update import update
+
+from database import query_database, telemetry_buffer
+from database.database_check import check_local_database
+from database.query_database import get_telemetry_for_session, get_telemetry_rollups
+from database.telemetry_buffer import TelemetryWriteBuffer
+
+
+def test_telemetry_buffer_drops_duplicates_and_group_commits(tmp_path):
+    "Tests that duplicated ticks are dropped and the buffered rows are stored in one flush"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+    buffer = TelemetryWriteBuffer(max_rows=100, max_latency_ms=50, db_file=db_file)
+
+    first_tick = update.model_copy(update={"last_meter_ts": "2024-02-27T09:44:00Z"})
+    assert buffer.add(first_tick)
+    assert not buffer.add(first_tick)  # Duplicated (transaction_id, timestamp) tick
+    assert buffer.add(update)
+
+    assert asyncio.run(buffer.flush()) == 2
+    assert not buffer.add(update)  # Already flushed tick
+    assert len(get_telemetry_for_session(update.transaction_id, db_file)) == 2
+
+    stats = buffer.get_stats()
+    assert stats["flush_count"] == 1 and stats["dropped_duplicates"] == 2
+
+
+def test_telemetry_buffer_provides_the_previous_rows(tmp_path):
+    "Tests that the following flushes compute the rollup deltas from the last flushed rows, not reading them back"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+    buffer = TelemetryWriteBuffer(max_rows=100, max_latency_ms=50, db_file=db_file)
+    ticks = [
+        update.model_copy(update={"last_meter_ts": f"2024-02-27T09:4{i}:00Z", "energy_flat": 1000 + 100 * i})
+        for i in range(4)
+    ]
+
+    get_previous_row = patch.object(
+        query_database, "get_previous_telemetry_row", wraps=query_database.get_previous_telemetry_row
+    )
+    with get_previous_row as previous_row_reads:
+        for tick in ticks:
+            buffer.add(tick)
+            assert asyncio.run(buffer.flush()) == 1
+    assert previous_row_reads.call_count == 1  # Only for the first flush of the transaction
+
+    minute_rollups = get_telemetry_rollups(update.transaction_id, "minute", db_file)
+    assert [rollup["energy_flat"] for rollup in minute_rollups] == [1000, 100, 100, 100]  # Energy deltas
+
+
+def test_telemetry_buffer_forgets_the_idle_transactions(tmp_path):
+    "Tests that a transaction without flushed ticks for max_idle_seconds stops being tracked, even without COMPLETED"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+    buffer = TelemetryWriteBuffer(max_rows=100, max_latency_ms=50, db_file=db_file, max_idle_seconds=60)
+    other_session = update.model_copy(update={"transaction_id": update.transaction_id + 1})
+
+    buffer.add(update)
+    assert asyncio.run(buffer.flush()) == 1
+    with patch.object(telemetry_buffer, "monotonic", return_value=monotonic() + 61):
+        buffer.add(other_session)
+        assert asyncio.run(buffer.flush()) == 1
+
+    assert list(buffer.last_flushed_rows) == [other_session.transaction_id]
+    assert buffer.get_stats()["tracked_transactions"] == 1
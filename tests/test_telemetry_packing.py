@@ -0,0 +1,30 @@
+from database.database_check import check_local_database
+from database.query_database import (
+    compact_session_telemetry,
+    get_telemetry_for_session,
+    insert_charging_session_telemetry_batch,
+)
+
+
+def test_compacted_telemetry_is_decoded_transparently(tmp_path):
+    "Tests that the packed blob of a session provides the same rows as the original telemetry"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+
+    bands = ["Off-Peak", "Off-Peak", "Flat", "Peak", "Peak"]
+    rows = [
+        (1234, f"2024-02-27T09:4{i}:00Z", 10000 + i * 250, 7400 - i, 0.25 * i, band, 250 * i, 0, 0)
+        for i, band in enumerate(bands)
+    ]
+    assert insert_charging_session_telemetry_batch(rows, db_file)
+    original_rows = get_telemetry_for_session(1234, db_file)
+
+    assert compact_session_telemetry(1234, db_file) == len(rows)
+    assert get_telemetry_for_session(1234, db_file) == original_rows
+
+    # A tick stored after the compaction is merged, and packed again on the next compaction
+    late_row = (1234, "2024-02-27T09:50:00Z", 12000, 0, 1.5, "Peak", 1000, 0, 250)
+    assert insert_charging_session_telemetry_batch([late_row], db_file)
+    assert get_telemetry_for_session(1234, db_file) == original_rows + [late_row[1:]]
+    assert compact_session_telemetry(1234, db_file) == 1
+    assert get_telemetry_for_session(1234, db_file) == original_rows + [late_row[1:]]
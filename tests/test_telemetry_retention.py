@@ -0,0 +1,62 @@
+import sqlite3
+
+from database.database_check import check_local_database, run_background_migrations
+from database.query_database import (
+    delete_database_cs_telemetry,
+    incremental_vacuum_database,
+    insert_charging_session_telemetry_batch,
+)
+
+
+def get_auto_vacuum(db_file: str) -> int:
+    """Reads the auto_vacuum mode of the database (0: NONE, 1: FULL, 2: INCREMENTAL)"""
+    with sqlite3.connect(db_file) as conn:
+        return conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+
+
+def test_new_database_starts_with_incremental_auto_vacuum(tmp_path):
+    "Tests that a new database uses incremental auto_vacuum, with no background VACUUM needed"
+    db_file = str(tmp_path / "retention.sqlite3")
+    check_local_database(db_file, include_background=False)
+    assert get_auto_vacuum(db_file) == 2
+
+
+def test_existing_database_is_vacuumed_in_background(tmp_path):
+    "Tests that the full VACUUM switching an existing database to incremental auto_vacuum is not run at startup"
+    db_file = str(tmp_path / "retention.sqlite3")
+    with sqlite3.connect(db_file) as conn:  # A database created before the incremental auto_vacuum
+        conn.execute("CREATE TABLE legacy_table (id INTEGER PRIMARY KEY);")
+
+    check_local_database(db_file, include_background=False)
+    assert get_auto_vacuum(db_file) == 0  # Only the pragma is set, the VACUUM is pending
+
+    run_background_migrations(db_file)
+    assert get_auto_vacuum(db_file) == 2
+
+
+def test_old_telemetry_is_deleted_in_chunks_and_reclaimed(tmp_path):
+    "Tests that the old raw telemetry is deleted over several bounded chunks, and its free pages reclaimed"
+    db_file = str(tmp_path / "retention.sqlite3")
+    check_local_database(db_file)
+
+    # One tick per second over 20 minutes of 2024, and a recent one
+    rows = [
+        (1234, f"2024-02-27T09:{second // 60:02d}:{second % 60:02d}Z", second, 7000, 0.0, "Flat", 0, second, 0)
+        for second in range(1200)
+    ]
+    rows.append((1234, "2099-02-27T09:00:00Z", 1200, 7000, 0.0, "Flat", 0, 1200, 0))
+    assert insert_charging_session_telemetry_batch(rows, db_file)
+
+    progress: list[tuple[int, int]] = []
+    deleted_count, _ = delete_database_cs_telemetry(
+        db_file, batch_size=500, pause_seconds=0, progress_callback=lambda *args: progress.append(args)
+    )
+    assert deleted_count == 1200
+    assert progress == [(500, 1), (1000, 2), (1200, 3)]
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM charging_session_telemetry_tick;").fetchone()[0] == 1
+        assert conn.execute("PRAGMA freelist_count;").fetchone()[0] > 0
+
+    assert incremental_vacuum_database(db_file, pages_per_step=2, pause_seconds=0) > 0
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("PRAGMA freelist_count;").fetchone()[0] == 0
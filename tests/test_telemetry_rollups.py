@@ -0,0 +1,51 @@
+from database.database_check import check_local_database
+from database.query_database import (
+    compact_session_telemetry,
+    delete_telemetry_rollups,
+    get_telemetry_rollups,
+    insert_charging_session_telemetry_batch,
+)
+
+
+def test_telemetry_rollups_are_maintained_incrementally(tmp_path):
+    "Tests that the per-minute and per-hour rollups aggregate each stored tick once"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+
+    # Two ticks per minute, 1 Wh of flat energy and 0.5 € per tick (cumulative values)
+    rows = [
+        (1234, f"2024-02-27T09:0{s // 60}:{s % 60:02d}Z", 10000 + i, 7000 + i, 0.5 * (i + 1), "Flat", 0, i + 1, 0)
+        for i, s in enumerate(range(0, 240, 30))
+    ]
+    assert insert_charging_session_telemetry_batch(rows[:5], db_file)
+    assert insert_charging_session_telemetry_batch(rows[3:], db_file)  # Two duplicated ticks
+
+    minute_rollups = get_telemetry_rollups(1234, "minute", db_file)
+    assert [bucket["sample_count"] for bucket in minute_rollups] == [2, 2, 2, 2]
+    assert [bucket["energy_flat"] for bucket in minute_rollups] == [2, 2, 2, 2]
+    assert minute_rollups[1]["power_min"] == 7002 and minute_rollups[1]["power_avg"] == 7002.5
+
+    hour_rollups = get_telemetry_rollups(1234, "hour", db_file)
+    assert len(hour_rollups) == 1
+    assert hour_rollups[0]["energy_flat"] == 8 and hour_rollups[0]["cost_flat"] == 4.0
+
+    # A late tick of a compacted session only adds its delta from the last packed tick
+    compact_session_telemetry(1234, db_file)
+    late_row = (1234, "2024-02-27T09:04:00Z", 10008, 0, 4.5, "Peak", 0, 8, 1)
+    assert insert_charging_session_telemetry_batch([late_row], db_file)
+    hour_rollups = get_telemetry_rollups(1234, "hour", db_file)
+    assert hour_rollups[0]["energy_peak"] == 1 and hour_rollups[0]["cost_peak"] == 0.5
+
+
+def test_old_rollups_are_deleted_in_chunks(tmp_path):
+    "Tests that the rollups older than the threshold are all deleted, over several bounded chunks"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+
+    # Ticks of 2024, one per minute over 25 minutes, and a recent one
+    rows = [(1234, f"2024-02-27T09:{minute:02d}:00Z", 0, 7000, 0.0, "Flat", 0, minute, 0) for minute in range(25)]
+    rows.append((1234, "2099-02-27T09:00:00Z", 0, 7000, 0.0, "Flat", 0, 25, 0))
+    assert insert_charging_session_telemetry_batch(rows, db_file)
+
+    assert delete_telemetry_rollups("minute", 30, db_file, batch_size=10, pause_seconds=0) == 25
+    assert len(get_telemetry_rollups(1234, "minute", db_file)) == 1
@@ -0,0 +1,52 @@
+import sqlite3
+
+from database.database_check import check_local_database, move_legacy_telemetry, schema_migrations
+from database.query_database import (
+    analyze_cs_telemetry,
+    delete_database_cs_telemetry,
+    estimate_cs_telemetry_count,
+    get_telemetry_for_session,
+)
+from database.schema_migrations import run_migrations
+
+
+def test_legacy_telemetry_is_moved_online(tmp_path):
+    "Tests that the ticks of the legacy table are readable before, during and after the move to the tick table"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    run_migrations(schema_migrations[:8], db_file)  # Before the tick table
+
+    rows = [
+        (1234, f"2024-02-27T09:4{i}:00Z", 10000 + i * 250, 7400 - i, 0.25 * i, band, 250 * i, 0, 0)
+        for i, band in enumerate(["Off-Peak", "Flat", "Peak"])
+    ]
+    with sqlite3.connect(db_file) as conn:
+        conn.executemany("INSERT INTO charging_session_telemetry VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);", rows)
+
+    run_migrations(schema_migrations, db_file)
+    assert get_telemetry_for_session(1234, db_file) == [row[1:] for row in rows]  # Read from the legacy table
+
+    assert move_legacy_telemetry(db_file, batch_size=2, pause_seconds=0) == len(rows)
+    assert get_telemetry_for_session(1234, db_file) == [row[1:] for row in rows]
+    with sqlite3.connect(db_file) as conn:
+        assert (
+            conn.execute("SELECT name FROM sqlite_master WHERE name = 'charging_session_telemetry';").fetchone() is None
+        )
+        assert conn.execute("SELECT band_code FROM charging_session_telemetry_tick;").fetchall() == [(1,), (2,), (3,)]
+
+    assert delete_database_cs_telemetry(db_file, 30, batch_size=2, pause_seconds=0) == (len(rows), 0)
+
+
+def test_tick_count_is_estimated(tmp_path):
+    "Tests that the remaining ticks are estimated from the stats of a sampled ANALYZE, close to the exact count"
+    db_file = str(tmp_path / "telemetry.sqlite3")
+    check_local_database(db_file)
+    assert estimate_cs_telemetry_count(db_file) == 0
+
+    rows = [(transaction_id, epoch_ms, 0, 0, 0.0, 1) for transaction_id in range(50) for epoch_ms in range(2000)]
+    with sqlite3.connect(db_file) as conn:
+        insert_query = "INSERT INTO charging_session_telemetry_tick VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0);"
+        conn.executemany(insert_query, rows)
+
+    assert estimate_cs_telemetry_count(db_file) == 0  # Never analyzed, no sqlite_stat1 table
+    assert analyze_cs_telemetry(db_file, analysis_limit=100)
+    assert 0.5 * len(rows) <= estimate_cs_telemetry_count(db_file) <= 2 * len(rows)